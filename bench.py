@@ -0,0 +1,521 @@
+"""Benchmark für den Webhook-Service ohne Google-API.
+
+Ersetzt get_google_sheet() durch ein lokales FakeWorksheet (get_all_values/get/
+batch_get/update/batch_update) mit einstellbarer Latenz, Fehler- und 429-Rate und
+treibt alle Routen über den Flask-Test-Client oder einen echten gunicorn-Prozess.
+
+Beispiele:
+    python bench.py
+    python bench.py --sizes 1000,50000,200000 --concurrency 1,8,32 --latency-ms 150
+    python bench.py --scenarios check_ticket,poll_ok --gunicorn --workers 2
+    python bench.py --rate-429 0.05 --output bench_output.txt
+    python bench.py --scenarios entry --write-quota 600 --rate-429 0.05
+    python bench.py --scenarios mixed --gunicorn --threads 1 --latency-ms 300   # sync-ähnlich
+    python bench.py --scenarios tradingview,entry --latency-ms 300 --ingest-mode journal
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+from gspread.exceptions import APIError
+from gspread.utils import a1_range_to_grid_range
+
+import main
+
+OPERATIONS = ('get_all_values', 'get', 'batch_get', 'update', 'batch_update')
+SYMBOLS = ('eurusd', 'gbpusd', 'usdjpy', 'xauusd', 'btcusd', 'ethusd', 'solusd')
+
+
+def api_error(status_code, message, retry_after=None):
+    """Baut einen APIError wie von gspread (inkl. echtem requests.Response)."""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps({"error": {"code": status_code, "message": message}}).encode()
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return APIError(response)
+
+
+class FakeWorksheet:
+    """Lokales Worksheet mit der von main.py genutzten gspread-Schnittstelle.
+
+    latency_ms: Grundlatenz pro Call, jitter_ms: zusätzliche Zufallslatenz,
+    error_rate: Anteil der Calls mit 500-Fehler, rate_429: Anteil mit 429 (Quota).
+    Die Call-Zähler liegen in Shared Memory, damit sie auch über gunicorn-Worker
+    (mit --preload) hinweg zählen. Mit path liegen auch die Zeilen in einer SQLite-Datei
+    statt im Prozess-Speicher - sonst schreibt jeder geforkte Worker in seine eigene Kopie.
+    """
+
+    title = 'Bench'
+
+    def __init__(self, rows, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_429=0.0, path=None):
+        self.path = path
+        self._store = None
+        self._store_pid = None
+        if path:
+            self.rows = None
+            main.SQLiteStore(path).import_rows(rows)
+        else:
+            self.rows = [list(row) for row in rows]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self._counts = multiprocessing.Array('q', len(OPERATIONS))
+        self._lock = threading.Lock()
+
+    @property
+    def row_count(self):
+        return max(1000, len(self.shared_store().get_all_values() if self.path else self.rows))
+
+    def shared_store(self):
+        """SQLite-Verbindung pro Prozess - Verbindungen dürfen nicht über fork() geteilt werden."""
+        if self._store_pid != os.getpid():
+            self._store = main.SQLiteStore(self.path)
+            self._store_pid = os.getpid()
+        return self._store
+
+    def call_counts(self):
+        return dict(zip(OPERATIONS, self._counts[:]))
+
+    def reset_counts(self):
+        for idx in range(len(OPERATIONS)):
+            self._counts[idx] = 0
+
+    def _call(self, operation):
+        with self._counts.get_lock():
+            self._counts[OPERATIONS.index(operation)] += 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        roll = random.random()
+        if roll < self.rate_429:
+            raise api_error(429, "Quota exceeded for quota metric 'Read requests'", retry_after=1)
+        if roll < self.rate_429 + self.error_rate:
+            raise api_error(500, "Internal error encountered.")
+
+    def _grid(self, range_name):
+        grid = a1_range_to_grid_range(range_name.split('!')[-1])
+        return (grid.get('startRowIndex', 0), grid.get('endRowIndex', len(self.rows)),
+                grid.get('startColumnIndex', 0), grid.get('endColumnIndex'))
+
+    def _read(self, range_name):
+        start_row, end_row, start_col, end_col = self._grid(range_name)
+        values = [list(row[start_col:end_col]) for row in self.rows[start_row:end_row]]
+        values = [row[:max((i + 1 for i, v in enumerate(row) if v), default=0)] for row in values]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _write(self, range_name, values):
+        start_row, _, start_col, _ = self._grid(range_name)
+        for row_offset, row_values in enumerate(values):
+            row_idx = start_row + row_offset
+            while len(self.rows) <= row_idx:
+                self.rows.append([])
+            row = self.rows[row_idx]
+            for col_offset, value in enumerate(row_values):
+                col_idx = start_col + col_offset
+                if len(row) <= col_idx:
+                    row.extend([''] * (col_idx + 1 - len(row)))
+                row[col_idx] = str(value)
+
+    def get_all_values(self, **kwargs):
+        self._call('get_all_values')
+        if self.path:
+            return self.shared_store().get_all_values()
+        with self._lock:
+            rows = list(self.rows)
+        while rows and not any(rows[-1]):
+            rows.pop()
+        width = max((len(row) for row in rows), default=0)
+        return [row + [''] * (width - len(row)) for row in rows]
+
+    def get(self, range_name=None, **kwargs):
+        self._call('get')
+        if self.path:
+            return self.shared_store().batch_get([range_name])[0]
+        with self._lock:
+            return self._read(range_name)
+
+    def batch_get(self, ranges, **kwargs):
+        self._call('batch_get')
+        if self.path:
+            return self.shared_store().batch_get(ranges)
+        with self._lock:
+            return [self._read(range_name) for range_name in ranges]
+
+    def update(self, range_name, values=None, **kwargs):
+        self._call('update')
+        if self.path:
+            return self.shared_store().batch_update([{'range': range_name, 'values': values}])
+        with self._lock:
+            self._write(range_name, values)
+
+    def batch_update(self, data, **kwargs):
+        self._call('batch_update')
+        if self.path:
+            return self.shared_store().batch_update(data)
+        with self._lock:
+            for value_range in data:
+                self._write(value_range['range'], value_range['values'])
+
+
+def generate_rows(size, seed=42):
+    """Erzeugt ein Sheet mit Kopfzeile und size-1 historischen Trades (am Ende offene/OK-Zeilen)."""
+    rng = random.Random(seed)
+    header = ['Zeit', 'Ticket', '', 'Symbol', 'Side', 'Entry', 'TP', 'SL'] + [''] * 5 + \
+        ['Exit-Zeit', '', 'Exit-Preis'] + [''] * 5 + ['Lots', 'Balance W', 'Balance X', 'Status', 'Profit']
+    rows = [header]
+    balance = 10000.0
+    for idx in range(1, size):
+        symbol = rng.choice(SYMBOLS)
+        remaining = size - idx
+        status = 'CLOSED'
+        if remaining <= 20:
+            status = 'OK' if remaining % 4 == 0 else 'PENDING'
+        elif remaining <= size // 50 + 20:
+            status = 'EXECUTED'
+        profit = round(rng.uniform(-50, 60), 2)
+        balance += profit if status == 'CLOSED' else 0
+        row = [''] * 26
+        row[0] = f'2026.01.01 {idx % 24:02d}:{idx % 60:02d}:00'
+        row[1] = str(100000 + idx)
+        row[3] = symbol
+        row[4] = rng.choice('BS')
+        row[5:8] = ['1,1', '1,2', '1,0']
+        if status == 'CLOSED':
+            row[13] = row[0]
+            row[15] = '1,15'
+            row[25] = main.format_decimal(profit)
+        row[21] = '0,1'
+        row[22 if main.balance_column_for_symbol(symbol) == 'W' else 23] = main.format_decimal(round(balance, 2))
+        row[24] = status
+        rows.append(row)
+    return rows
+
+
+class Scenario:
+    """Erzeugt Requests für eine Route auf Basis des generierten Sheets."""
+
+    def __init__(self, rows):
+        self.tickets = [row[1] for row in rows[1:]]
+        self.ok_rows = [idx + 1 for idx, row in enumerate(rows) if row[24] == 'OK']
+        self.executed_rows = [idx + 1 for idx, row in enumerate(rows) if row[24] == 'EXECUTED']
+        self.counter = itertools.count()
+        self.run_id = f'{os.getpid()}{int(time.time())}'
+
+    def unique_ticket(self):
+        return f'B{self.run_id}{next(self.counter)}'
+
+    def check_ticket(self):
+        return 'GET', f'/?action=check_ticket&ticket={random.choice(self.tickets)}', None
+
+    def get_last_executed(self):
+        return 'GET', f'/?action=get_last_executed&symbol={random.choice(SYMBOLS)}', None
+
+    def poll_ok(self):
+        return 'GET', f'/?broker={random.choice(("forex", "crypto"))}', None
+
+    def stats(self):
+        """Dashboard-Abfrage: gesamt oder je Symbol, mit und ohne Zeitfenster."""
+        return 'GET', random.choice(('/stats', f'/stats?symbol={random.choice(SYMBOLS)}', '/stats?days=30')), None
+
+    def tradingview(self):
+        return 'POST', '/tradingview', {
+            'symbol': random.choice(SYMBOLS).upper(), 'side': random.choice('BS'),
+            'entry': '1.1', 'tp': '1.2', 'sl': '1.0'}
+
+    def entry(self):
+        return 'POST', '/', {
+            'ticket': self.unique_ticket(), 'symbol': random.choice(SYMBOLS), 'side': 'b',
+            'entry_price': '1.1', 'tp': '1.2', 'sl': '1.0', 'lots': '0.1', 'balance': '10000'}
+
+    def mark_executed(self):
+        return 'POST', '/', {
+            'action': 'mark_executed', 'row': random.choice(self.ok_rows or self.executed_rows),
+            'ticket': self.unique_ticket()}
+
+    def add_manual_trade(self):
+        return 'POST', '/', {
+            'action': 'add_manual_trade', 'ticket': self.unique_ticket(), 'symbol': random.choice(SYMBOLS),
+            'side': 'b', 'price': '1.1', 'volume': '0.1'}
+
+    def update_trade_result(self):
+        return 'POST', '/', {
+            'action': 'update_trade_result', 'row': random.choice(self.executed_rows),
+            'exitReason': 'CLOSED', 'exitTime': '2026.01.02 10:00:00', 'balance': '10010'}
+
+    def put(self):
+        return 'PUT', '/', {
+            'ticket': random.choice(self.tickets), 'exit_time': '2026.01.02 10:00:00',
+            'exit_price': '1.15', 'profit': '12.5', 'balance': '10012.5'}
+
+    def bulk(self):
+        """Nachholen nach einem EA-Reconnect: BULK_SIZE Entries und Closes in einem Request."""
+        operations = []
+        for _ in range(BULK_SIZE // 2):
+            ticket = self.unique_ticket()
+            operations.append(dict(self.entry()[2], ticket=ticket))
+            operations.append(dict(self.put()[2], action='close', ticket=ticket))
+        return 'POST', '/bulk', {'operations': operations}
+
+    def mixed(self):
+        """EA-Polls und check_ticket zwischen Sheets-Schreibzugriffen (1 von MIXED_WRITE_EVERY ist ein Write)."""
+        if next(self.counter) % MIXED_WRITE_EVERY == 0:
+            return self.tradingview()
+        return random.choice((self.check_ticket, self.poll_ok))()
+
+
+SCENARIOS = ('check_ticket', 'get_last_executed', 'poll_ok', 'stats', 'tradingview', 'entry',
+             'mark_executed', 'add_manual_trade', 'update_trade_result', 'put', 'bulk', 'mixed')
+BULK_SIZE = 50  # Operationen pro /bulk-Request
+MIXED_WRITE_EVERY = 5  # Szenario 'mixed': jeder fünfte Request schreibt ins Sheet
+
+
+def reset_app_state():
+    """Setzt die Caches von main.py zurück, damit jeder Lauf mit einem kalten Cache beginnt."""
+    with main.cache_lock:
+        main.sheet_cache.update({
+            "data": None, "timestamp": 0, "last_refresh_attempt": 0, "failures": 0,
+            "retry_at": 0, "full_reload_at": 0,
+            "indexes": None, "local_writes": []})
+    with main.allocator_lock:
+        main.allocator_state["reserved"] = {}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def drive(send, make_request, requests_total, concurrency):
+    """Schickt requests_total Requests mit concurrency Threads; gibt Latenzen und Statuscodes zurück."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def worker():
+        local_send = send()
+        while next(remaining) < requests_total:
+            method, path, payload = make_request()
+            started = time.perf_counter()
+            status = local_send(method, path, payload)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - started
+
+
+def request_headers():
+    """Eindeutiger Idempotency-Key: zufällig gleiche Payloads sollen gemessen, nicht wiederholt werden."""
+    return {'Idempotency-Key': uuid.uuid4().hex}
+
+
+def flask_sender():
+    client = main.app.test_client()
+
+    def send(method, path, payload):
+        return client.open(path, method=method, json=payload, headers=request_headers()).status_code
+    return send
+
+
+def http_sender(port):
+    def factory():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+        def send(method, path, payload):
+            body = json.dumps(payload) if payload is not None else None
+            headers = dict(request_headers(), **({'Content-Type': 'application/json'} if body else {}))
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        return send
+    return factory
+
+
+def install_fake(fake, read_quota=0, write_quota=0):
+    """Hängt das FakeWorksheet wie in Produktion hinter den Quota-Client (Quota 0 = unbegrenzt)."""
+    main.STORAGE_BACKEND = 'sheets'
+    main.sheets_read_bucket = main.TokenBucket('read', read_quota, main.SHEETS_QUOTA_BURST)
+    main.sheets_write_bucket = main.TokenBucket('write', write_quota, main.SHEETS_QUOTA_BURST)
+    sheet = main.QuotaAwareWorksheet(fake)
+    main.get_google_sheet = lambda: sheet
+
+
+def create_app(size=1000, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_429=0.0,
+               read_quota=0, write_quota=0, sheet_path=None):
+    """App-Factory für gunicorn: 'bench:create_app(size=50000, latency_ms=150)'.
+
+    sheet_path: SQLite-Datei für die Zeilen, damit mehrere Worker dasselbe Fake-Sheet sehen.
+    """
+    fake = FakeWorksheet(generate_rows(size), latency_ms, jitter_ms, error_rate, rate_429, sheet_path)
+    install_fake(fake, read_quota, write_quota)
+
+    @main.app.route('/__bench__/calls', methods=['GET', 'DELETE'])
+    def bench_calls():
+        if main.request.method == 'DELETE':
+            fake.reset_counts()
+        return main.jsonify(fake.call_counts())
+
+    return main.app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(args, size):
+    port = free_port()
+    sheet_path = None
+    if args.workers > 1:
+        sheet_path = os.path.join(tempfile.mkdtemp(prefix='bench-sheet-'), f'sheet-{size}.db')
+    factory = (f"bench:create_app(size={size}, latency_ms={args.latency_ms}, jitter_ms={args.jitter_ms}, "
+               f"error_rate={args.error_rate}, rate_429={args.rate_429}, "
+               f"read_quota={args.read_quota}, write_quota={args.write_quota}, sheet_path={sheet_path!r})")
+    env = dict(os.environ, LOG_LEVEL='WARNING', GUNICORN_THREADS=str(args.threads),
+               INGEST_MODE=args.ingest_mode, JOURNAL_PATH=args.journal_path)
+    command = [sys.executable, '-m', 'gunicorn', '--preload', '-w', str(args.workers),
+               '--threads', str(args.threads), '-b', f'127.0.0.1:{port}', '--log-level', 'warning', factory]
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/__bench__/calls')
+            connection.getresponse().read()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("gunicorn ist nicht gestartet")
+
+
+def http_calls(port, method='GET'):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    connection.request(method, '/__bench__/calls')
+    return json.loads(connection.getresponse().read())
+
+
+def run(args):
+    results = []
+    main.logger.setLevel(logging.WARNING)  # Request-Logs würden die Messung verfälschen
+    args.journal_path = os.path.join(tempfile.mkdtemp(prefix='bench-journal-'), 'ingest.journal')
+    main.INGEST_MODE, main.JOURNAL_PATH = args.ingest_mode, args.journal_path
+    for size in args.sizes:
+        rows = generate_rows(size)
+        scenario = Scenario(rows)
+        process = None
+        if args.gunicorn:
+            process, port = start_gunicorn(args, size)
+            sender = http_sender(port)
+        else:
+            fake = FakeWorksheet(rows, args.latency_ms, args.jitter_ms, args.error_rate, args.rate_429)
+            install_fake(fake, args.read_quota, args.write_quota)
+            sender = flask_sender
+        try:
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    if not args.gunicorn:
+                        reset_app_state()
+                    # Aufwärmen (Kaltstart-Download zählt nicht zur Messung)
+                    sender()(*scenario.check_ticket())
+                    if args.gunicorn:
+                        http_calls(port, 'DELETE')
+                    else:
+                        fake.reset_counts()
+                    latencies, statuses, elapsed = drive(
+                        sender, getattr(scenario, name), args.requests, concurrency)
+                    calls = http_calls(port) if args.gunicorn else fake.call_counts()
+                    results.append({
+                        "scenario": name,
+                        "rows": size,
+                        "concurrency": concurrency,
+                        "requests": len(latencies),
+                        "req_per_s": len(latencies) / elapsed if elapsed else 0.0,
+                        "p50_ms": percentile(latencies, 50) * 1000,
+                        "p99_ms": percentile(latencies, 99) * 1000,
+                        "sheets_calls_per_request": sum(calls.values()) / max(len(latencies), 1),
+                        "calls": calls,
+                        "statuses": statuses,
+                    })
+                    print_result(results[-1])
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+    return results
+
+
+def print_result(result):
+    statuses = ' '.join(f'{code}:{count}' for code, count in sorted(result["statuses"].items()))
+    print(f'{result["scenario"]:<20} {result["rows"]:>7} {result["concurrency"]:>4} '
+          f'{result["req_per_s"]:>10.1f} {result["p50_ms"]:>9.2f} {result["p99_ms"]:>9.2f} '
+          f'{result["sheets_calls_per_request"]:>8.3f}  {statuses}', flush=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark des Webhook-Services mit Fake-Worksheet")
+    parser.add_argument('--sizes', default='1000,10000,50000,200000',
+                        type=lambda v: [int(x) for x in v.split(',')], help="Sheet-Größen (Zeilen)")
+    parser.add_argument('--concurrency', default='1,8',
+                        type=lambda v: [int(x) for x in v.split(',')], help="Parallele Clients")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        type=lambda v: v.split(','), help="Routen: " + ','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help="Requests pro Messung")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Latenz pro Sheets-Call")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Zufällige Zusatzlatenz")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Anteil 500-Fehler")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Anteil 429-Antworten")
+    parser.add_argument('--read-quota', type=int, default=0, help="Lese-Quota pro Minute (0 = unbegrenzt)")
+    parser.add_argument('--write-quota', type=int, default=0, help="Schreib-Quota pro Minute (0 = unbegrenzt)")
+    parser.add_argument('--ingest-mode', choices=('sync', 'journal'), default='sync',
+                        help="journal = 202 nach dem Journal-Eintrag, Sheets-Write im Hintergrund")
+    parser.add_argument('--gunicorn', action='store_true', help="Echten gunicorn-Prozess benchmarken")
+    parser.add_argument('--workers', type=int, default=1, help="gunicorn-Worker (mit --gunicorn)")
+    parser.add_argument('--threads', type=int, default=16,
+                        help="Threads pro gunicorn-Worker (mit --gunicorn, 1 = wie sync-Worker)")
+    parser.add_argument('--output', help="Ergebnisse zusätzlich als JSON speichern")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unbekannte Szenarien: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    print(f'{"scenario":<20} {"rows":>7} {"conc":>4} {"req/s":>10} {"p50 ms":>9} {"p99 ms":>9} '
+          f'{"calls/req":>8}  status')
+    bench_results = run(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as f:
+            json.dump(bench_results, f, indent=2)
@@ -0,0 +1,51 @@
+# gunicorn-Konfiguration (wird aus dem Arbeitsverzeichnis automatisch geladen)
+import os
+import shutil
+import sys
+import tempfile
+
+# Threaded Worker: ein langsamer Sheets-Call blockiert nur seinen Thread, nicht den ganzen Worker.
+# Cache-Lesezugriffe (check_ticket, OK-Poll) laufen parallel weiter; Long-Polls halten keinen
+# Worker mehr über das timeout hinaus fest, weil der Heartbeat im Haupt-Thread läuft.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))  # main.SERVER_THREADS liest dieselbe Variable
+
+_created_shared_dir = []  # Von on_starting angelegtes SHARED_CACHE_DIR, wird in on_exit wieder gelöscht
+
+
+def on_starting(server):
+    """Im Master vor dem ersten Fork: mehrere Worker brauchen ein gemeinsames SHARED_CACHE_DIR.
+
+    Ohne teilen sich die Worker weder Zeilen-Reservierungen noch den Ticket-Zähler - zwei Worker
+    könnten dieselbe Zeile oder dasselbe TV_-Ticket vergeben. Ist keins gesetzt, wird eines angelegt.
+    """
+    os.environ['GUNICORN_WORKERS'] = str(server.cfg.workers)  # main.server_worker_count()
+    if server.cfg.workers <= 1 or os.environ.get('SHARED_CACHE_DIR'):
+        return
+    shared_dir = tempfile.mkdtemp(prefix='mt5-webhook-')
+    _created_shared_dir.append(shared_dir)
+    os.environ['SHARED_CACHE_DIR'] = shared_dir
+    if 'main' in sys.modules:  # --preload: main ist im Master schon importiert
+        sys.modules['main'].SHARED_CACHE_DIR = shared_dir
+    server.log.warning(f"{server.cfg.workers} Worker ohne SHARED_CACHE_DIR - verwende {shared_dir}")
+
+
+def child_exit(server, worker):
+    """Gauges eines beendeten Workers verwerfen (livesum/livemax zählen sonst tote Prozesse mit)."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    for shared_dir in _created_shared_dir:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+def post_worker_init(worker):
+    """Nach dem Fork, bevor der Worker Requests annimmt: Sheet öffnen und Cache füllen.
+
+    Nicht per preload_app im Master - die Google-Verbindung darf nicht über fork() geteilt werden.
+    """
+    from main import start_warm_up
+    start_warm_up()
@@ -1,20 +1,318 @@
+import atexit
+import fcntl
+import functools
+import hashlib
+import heapq
+import itertools
 import json
+import logging
+import logging.handlers
 import os
+import queue
+import random
+import sqlite3
+import sys
+import threading
 import time
-from datetime import datetime
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import datetime, timedelta
 
 import gspread
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol, rowcol_to_a1
+from oauth2client.client import AccessTokenRefreshError
 from oauth2client.service_account import ServiceAccountCredentials
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from requests.adapters import HTTPAdapter
 
 app = Flask(__name__)
 
+# Logging: Request-Threads legen Records nur in eine Queue, geschrieben wird in einem eigenen Thread
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()  # 'text' oder 'json'
+logger = logging.getLogger('mt5-webhook')
+log_state = {"queue": queue.SimpleQueue(), "listener": None}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Eine JSON-Zeile pro Log-Eintrag (für Log-Aggregatoren)."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def start_log_listener():
+    """Startet den Log-Writer-Thread (auch neu im Kindprozess nach dem gunicorn-Fork)."""
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(message)s'))
+    log_state["listener"] = logging.handlers.QueueListener(log_state["queue"], handler)
+    log_state["listener"].start()
+
+
+def stop_log_listener():
+    if log_state["listener"] is not None:
+        log_state["listener"].stop()
+
+
+logger.addHandler(logging.handlers.QueueHandler(log_state["queue"]))
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+start_log_listener()
+os.register_at_fork(after_in_child=start_log_listener)
+atexit.register(stop_log_listener)
+
+# Prometheus-Metriken (mit PROMETHEUS_MULTIPROC_DIR über alle gunicorn-Worker aggregiert)
+REQUEST_LATENCY = Histogram(
+    'webhook_request_duration_seconds', 'Antwortzeit pro Route',
+    ['route', 'method', 'action', 'status'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+SHEETS_CALLS = Counter(
+    'sheets_api_calls_total', 'Aufrufe des Speichers (Google Sheets / SQLite) nach Operation',
+    ['backend', 'operation', 'outcome'])
+SHEETS_CALL_DURATION = Histogram(
+    'sheets_api_call_duration_seconds', 'Dauer der Speicher-Aufrufe nach Operation',
+    ['backend', 'operation'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30))
+CACHE_LOOKUPS = Counter(
+    'sheet_cache_lookups_total', 'Cache-Zugriffe: hit (frisch), stale (veraltet ausgeliefert), miss (Kaltstart)',
+    ['result'])
+CACHE_AGE = Gauge('sheet_cache_age_seconds', 'Alter des Cache-Snapshots', multiprocess_mode='livemax')
+CACHE_ROWS = Gauge('sheet_cache_rows', 'Zeilen im Cache', multiprocess_mode='livemax')
+CACHE_REFRESH_DURATION = Histogram(
+    'sheet_cache_refresh_duration_seconds', 'Dauer eines Cache-Refreshs (inkl. Index-Aufbau)', ['kind'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+CACHE_REFRESH_FAILURES = Counter('sheet_cache_refresh_failures_total', 'Fehlgeschlagene Cache-Refreshs')
+SCAN_DURATION = Histogram(
+    'sheet_cache_scan_duration_seconds', 'Dauer von Cache-Suchen und Index-Aufbau', ['operation'],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+SHEETS_RETRIES = Counter(
+    'sheets_api_retries_total', 'Wiederholte Google-Sheets-Aufrufe nach Grund (429, 5xx, auth)',
+    ['operation', 'reason'])
+SHEETS_QUOTA_WAIT = Histogram(
+    'sheets_quota_wait_seconds', 'Wartezeit auf ein Token des Quota-Limiters', ['kind'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+IDEMPOTENT_REPLAYS = Counter(
+    'webhook_idempotent_replays_total', 'Wiederholte Webhooks, die aus dem Idempotenz-Cache beantwortet wurden',
+    ['route', 'outcome'])
+WORKER_READY = Gauge('webhook_worker_ready', 'Aufgewärmte Worker (Sheet geöffnet, Cache gefüllt)',
+                     multiprocess_mode='livesum')
+JOURNAL_BACKLOG = Gauge('ingest_journal_backlog', 'Angenommene, noch nicht ins Sheet geschriebene Webhooks',
+                        multiprocess_mode='livemax')
+JOURNAL_APPLY_LAG = Histogram(
+    'ingest_journal_apply_lag_seconds', 'Zeit von der 202-Antwort bis zum Schreiben ins Sheet',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 900))
+ARCHIVED_ROWS = Counter('sheet_archived_rows_total', 'Ins Archiv verschobene Zeilen des Live-Blatts')
+METRIC_ACTIONS = ('check_ticket', 'get_last_executed', 'mark_executed', 'add_manual_trade',
+                  'update_trade_result')
+
+
+@contextmanager
+def sheets_call(backend, operation):
+    """Zählt und misst einen Aufruf an Google Sheets bzw. den Speicher."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        SHEETS_CALLS.labels(backend, operation, outcome).inc()
+        SHEETS_CALL_DURATION.labels(backend, operation).observe(time.perf_counter() - started)
+
+
+def timed_scan(operation):
+    """Decorator: misst Cache-Suchen (reserve_rows, Index-Lookups, ...)."""
+    def decorator(func):
+        histogram = SCAN_DURATION.labels(operation)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
 # Cache, um Google-Sheets-Reads zu reduzieren
-sheet_cache = {"data": None, "timestamp": 0, "lock": False, "last_refresh_attempt": 0}
+sheet_cache = {"data": None, "timestamp": 0, "last_refresh_attempt": 0, "failures": 0,
+               "retry_at": 0, "full_reload_at": 0,
+               "indexes": None, "local_writes": []}
 CACHE_DURATION = 60  # Cache für 60 Sekunden halten
 MIN_REFRESH_INTERVAL = 10  # Mindestens 10 Sekunden zwischen Refresh-Versuchen
+REFRESH_AHEAD_RATIO = 0.8  # Hintergrund-Refresh nach 80% von CACHE_DURATION
+MAX_REFRESH_BACKOFF = 300  # Maximaler Backoff nach fehlgeschlagenen Refreshes
+COLD_START_TIMEOUT = 30  # Maximale Wartezeit auf den allerersten Snapshot
+INCREMENTAL_SYNC = os.environ.get('INCREMENTAL_SYNC', '1') == '1'  # Nur Tail + offene Zeilen laden
+SYNC_TAIL_ROWS = 500  # So viele letzte Zeilen werden bei jedem inkrementellen Refresh neu gelesen
+FULL_RELOAD_INTERVAL = 900  # Kompletter get_all_values() nur alle 15 Minuten
+OPEN_STATUSES = ('PENDING', 'OK', 'EXECUTED')  # Zeilen mit diesem Status können sich noch ändern
+BALANCE_COLUMNS = ('W', 'X')  # Balance-Spalten (Crypto/USD bzw. übrige Symbole)
+cache_lock = threading.RLock()  # Schützt Daten + Indizes (nie während API-Calls gehalten)
+refresh_lock = threading.Lock()  # Genau ein get_all_values() gleichzeitig
+refresh_done = threading.Condition()  # Weckt Threads, die auf den ersten Snapshot warten
+refresh_wakeup = threading.Event()  # Weckt den Hintergrund-Refresher vorzeitig
+cache_refresher_thread = None
+
+# Threaded-Modus (gunicorn gthread, siehe gunicorn.conf.py): Sheets-Calls blockieren nur einen
+# Thread; Cache-Lesezugriffe laufen parallel weiter und warten nie auf einen API-Call
+SERVER_THREADS = int(os.environ.get('GUNICORN_THREADS', '16'))  # Threads pro Worker
+# Long-Polls/SSE-Streams belegen je einen Thread - der Rest bleibt für Webhooks frei
+MAX_BLOCKING_WAITERS = max(1, SERVER_THREADS // 2)
+
+# Warm-up: jeder Worker autorisiert, öffnet das Sheet und füllt den Cache, bevor er Traffic annimmt
+WARMUP_TIMEOUT = float(os.environ.get('WARMUP_TIMEOUT', '20'))  # Unter dem gunicorn-Timeout (30s) bleiben
+startup_state = {"warm_up_seconds": None, "error": None}
+
+# Long-Poll / Server-Sent Events: EAs warten auf den nächsten 'OK'-Trade statt zu pollen
+LONG_POLL_MAX_WAIT = 55  # Obergrenze für ?wait= (unter typischen Proxy-Timeouts)
+SSE_KEEPALIVE_INTERVAL = 15  # Kommentarzeile, damit Proxies die Verbindung offen halten
+signal_condition = threading.Condition(cache_lock)  # Wird bei jeder Index-Änderung benachrichtigt
+signal_state = {"waiters": 0}
+
+# Geteilter Cache für mehrere gunicorn-Worker: ein gewählter Worker lädt das Sheet und
+# veröffentlicht den Snapshot als Datei, alle anderen lesen nur diese Datei.
+SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR', '')  # leer = jeder Worker lädt selbst
+SHARED_POLL_INTERVAL = 1  # Sekunden zwischen Prüfungen auf einen neuen Snapshot
+shared_state = {"leader_fd": None, "snapshot_mtime": 0, "log_inode": None, "log_offset": 0}
+shared_log_lock = threading.Lock()
+
+# Zeilen-Allocator: parallele Webhooks reservieren Zeilen, statt dieselbe freie Zeile zu finden
+ROW_RESERVATION_TTL = 600  # Sekunden; Notbremse, falls ein Prozess vor dem Freigeben abstürzt (Quota-Wartezeit + 5 Retries à 32 s passen sicher hinein)
+allocator_lock = threading.Lock()  # Mit SHARED_CACHE_DIR zusätzlich flock() auf allocator.lock
+allocator_state = {"reserved": {}, "last_ticket_ms": 0}
 sheet_client_cache = None  # Cache für Sheet-Client
 sheet_object_cache = None  # Cache für Sheet-Objekt selbst
+sheet_open_lock = threading.Lock()  # Genau ein Thread autorisiert/öffnet das Sheet
+
+# Google-Sheets-Quota: Aufrufe werden auf das Minutenlimit verteilt statt in 429-Fehler zu laufen
+SHEETS_READ_QUOTA = int(os.environ.get('SHEETS_READ_QUOTA', '60'))  # Lese-Requests pro Minute für alle Worker zusammen (0 = unbegrenzt)
+SHEETS_WRITE_QUOTA = int(os.environ.get('SHEETS_WRITE_QUOTA', '60'))  # Schreib-Requests pro Minute
+SHEETS_QUOTA_BURST = int(os.environ.get('SHEETS_QUOTA_BURST', '10'))  # So viele Aufrufe dürfen sofort hintereinander
+SHEETS_MAX_RETRIES = 5  # Wiederholungen bei 429/5xx, danach geht der Fehler an den Aufrufer
+SHEETS_MAX_BACKOFF = 32  # Sekunden
+SHEETS_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Schreib-Prioritäten (kleiner = wichtiger): Ausführungen vor neuen Signalen vor Buchhaltung
+WRITE_PRIORITY_CRITICAL = 0  # mark_executed (OK → EXECUTED)
+WRITE_PRIORITY_SIGNAL = 1  # neue Trades/Signale
+WRITE_PRIORITY_BOOKKEEPING = 2  # Balances, Ergebnisse, Closes
+
+# POST /bulk: mehrere Operationen mit einem einzigen Schreibzugriff
+BULK_MAX_OPERATIONS = 1000  # Obergrenze pro Request (ein batch_update, eine Reservierung)
+BULK_ACTIONS = {  # Aktion → Schreib-Priorität
+    'entry': WRITE_PRIORITY_SIGNAL,
+    'add_manual_trade': WRITE_PRIORITY_SIGNAL,
+    'mark_executed': WRITE_PRIORITY_CRITICAL,
+    'update_trade_result': WRITE_PRIORITY_BOOKKEEPING,
+    'close': WRITE_PRIORITY_BOOKKEEPING,
+}
+
+# Idempotenz: Wiederholungen (Timeouts bei TradingView/EA) bekommen die gespeicherte Antwort,
+# ohne Sheets-I/O. Schlüssel: Idempotency-Key-Header oder Hash aus Methode, Pfad und Payload.
+IDEMPOTENCY_TTL = 600  # Sekunden, die eine Antwort für einen Idempotency-Key gespeichert bleibt
+IDEMPOTENCY_HASH_TTL = 60  # Kürzer für Payload-Hashes: identische Alerts später sind echte neue Signale
+IDEMPOTENCY_MAX_ENTRIES = 10000  # LRU-Obergrenze pro Prozess
+IDEMPOTENCY_WAIT = 30  # So lange wartet eine Wiederholung auf die noch laufende erste Verarbeitung (danach 409)
+IDEMPOTENCY_PENDING_TTL = ROW_RESERVATION_TTL  # Geteilte 'in Arbeit'-Markierung: länger als jede Verarbeitung inkl. Quota und Retries
+idempotency_cache = OrderedDict()  # Schlüssel → gespeicherte Antwort oder {"event": ...} während der Verarbeitung
+idempotency_lock = threading.Lock()
+idempotency_state = {"pruned_at": 0}
+
+# Journal-Modus (INGEST_MODE=journal): /tradingview und Entries werden nur geprüft, ins lokale
+# Journal geschrieben und sofort mit 202 bestätigt; ein Hintergrund-Thread schreibt sie in
+# Reihenfolge ins Sheet und setzt nach einem Neustart an der gespeicherten Position fort.
+INGEST_MODE = os.environ.get('INGEST_MODE', 'sync').lower()  # 'sync' oder 'journal'
+JOURNAL_PATH = os.environ.get('JOURNAL_PATH', 'ingest.journal')  # + .offset / .lock / .applier
+JOURNAL_FSYNC = os.environ.get('JOURNAL_FSYNC', '1') == '1'  # Vor der 202-Antwort auf die Platte
+JOURNAL_BATCH_SIZE = 50  # So viele Journal-Einträge pro batch_update
+JOURNAL_POLL_INTERVAL = 1  # Sekunden: Journal anderer Worker prüfen / Applier-Rolle übernehmen
+JOURNAL_PENDING_TTL = 600  # So lange gelten angenommene Tickets für die Duplikat-Prüfung als offen
+ROW_ACTIONS = ('mark_executed', 'add_manual_trade', 'update_trade_result')  # POST-Actions mit Sheet-Zugriff, nie ins Journal
+journal_state = {"applier_fd": None, "pending": OrderedDict()}  # pending: Ticket → Annahmezeit
+journal_lock = threading.Lock()
+journal_wakeup = threading.Event()  # Weckt den Applier nach einem eigenen Eintrag sofort
+journal_applier_thread = None
+
+# Archivierung: abgeschlossene Trades wandern in Monats-Blätter, das Live-Blatt bleibt klein.
+# Es wird nur ein zusammenhängender Block ab Zeile 2 verschoben; die Zeilennummern der API bleiben
+# stabil (logische Zeile = Zeile im Live-Blatt + bereits archivierte Zeilen, archive_state["offset"]).
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', '0'))  # 0 = Archivierung aus
+ARCHIVE_INTERVAL = 3600  # Sekunden zwischen Archivierungs-Läufen
+ARCHIVE_MAX_ROWS = 2000  # Höchstens so viele Zeilen pro Lauf (ein atomarer batchUpdate)
+ARCHIVE_SHEET_PREFIX = 'Archiv '  # + Monat, z.B. 'Archiv 2026-01'
+ARCHIVE_INDEX_SHEET = 'Archiv-Index'  # Ticket → Archiv-Blatt/Zeile, Offset in ARCHIVE_OFFSET_CELL
+ARCHIVE_OFFSET_CELL = 'G1'
+ARCHIVE_TIME_FORMATS = ('%Y.%m.%d %H:%M:%S', '%Y.%m.%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y.%m.%d')
+archive_state = {"offset": 0, "tickets": {}, "index_rows": 0, "loaded": False, "next_run": 0,
+                 "index_mtime": 0}
+
+
+class ReadWriteGate:
+    """Beliebig viele Teilnehmer gleichzeitig (shared) oder einer exklusiv; wartende exklusive haben Vorrang.
+
+    Schreib-Requests halten den Gate shared, die Archivierung (verschiebt Zeilennummern) exklusiv.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.shared_holders = 0
+        self.exclusive_held = False
+        self.exclusive_waiting = 0
+
+    @contextmanager
+    def shared(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.exclusive_held and not self.exclusive_waiting)
+            self.shared_holders += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.shared_holders -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self.condition:
+            self.exclusive_waiting += 1
+            try:
+                self.condition.wait_for(lambda: not self.exclusive_held and not self.shared_holders)
+            finally:
+                self.exclusive_waiting -= 1
+            self.exclusive_held = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.exclusive_held = False
+                self.condition.notify_all()
+
+
+archive_gate = ReadWriteGate()
+
+# Speicher-Backend: 'sheets' (direkt Google Sheets), 'sqlite' (lokale Datenbank als
+# System of Record, asynchron nach Google Sheets gespiegelt) oder 'memory' (Tests)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sheets').lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'trades.db')
+MIRROR_BATCH_SIZE = 50  # Maximal so viele Schreibzugriffe pro batch_update an Google
+MIRROR_PULL_INTERVAL = 15  # Sekunden zwischen Abgleichen manueller Status-Änderungen im Sheet
+store_cache = None  # Primärer Speicher (Worksheet-kompatibel)
+store_lock = threading.Lock()
+sheet_mirror_thread = None
 
 
 def format_decimal(value):
@@ -46,46 +344,535 @@ def parse_decimal(value):
         return 0.0
 
 
+class TokenBucket:
+    """Token-Bucket für ein Minuten-Quota; wartende Aufrufer werden nach Priorität bedient.
+
+    Nur der wichtigste Wartende (kleinste Priorität, bei Gleichstand der älteste) darf ein
+    Token nehmen. pause() sperrt den Bucket nach einem 429 für alle Aufrufer.
+    Das Quota gilt pro Projekt, nicht pro Prozess: mit SHARED_CACHE_DIR teilen sich alle
+    Worker den Bucket (flock() auf quota-<name>.json), sonst bekommt jeder Worker seinen Anteil.
+    """
+
+    def __init__(self, name, per_minute, burst):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, min(burst, per_minute))
+        self.state = {"tokens": self.capacity, "updated": time.time(), "paused_until": 0.0}
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def acquire(self, priority=WRITE_PRIORITY_SIGNAL):
+        """Blockiert, bis ein Token frei ist; gibt die Wartezeit in Sekunden zurück."""
+        if self.rate <= 0:
+            return 0.0  # Quota 0 = unbegrenzt
+        started = time.monotonic()
+        with self.condition:
+            entry = (priority, next(self.sequence))
+            heapq.heappush(self.waiters, entry)
+            try:
+                while True:
+                    if self.waiters[0] != entry:
+                        self.condition.wait()
+                        continue
+                    delay = self.take_token()
+                    if delay <= 0:
+                        return time.monotonic() - started
+                    self.condition.wait(delay)  # Andere Worker wecken uns nicht - nach delay erneut versuchen
+            finally:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+    def take_token(self):
+        """Nimmt ein Token (Rückgabe 0) oder gibt die Sekunden bis zum nächsten freien Token zurück."""
+        with self.state_locked() as state:
+            rate = self.rate if SHARED_CACHE_DIR else self.rate / server_worker_count()
+            now = time.time()
+            state["tokens"] = min(self.capacity, state["tokens"] + (now - state["updated"]) * rate)
+            state["updated"] = now
+            if now >= state["paused_until"] and state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0.0
+            return max(state["paused_until"] - now, (1 - state["tokens"]) / rate)
+
+    def pause(self, seconds):
+        with self.condition, self.state_locked() as state:
+            state["paused_until"] = max(state["paused_until"], time.time() + seconds)
+            state["tokens"] = 0
+
+    @contextmanager
+    def state_locked(self):
+        """Bucket-Zustand - mit SHARED_CACHE_DIR prozessübergreifend per flock(), sonst self.state."""
+        if not SHARED_CACHE_DIR:
+            yield self.state
+            return
+        path = shared_path(f'quota-{self.name}.json')
+        with open(f'{path}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    state = json.load(f)
+            except (FileNotFoundError, ValueError):
+                state = {"tokens": self.capacity, "updated": time.time(), "paused_until": 0.0}
+            yield state
+            write_json_atomic(path, state)
+
+
+sheets_read_bucket = TokenBucket('read', SHEETS_READ_QUOTA, SHEETS_QUOTA_BURST)
+sheets_write_bucket = TokenBucket('write', SHEETS_WRITE_QUOTA, SHEETS_QUOTA_BURST)
+
+
+def api_error_status(e):
+    response = getattr(e, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def is_auth_error(e):
+    """Nur abgelaufene/ungültige Credentials erfordern eine neue Authentifizierung."""
+    return isinstance(e, AccessTokenRefreshError) or api_error_status(e) == 401
+
+
+def retry_delay(e, attempt):
+    """Wartezeit vor dem nächsten Versuch: Retry-After des Servers, sonst exponentiell mit Jitter."""
+    response = getattr(e, 'response', None)
+    retry_after = getattr(response, 'headers', {}).get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), SHEETS_MAX_BACKOFF)
+        except ValueError:
+            pass
+    return random.uniform(0.5, 1.0) * min(SHEETS_MAX_BACKOFF, 2 ** attempt)
+
+
+def backoff_delay(failures):
+    """Wartezeit der Hintergrund-Threads nach failures Fehlern in Folge: exponentiell mit Jitter."""
+    return min(2 ** failures, MAX_REFRESH_BACKOFF) * random.uniform(0.8, 1.2)
+
+
+def try_flock(path):
+    """Exklusives flock() ohne Warten, um eine Rolle (Refresher, Applier, Spiegel) für einen Prozess zu beanspruchen.
+
+    Gibt den offenen Deskriptor zurück - die Rolle gilt, solange er offen bleibt - oder None.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def write_json_atomic(path, obj, **dump_kwargs):
+    """Schreibt JSON atomar (tmp + rename), damit Leser nie eine halbe Datei sehen."""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, **dump_kwargs)
+    os.replace(tmp_path, path)
+
+
+class QuotaAwareWorksheet:
+    """Hülle um das gspread-Worksheet: Quota-Limiter, Retries mit Backoff und Re-Auth.
+
+    Lese- und Schreibaufrufe holen sich vorher ein Token aus ihrem Bucket, 429/5xx werden
+    mit Backoff (Retry-After hat Vorrang) wiederholt, neu authentifiziert wird nur bei
+    echten Auth-Fehlern. Alle anderen Attribute gehen direkt an das Worksheet.
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def __getattr__(self, name):
+        return getattr(self.worksheet, name)
+
+    def call(self, bucket, kind, operation, priority, func):
+        reauthorized = False
+        for attempt in itertools.count():
+            SHEETS_QUOTA_WAIT.labels(kind).observe(bucket.acquire(priority))
+            try:
+                return func(self.worksheet)
+            except Exception as e:
+                if is_auth_error(e) and not reauthorized:
+                    reauthorized = True
+                    SHEETS_RETRIES.labels(operation, 'auth').inc()
+                    logger.warning(f"⚠️ Sheets-Authentifizierung abgelaufen ({operation}) - melde neu an")
+                    self.worksheet = open_google_worksheet(reauthorize=True) or self.worksheet
+                    continue
+                status = api_error_status(e)
+                if status not in SHEETS_RETRY_STATUSES or attempt >= SHEETS_MAX_RETRIES:
+                    raise
+                delay = retry_delay(e, attempt)
+                if status == 429:
+                    bucket.pause(delay)  # Quota ist für alle erschöpft, nicht nur für diesen Aufruf
+                SHEETS_RETRIES.labels(operation, str(status)).inc()
+                logger.warning(f"⚠️ Sheets {operation}: HTTP {status}, Versuch {attempt + 1} "
+                               f"- neuer Versuch in {delay:.1f}s")
+                time.sleep(delay)
+
+    def get_all_values(self, *args, **kwargs):
+        return self.call(sheets_read_bucket, 'read', 'get_all_values', WRITE_PRIORITY_SIGNAL,
+                         lambda ws: ws.get_all_values(*args, **kwargs))
+
+    def batch_get(self, *args, **kwargs):
+        return self.call(sheets_read_bucket, 'read', 'batch_get', WRITE_PRIORITY_SIGNAL,
+                         lambda ws: ws.batch_get(*args, **kwargs))
+
+    def batch_update(self, data, priority=WRITE_PRIORITY_SIGNAL, **kwargs):
+        return self.call(sheets_write_bucket, 'write', 'batch_update', priority,
+                         lambda ws: ws.batch_update(data, **kwargs))
+
+
+def open_google_worksheet(reauthorize=False):
+    """Authentifiziert (nur falls nötig) und öffnet das erste Tabellenblatt von SHEET_URL."""
+    global sheet_client_cache
+    if reauthorize:
+        sheet_client_cache = None
+
+    # Client cachen - muss nicht bei jedem Request neu erstellt werden
+    if sheet_client_cache is None:
+        credentials_json = os.environ.get('GOOGLE_CREDENTIALS')
+        if not credentials_json:
+            logger.error("❌ GOOGLE_CREDENTIALS nicht gefunden!")
+            return None
+
+        credentials_dict = json.loads(credentials_json)
+        scope = [
+            'https://spreadsheets.google.com/feeds',
+            'https://www.googleapis.com/auth/drive'
+        ]
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
+        with sheets_call('sheets', 'authorize'):
+            client = gspread.authorize(creds)
+        # Ein Connection-Pool-Slot pro Request-Thread statt der requests-Voreinstellung (10)
+        client.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=SERVER_THREADS))
+        sheet_client_cache = client
+
+    sheet_url = os.environ.get('SHEET_URL')
+    if not sheet_url:
+        logger.error("❌ SHEET_URL nicht gefunden!")
+        return None
+
+    # open_by_url() liest Metadaten und zählt damit gegen das Lese-Quota
+    SHEETS_QUOTA_WAIT.labels('read').observe(sheets_read_bucket.acquire())
+    with sheets_call('sheets', 'open_by_url'):
+        return sheet_client_cache.open_by_url(sheet_url).sheet1
+
+
 def get_google_sheet():
     """Gibt das Sheet-Objekt zurück, mit gecachtem Client und Sheet."""
     global sheet_client_cache, sheet_object_cache
     
+    # Sheet-Objekt cachen - open_by_url() könnte API-Calls machen
+    if sheet_object_cache is not None:
+        return sheet_object_cache
+
     try:
-        # Sheet-Objekt cachen - open_by_url() könnte API-Calls machen
-        if sheet_object_cache is not None:
-            return sheet_object_cache
-        
-        # Client cachen - muss nicht bei jedem Request neu erstellt werden
-        if sheet_client_cache is None:
-            credentials_json = os.environ.get('GOOGLE_CREDENTIALS')
-            if not credentials_json:
-                print("❌ GOOGLE_CREDENTIALS nicht gefunden!")
+        with sheet_open_lock:
+            # Parallele Threads beim Kaltstart warten auf den ersten, statt selbst zu autorisieren
+            if sheet_object_cache is not None:
+                return sheet_object_cache
+            worksheet = open_google_worksheet()
+            if worksheet is None:
                 return None
-
-            credentials_dict = json.loads(credentials_json)
-            scope = [
-                'https://spreadsheets.google.com/feeds',
-                'https://www.googleapis.com/auth/drive'
-            ]
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
-            sheet_client_cache = gspread.authorize(creds)
-
-        sheet_url = os.environ.get('SHEET_URL')
-        if not sheet_url:
-            print("❌ SHEET_URL nicht gefunden!")
-            return None
-
-        # Sheet-Objekt cachen
-        sheet_object_cache = sheet_client_cache.open_by_url(sheet_url).sheet1
-        return sheet_object_cache
+            sheet_object_cache = QuotaAwareWorksheet(worksheet)
+            return sheet_object_cache
     except Exception as e:
-        print(f"❌ Fehler beim Öffnen des Sheets: {e}")
-        # Bei Fehler: Caches zurücksetzen, damit beim nächsten Versuch neu erstellt wird
-        sheet_client_cache = None
-        sheet_object_cache = None
+        logger.error(f"❌ Fehler beim Öffnen des Sheets: {e}")
+        # Client nur bei echten Auth-Fehlern verwerfen - eine neue Anmeldung ist teuer
+        if is_auth_error(e):
+            sheet_client_cache = None
         return None
 
 
+def parse_a1_range(range_name):
+    """'A5:H5' → (erste Zeile 1-basiert, letzte Zeile oder None, erste Spalte 0-basiert, Spaltenende oder None)."""
+    grid = a1_range_to_grid_range(range_name.split('!')[-1])
+    end_row = grid.get('endRowIndex')
+    return grid.get('startRowIndex', 0) + 1, end_row, grid.get('startColumnIndex', 0), grid.get('endColumnIndex')
+
+
+def trim_row(row):
+    """Entfernt leere Zellen am Zeilenende (wie die Sheets-API)."""
+    row = [str(value) for value in row]
+    while row and row[-1] == '':
+        row.pop()
+    return row
+
+
+def patch_rows(rows_by_number, data):
+    """Wendet batch_update-Daten auf ein Dict {Zeile: [Zellen]} an und gibt die geänderten Zeilen zurück."""
+    changed = {}
+    for value_range in data:
+        updates = [(value_range['range'], value_range['values'])]
+        for row_number, col_idx, value in iter_update_cells(updates):
+            row = changed.get(row_number)
+            if row is None:
+                row = changed[row_number] = list(rows_by_number.get(row_number, []))
+            if len(row) <= col_idx:
+                row.extend([''] * (col_idx + 1 - len(row)))
+            row[col_idx] = str(value)
+    return changed
+
+
+def select_range(rows_by_number, last_row, range_name):
+    """Liest einen A1-Bereich aus {Zeile: [Zellen]} - Ergebnis wie Worksheet.get() (getrimmt)."""
+    start_row, end_row, start_col, end_col = parse_a1_range(range_name)
+    end_row = min(end_row or last_row, last_row)
+    values = [trim_row(rows_by_number.get(row_number, [])[start_col:end_col])
+              for row_number in range(start_row, end_row + 1)]
+    while values and not values[-1]:
+        values.pop()
+    return values
+
+
+def pad_rows(rows):
+    """Füllt alle Zeilen auf gleiche Breite auf (wie Worksheet.get_all_values())."""
+    width = max((len(row) for row in rows), default=0)
+    return [row + [''] * (width - len(row)) for row in rows]
+
+
+class MemoryStore:
+    """Worksheet-kompatibler In-Memory-Speicher (get_all_values/batch_get/batch_update) für Tests."""
+
+    title = 'memory'
+
+    def __init__(self, rows=None):
+        self._rows = {idx + 1: trim_row(row) for idx, row in enumerate(rows or []) if any(row)}
+        self._lock = threading.Lock()
+
+    def get_all_values(self):
+        with self._lock:
+            last_row = max(self._rows, default=0)
+            return pad_rows([list(self._rows.get(n, [])) for n in range(1, last_row + 1)])
+
+    def batch_get(self, ranges, **kwargs):
+        with self._lock:
+            last_row = max(self._rows, default=0)
+            return [select_range(self._rows, last_row, range_name) for range_name in ranges]
+
+    def batch_update(self, data, **kwargs):
+        with self._lock:
+            for row_number, row in patch_rows(self._rows, data).items():
+                self._rows[row_number] = trim_row(row)
+
+
+class SQLiteStore:
+    """Lokale SQLite-Datenbank als System of Record mit indizierten Ticket-/Status-/Symbol-Spalten.
+
+    Jede Zeile des Sheets ist ein Datensatz (Zellen als JSON). Mit mirror=True landet
+    jeder Schreibzugriff zusätzlich in mirror_queue und wird vom SheetMirror-Thread
+    asynchron nach Google Sheets repliziert.
+    """
+
+    title = 'sqlite'
+
+    def __init__(self, path, mirror=False):
+        self.path = path
+        self.mirror = mirror
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS trades (
+                row_number INTEGER PRIMARY KEY,
+                ticket TEXT NOT NULL DEFAULT '',
+                symbol TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL DEFAULT '',
+                cells TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS trades_ticket ON trades (ticket);
+            CREATE INDEX IF NOT EXISTS trades_status ON trades (status);
+            CREATE INDEX IF NOT EXISTS trades_symbol ON trades (symbol);
+            CREATE TABLE IF NOT EXISTS mirror_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL
+            );
+        ''')
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM trades LIMIT 1').fetchone() is None
+
+    def _rows(self, where='', params=()):
+        rows = self._conn.execute(f'SELECT row_number, cells FROM trades {where}', params)
+        return {row_number: json.loads(cells) for row_number, cells in rows}
+
+    def _last_row(self):
+        return self._conn.execute('SELECT COALESCE(MAX(row_number), 0) FROM trades').fetchone()[0]
+
+    def _save(self, changed_rows):
+        for row_number, row in changed_rows.items():
+            row = trim_row(row)
+            if not row:
+                self._conn.execute('DELETE FROM trades WHERE row_number = ?', (row_number,))
+                continue
+            self._conn.execute(
+                'INSERT OR REPLACE INTO trades (row_number, ticket, symbol, status, cells) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (row_number, row_ticket(row), row_symbol(row), row_status(row), json.dumps(row)))
+
+    def get_all_values(self):
+        with self._lock:
+            rows = self._rows('ORDER BY row_number')
+        last_row = max(rows, default=0)
+        return pad_rows([rows.get(n, []) for n in range(1, last_row + 1)])
+
+    def batch_get(self, ranges, **kwargs):
+        with self._lock:
+            last_row = self._last_row()
+            results = []
+            for range_name in ranges:
+                start_row, end_row, _, _ = parse_a1_range(range_name)
+                rows = self._rows('WHERE row_number BETWEEN ? AND ?', (start_row, end_row or last_row))
+                results.append(select_range(rows, last_row, range_name))
+            return results
+
+    def batch_update(self, data, mirror=True, **kwargs):
+        row_numbers = set()
+        for value_range in data:
+            start_row, end_row, _, _ = parse_a1_range(value_range['range'])
+            row_numbers.update(range(start_row, start_row + len(value_range['values'])))
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                placeholders = ','.join('?' * len(row_numbers))
+                existing = self._rows(f'WHERE row_number IN ({placeholders})', tuple(row_numbers))
+                self._save(patch_rows(existing, data))
+                if self.mirror and mirror:
+                    self._conn.execute('INSERT INTO mirror_queue (payload) VALUES (?)', (json.dumps(data),))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def import_rows(self, rows):
+        """Übernimmt einen kompletten Sheet-Stand (Erst-Befüllung), ohne ihn zurückzuspiegeln."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._save({idx + 1: row for idx, row in enumerate(rows) if any(row)})
+            self._conn.execute('COMMIT')
+
+    def mirror_backlog(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM mirror_queue').fetchone()[0]
+
+    def next_mirror_batch(self, limit):
+        with self._lock:
+            entries = self._conn.execute(
+                'SELECT id, payload FROM mirror_queue ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return [(entry_id, json.loads(payload)) for entry_id, payload in entries]
+
+    def ack_mirror_batch(self, last_id):
+        with self._lock:
+            self._conn.execute('DELETE FROM mirror_queue WHERE id <= ?', (last_id,))
+
+    def rows_with_status(self, status):
+        with self._lock:
+            return [row_number for (row_number,) in self._conn.execute(
+                'SELECT row_number FROM trades WHERE status = ? ORDER BY row_number', (status,))]
+
+
+def sheet_mirror_loop(store):
+    """Repliziert die SQLite-Schreibzugriffe in Reihenfolge nach Google Sheets.
+
+    Übernimmt außerdem manuelle Freigaben im Sheet (PENDING → OK in Spalte Y)
+    zurück in die Datenbank, solange keine eigenen Änderungen ausstehen.
+    """
+    failures = 0
+    next_pull = 0
+    while True:
+        try:
+            sheet = get_google_sheet()
+            if sheet is None:
+                raise RuntimeError("Sheet konnte nicht geöffnet werden")
+
+            batch = store.next_mirror_batch(MIRROR_BATCH_SIZE)
+            if batch:
+                with sheets_call('sheets', 'batch_update'):
+                    sheet.batch_update([value_range for _, data in batch for value_range in data])
+                store.ack_mirror_batch(batch[-1][0])
+                failures = 0
+                continue
+
+            if time.time() >= next_pull:
+                next_pull = time.time() + MIRROR_PULL_INTERVAL
+                pull_sheet_status_edits(store, sheet)
+            failures = 0
+            time.sleep(0.2)
+        except Exception as e:
+            failures += 1
+            delay = backoff_delay(failures)
+            logger.warning(f"⚠️ Fehler beim Spiegeln nach Google Sheets (neuer Versuch in {delay:.0f}s): {e}")
+            time.sleep(delay)
+
+
+def pull_sheet_status_edits(store, sheet):
+    """Liest Spalte Y der PENDING-Zeilen aus dem Sheet und übernimmt dort manuell gesetzte Status."""
+    runs = merge_row_runs(store.rows_with_status('PENDING'))
+    if not runs:
+        return
+    with sheets_call('sheets', 'batch_get'):
+        results = sheet.batch_get([f'Y{start}:Y{end}' for start, end in runs])
+    updates = []
+    for (start, end), values in zip(runs, results):
+        for offset, row_number in enumerate(range(start, end + 1)):
+            status = values[offset][0].strip() if offset < len(values) and values[offset] else ''
+            if status and status.upper() != 'PENDING':
+                updates.append({'range': f'Y{row_number}', 'values': [[status]]})
+    if updates and store.mirror_backlog() == 0:
+        store.batch_update(updates, mirror=False)
+        logger.info(f"🔄 {len(updates)} Status-Änderung(en) aus Google Sheets übernommen")
+
+
+def start_sheet_mirror(store):
+    """Startet den Spiegel-Thread - per flock() nur in einem Prozess pro Datenbank."""
+    global sheet_mirror_thread
+    if sheet_mirror_thread is not None:
+        return
+    if try_flock(store.path + '.mirror.lock') is None:
+        return
+    sheet_mirror_thread = threading.Thread(
+        target=sheet_mirror_loop, args=(store,), name="sheet-mirror", daemon=True)
+    sheet_mirror_thread.start()
+
+
+def get_store():
+    """Gibt den primären Speicher zurück, den alle Handler verwenden (siehe STORAGE_BACKEND)."""
+    global store_cache
+    if STORAGE_BACKEND == 'sheets':
+        return get_google_sheet()
+    if store_cache is not None:
+        return store_cache
+
+    with store_lock:
+        if store_cache is not None:
+            return store_cache
+        try:
+            if STORAGE_BACKEND == 'memory':
+                store_cache = MemoryStore()
+                return store_cache
+
+            store = SQLiteStore(SQLITE_PATH, mirror=bool(os.environ.get('SHEET_URL')))
+            if store.mirror:
+                if store.is_empty():
+                    # Erst-Befüllung aus dem bestehenden Sheet
+                    sheet = get_google_sheet()
+                    if sheet is None:
+                        return None
+                    with sheets_call('sheets', 'get_all_values'):
+                        rows = sheet.get_all_values()
+                    store.import_rows(rows)
+                    logger.info(f"✅ SQLite-Datenbank aus Google Sheets befüllt ({SQLITE_PATH})")
+                start_sheet_mirror(store)
+            store_cache = store
+            return store_cache
+        except Exception as e:
+            logger.error(f"❌ Fehler beim Öffnen des Speichers '{STORAGE_BACKEND}': {e}")
+            return None
+
+
 def get_json_from_request():
     try:
         data = request.get_json(silent=True)
@@ -103,97 +890,1956 @@ def get_json_from_request():
 
         return None
     except Exception as e:
-        print(f"⚠️ Fehler beim Parsen von JSON: {e}")
+        logger.warning(f"⚠️ Fehler beim Parsen von JSON: {e}")
         return None
 
 
-def refresh_sheet_cache(sheet):
-    """Lädt den Cache nur, wenn er älter als CACHE_DURATION Sekunden ist."""
-    current_time = time.time()
-    
-    # Wenn Cache noch gültig ist, nichts tun
-    if (sheet_cache["data"] is not None and 
-        current_time - sheet_cache["timestamp"] < CACHE_DURATION):
+def load_sheet_snapshot(sheet):
+    """Lädt einen kompletten Snapshot und tauscht Daten + Indizes atomar aus (Single-Flight).
+
+    Gibt False zurück, wenn bereits ein anderer Thread lädt oder der Download fehlschlägt.
+    """
+    if not refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        snapshot_time = time.time()
+        sheet_cache["last_refresh_attempt"] = snapshot_time
+        started = time.perf_counter()
+        try:
+            with sheets_call(STORAGE_BACKEND, 'get_all_values'):
+                data = sheet.get_all_values()
+        except Exception as e:
+            record_refresh_failure()
+            logger.warning(f"⚠️ Fehler beim Cache-Refresh: {e}")
+            # Bei Fehler: Cache nicht invalidieren, verwende alten Cache
+            return False
+
+        if ARCHIVE_AFTER_DAYS > 0 and STORAGE_BACKEND == 'sheets' and not archive_state["loaded"]:
+            # Zeilen-Offset muss feststehen, bevor die ersten Zeilennummern ausgeliefert werden
+            try:
+                load_archive_index(sheet)
+            except Exception as e:
+                record_refresh_failure()
+                logger.warning(f"⚠️ Fehler beim Laden des Archiv-Index: {e}")
+                return False
+
+        # install_snapshot() dekodiert in eine eigene Liste, veröffentlicht wird der Sheet-Stand
+        install_snapshot(data, snapshot_time)
+        sheet_cache["failures"] = 0
+        sheet_cache["full_reload_at"] = snapshot_time + FULL_RELOAD_INTERVAL
+        CACHE_REFRESH_DURATION.labels('full').observe(time.perf_counter() - started)
+        logger.info(f"✅ Cache aktualisiert (Zeit: {snapshot_time})")
+        if shared_state["leader_fd"] is not None:
+            publish_shared_snapshot(data, snapshot_time)
+        return True
+    finally:
+        refresh_lock.release()
+        with refresh_done:
+            refresh_done.notify_all()
+
+
+def merge_row_runs(row_numbers):
+    """Fasst sortierte Zeilennummern zu zusammenhängenden (start, ende)-Blöcken zusammen."""
+    runs = []
+    for row_number in row_numbers:
+        if runs and runs[-1][1] == row_number - 1:
+            runs[-1][1] = row_number
+        else:
+            runs.append([row_number, row_number])
+    return runs
+
+
+def load_sheet_delta(sheet):
+    """Inkrementeller Refresh: lädt nur die letzten SYNC_TAIL_ROWS Zeilen und offene Zeilen davor.
+
+    Abgeschlossene Zeilen oberhalb dieses Bereichs werden nur beim
+    vollständigen Reload (FULL_RELOAD_INTERVAL) erneut gelesen. Ein einziger
+    batch_get()-Call, Kosten unabhängig von der Gesamtgröße des Sheets - auch für
+    die anderen Worker, die nur die geänderten Zeilen über das Write-Log bekommen.
+    """
+    if not refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        sync_time = time.time()
+        sheet_cache["last_refresh_attempt"] = sync_time
+        with cache_lock:
+            data = sheet_cache["data"]
+            tail_start = max(2, len(data) - SYNC_TAIL_ROWS + 1)
+            width = max([26] + [len(row) for row in data[tail_start - 1:]])
+            open_runs = merge_row_runs(sorted(
+                row_number for row_number in sheet_cache["indexes"]["open_rows"]
+                if row_number < tail_start))
+        last_col = rowcol_to_a1(1, width)[:-1]
+        ranges = [f'A{tail_start}:{last_col}']
+        ranges += [f'A{start}:{last_col}{end}' for start, end in open_runs]
+
+        started = time.perf_counter()
+        try:
+            with sheets_call(STORAGE_BACKEND, 'batch_get'):
+                results = sheet.batch_get(ranges)
+        except Exception as e:
+            record_refresh_failure()
+            logger.warning(f"⚠️ Fehler beim inkrementellen Cache-Refresh: {e}")
+            return False
+
+        tail = results[0]
+        changed_rows = {tail_start + offset: list(row) for offset, row in enumerate(tail)}
+        for (start, end), values in zip(open_runs, results[1:]):
+            for row_number in range(start, end + 1):
+                offset = row_number - start
+                changed_rows[row_number] = list(values[offset]) if offset < len(values) else []
+
+        last_row = tail_start + len(tail) - 1
+        with cache_lock:
+            changed_rows = replace_cached_rows(changed_rows, last_row)
+            sheet_cache["timestamp"] = sync_time
+            replay_local_writes(sync_time)
+            signal_condition.notify_all()
+        sheet_cache["failures"] = 0
+        CACHE_REFRESH_DURATION.labels('delta').observe(time.perf_counter() - started)
+        CACHE_ROWS.set(len(sheet_cache["data"]))
+        logger.debug("✅ Cache inkrementell aktualisiert ab Zeile %s (+%s offene Blöcke, Zeit: %s)",
+                     tail_start, len(open_runs), sync_time)
+        if shared_state["leader_fd"] is not None:
+            publish_shared_delta(changed_rows, last_row, sync_time)
+        return True
+    finally:
+        refresh_lock.release()
+        with refresh_done:
+            refresh_done.notify_all()
+
+
+def replace_cached_rows(changed_rows, last_row):
+    """Ersetzt einzelne Zeilen im Cache, kürzt ihn auf last_row und pflegt die Indizes nach.
+
+    Gibt nur die Zeilen zurück, die sich gegenüber dem Cache tatsächlich geändert haben.
+    """
+    data = sheet_cache["data"]
+    indexes = sheet_cache["indexes"]
+    replaced = {}
+    for row_number in range(len(data), last_row, -1):
+        unindex_row(indexes, row_number, data[row_number - 1])
+    del data[max(last_row, 0):]
+    for row_number, cells in sorted(changed_rows.items()):
+        while len(data) < row_number:
+            data.append(EMPTY_ROW)
+            index_row(indexes, len(data), EMPTY_ROW)
+        new_row = TradeRow(cells)
+        if new_row.packed == data[row_number - 1].packed:
+            continue
+        unindex_row(indexes, row_number, data[row_number - 1])
+        index_row(indexes, row_number, new_row)
+        data[row_number - 1] = new_row
+        replaced[row_number] = cells
+    return replaced
+
+
+def sync_sheet_cache(sheet):
+    """Hintergrund-Refresh: inkrementell, nur nach FULL_RELOAD_INTERVAL (oder nach einer Archivierung) komplett."""
+    if (not INCREMENTAL_SYNC or sheet_cache["data"] is None
+            or time.time() >= sheet_cache["full_reload_at"]):
+        return load_sheet_snapshot(sheet)
+    return load_sheet_delta(sheet)
+
+
+def install_snapshot(data, snapshot_time, archive_offset=None):
+    """Tauscht Daten + Indizes atomar aus und spielt neuere eigene Schreibzugriffe erneut ein.
+
+    archive_offset (geteilter Snapshot) wird mit den Daten zusammen übernommen, damit
+    Zeilennummern der API nie zu einem anderen Stand des Live-Blatts passen.
+    """
+    # Zeilen dekodieren und Indizes außerhalb des Locks bauen - Leser arbeiten so lange mit dem alten Snapshot
+    data = [TradeRow(row) for row in data]
+    indexes = build_sheet_indexes(data)
+    with cache_lock:
+        sheet_cache["data"] = data
+        sheet_cache["indexes"] = indexes
+        sheet_cache["timestamp"] = snapshot_time
+        if archive_offset is not None:
+            archive_state["offset"] = archive_offset
+        replay_local_writes(snapshot_time)
+        signal_condition.notify_all()
+    CACHE_ROWS.set(len(data))
+    WORKER_READY.set(1)
+
+
+def shared_path(name):
+    return os.path.join(SHARED_CACHE_DIR, name)
+
+
+def try_become_leader():
+    """Wählt per flock() genau einen Worker als Refresher; stirbt er, übernimmt der nächste."""
+    if shared_state["leader_fd"] is not None:
+        return True
+    fd = try_flock(shared_path('refresher.lock'))
+    if fd is None:
+        return False
+    shared_state["leader_fd"] = fd
+    logger.info(f"👑 Worker {os.getpid()} lädt ab jetzt das Sheet für alle Worker")
+    return True
+
+
+def publish_shared_snapshot(data, snapshot_time):
+    """Veröffentlicht den Snapshot für die anderen Worker und kürzt das Write-Log."""
+    try:
+        write_json_atomic(shared_path('snapshot.json'),
+                          {"timestamp": snapshot_time, "data": data, "archive_offset": archive_state["offset"]},
+                          separators=(',', ':'))
+        shared_state["snapshot_mtime"] = os.stat(shared_path('snapshot.json')).st_mtime_ns
+        compact_shared_write_log(snapshot_time)
+    except Exception as e:
+        logger.warning(f"⚠️ Fehler beim Veröffentlichen des Snapshots: {e}")
+
+
+def load_shared_snapshot():
+    """Übernimmt den Snapshot des Refresher-Workers, falls er neuer ist als der eigene."""
+    path = shared_path('snapshot.json')
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    if mtime == shared_state["snapshot_mtime"]:
+        return False
+    started = time.perf_counter()
+    with open(path, encoding='utf-8') as f:
+        snapshot = json.load(f)
+    shared_state["snapshot_mtime"] = mtime
+    install_snapshot(snapshot["data"], snapshot["timestamp"], snapshot.get("archive_offset", 0))
+    if ARCHIVE_AFTER_DAYS > 0:
+        load_shared_archive_index()
+    CACHE_REFRESH_DURATION.labels('shared').observe(time.perf_counter() - started)
+    return True
+
+
+def publish_shared_delta(changed_rows, last_row, sync_time):
+    """Inkrementeller Refresh: nur geänderte Zeilen (und das Sheet-Ende) über das Write-Log verteilen.
+
+    snapshot.json wird nur beim vollständigen Reload und nach einer Archivierung neu geschrieben.
+    """
+    try:
+        append_shared_log_entry({"t": sync_time, "pid": os.getpid(), "rows": changed_rows, "last_row": last_row})
+    except Exception as e:
+        logger.warning(f"⚠️ Fehler beim Veröffentlichen des inkrementellen Refreshs: {e}")
+
+
+def append_shared_write(updates, write_time):
+    """Hängt einen eigenen Schreibzugriff an das Write-Log an, damit andere Worker ihn sofort sehen."""
+    append_shared_log_entry({"t": write_time, "pid": os.getpid(), "updates": updates})
+
+
+def append_shared_log_entry(entry):
+    entry = json.dumps(entry, separators=(',', ':'))
+    with open(shared_path('writes.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        with open(shared_path('writes.log'), 'a', encoding='utf-8') as f:
+            f.write(entry + '\n')
+
+
+def sync_shared_writes():
+    """Wendet neue Schreibzugriffe anderer Worker aus dem Write-Log auf den eigenen Cache an."""
+    try:
+        st = os.stat(shared_path('writes.log'))
+    except FileNotFoundError:
         return
-    
-    # Rate-Limiting: Verhindere zu häufige Refresh-Versuche
-    if (current_time - sheet_cache["last_refresh_attempt"] < MIN_REFRESH_INTERVAL):
-        # Zu früh für Refresh - verwende alten Cache
-        if sheet_cache["data"] is not None:
+    if st.st_ino == shared_state["log_inode"] and st.st_size <= shared_state["log_offset"]:
+        return
+
+    with shared_log_lock:
+        with open(shared_path('writes.log'), 'rb') as f:
+            if os.fstat(f.fileno()).st_ino != shared_state["log_inode"]:
+                # Log wurde kompaktiert: die entfernten Einträge stecken im neueren Snapshot,
+                # der vor der Kompaktierung veröffentlicht wurde - erst ihn übernehmen, dann
+                # von vorn lesen (erneutes Anwenden ist idempotent)
+                load_shared_snapshot()
+                shared_state["log_inode"] = os.fstat(f.fileno()).st_ino
+                shared_state["log_offset"] = 0
+            f.seek(shared_state["log_offset"])
+            chunk = f.read()
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        shared_state["log_offset"] += len(complete)
+
+        own_pid = os.getpid()
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            if entry["pid"] == own_pid:
+                continue
+            with cache_lock:
+                if "rows" in entry:
+                    apply_shared_delta(entry)
+                else:
+                    sheet_cache["local_writes"].append((entry["t"], entry["updates"]))
+                    apply_updates_to_cache(entry["updates"])
+
+
+def apply_shared_delta(entry):
+    """Follower: inkrementellen Refresh des Refresher-Workers übernehmen (wie load_sheet_delta(), unter cache_lock)."""
+    if sheet_cache["data"] is None or entry["t"] < sheet_cache["timestamp"]:
+        return  # Bereits im neueren Snapshot enthalten
+    replace_cached_rows({int(row_number): cells for row_number, cells in entry["rows"].items()}, entry["last_row"])
+    sheet_cache["timestamp"] = entry["t"]
+    replay_local_writes(entry["t"])
+    signal_condition.notify_all()
+
+
+def compact_shared_write_log(snapshot_time):
+    """Entfernt Log-Einträge, die bereits im veröffentlichten Snapshot enthalten sind."""
+    with open(shared_path('writes.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(shared_path('writes.log'), encoding='utf-8') as f:
+                lines = [line for line in f if line.strip() and json.loads(line)["t"] >= snapshot_time]
+        except FileNotFoundError:
             return
-    
-    # Wenn bereits ein anderer Thread den Cache lädt, warten
-    if sheet_cache["lock"]:
-        # Warte maximal 2 Sekunden, dann verwende alten Cache
-        wait_time = 0
-        while sheet_cache["lock"] and wait_time < 2:
-            time.sleep(0.1)
-            wait_time += 0.1
-        if sheet_cache["data"] is not None:
+        tmp_path = shared_path(f'writes.log.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, shared_path('writes.log'))
+
+
+def archive_file_lock(mode):
+    """Mit SHARED_CACHE_DIR: flock() auf archive.lock (LOCK_SH für Schreib-Requests, LOCK_EX für die Archivierung)."""
+    if not SHARED_CACHE_DIR:
+        return nullcontext()
+    return flocked(shared_path('archive.lock'), mode)
+
+
+@contextmanager
+def flocked(path, mode):
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, mode)
+        yield
+
+
+@contextmanager
+def stable_row_numbers():
+    """Hält die Zeilennummern während eines Schreib-Requests stabil - die Archivierung wartet so lange."""
+    with archive_gate.shared(), archive_file_lock(fcntl.LOCK_SH):
+        if SHARED_CACHE_DIR:
+            sync_archive_offset()
+        yield
+
+
+def sync_archive_offset():
+    """Follower: hat der Refresher-Worker archiviert, erst den neuen Snapshot übernehmen."""
+    try:
+        with open(shared_path('archive.json'), encoding='utf-8') as f:
+            offset = json.load(f)["offset"]
+    except (FileNotFoundError, ValueError):
+        return
+    if offset != archive_state["offset"]:
+        load_shared_snapshot()
+
+
+def api_row(row_number):
+    """Zeile im Live-Blatt → logische Zeilennummer der API (bleibt über Archivierungen hinweg gleich)."""
+    return row_number + archive_state["offset"] if row_number else 0
+
+
+def sheet_row(row_number):
+    """Logische Zeilennummer der API → Zeile im Live-Blatt; 0, wenn die Zeile bereits archiviert wurde."""
+    physical = row_number - archive_state["offset"]
+    return physical if physical >= 2 or not archive_state["offset"] else 0
+
+
+def find_archived_ticket(ticket):
+    """(Archiv-Blatt, Zeile im Archiv, logische Zeile) eines archivierten Tickets oder None."""
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return None
+    with cache_lock:
+        return archive_state["tickets"].get(str(ticket).strip())
+
+
+def set_archive_index(offset, tickets, index_rows):
+    with cache_lock:
+        archive_state.update(offset=offset, tickets=tickets, index_rows=index_rows, loaded=True)
+    if SHARED_CACHE_DIR and shared_state["leader_fd"] is not None:
+        write_shared_archive_index()
+
+
+def load_archive_index(sheet):
+    """Liest Offset und Ticket-Index aus ARCHIVE_INDEX_SHEET (ein Lese-Call, einmal pro Prozess)."""
+    SHEETS_QUOTA_WAIT.labels('read').observe(sheets_read_bucket.acquire())
+    try:
+        with sheets_call('sheets', 'archive_index'):
+            rows = sheet.spreadsheet.values_get(f"'{ARCHIVE_INDEX_SHEET}'!A:G").get('values', [])
+    except gspread.exceptions.APIError as e:
+        if api_error_status(e) != 400:
+            raise
+        rows = []  # Blatt existiert noch nicht - noch nie archiviert
+    header = rows[0] if rows else []
+    offset = int(header[6]) if len(header) > 6 and header[6].strip() else 0
+    tickets = {}
+    for row in rows[1:]:
+        if len(row) >= 4 and row[0].strip() and row[0].strip() not in tickets:
+            tickets[row[0].strip()] = (row[1], int(row[2]), int(row[3]))
+    set_archive_index(offset, tickets, len(rows))
+    logger.info(f"🗄️ Archiv-Index geladen: {len(tickets)} Tickets, Zeilen-Offset {offset}")
+
+
+def write_shared_archive_index():
+    write_json_atomic(shared_path('archive_index.json'),
+                      {"offset": archive_state["offset"], "tickets": archive_state["tickets"],
+                       "index_rows": archive_state["index_rows"]}, separators=(',', ':'))
+    write_json_atomic(shared_path('archive.json'), {"offset": archive_state["offset"]})
+
+
+def load_shared_archive_index():
+    """Follower: Ticket-Index des Archivs vom Refresher-Worker übernehmen, falls er neuer ist."""
+    path = shared_path('archive_index.json')
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime == archive_state["index_mtime"]:
+        return
+    with open(path, encoding='utf-8') as f:
+        index = json.load(f)
+    with cache_lock:
+        archive_state.update(tickets={ticket: tuple(entry) for ticket, entry in index["tickets"].items()},
+                             index_rows=index["index_rows"], index_mtime=mtime, loaded=True)
+
+
+def row_finished_at(row):
+    """Exit-Zeit (Spalte N), sonst Eröffnungszeit (Spalte A) eines Trades - None, wenn nicht lesbar."""
+    for col_idx in (13, 0):
+        value = row[col_idx].strip() if len(row) > col_idx else ''
+        for time_format in ARCHIVE_TIME_FORMATS:
+            try:
+                return datetime.strptime(value, time_format)
+            except ValueError:
+                continue
+    return None
+
+
+def is_archivable(row, cutoff):
+    """Leere Zeilen und abgeschlossene Trades (Status nicht offen) älter als cutoff.
+
+    Ohne lesbares Datum zählt ein abgeschlossener Trade als alt. Zeilen ohne Status
+    (z.B. nur Balance) beenden den Block, damit die letzte Balance im Live-Blatt bleibt.
+    """
+    if not row.width:
+        return True
+    if not row.status or row.status in OPEN_STATUSES:
+        return False
+    finished_at = row_finished_at(row)
+    return finished_at is None or finished_at <= cutoff
+
+
+def archivable_prefix(rows, cutoff):
+    """Anzahl Zeilen ab Zeile 2, die am Stück archiviert werden können (höchstens ARCHIVE_MAX_ROWS)."""
+    count = 0
+    for row in rows[:ARCHIVE_MAX_ROWS]:
+        if not is_archivable(row, cutoff):
+            break
+        count += 1
+    return count
+
+
+def cell_data(value):
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": value}} if value != '' else {}
+
+
+def append_rows_requests(sheet_id, start_index, rows):
+    """appendDimension + updateCells: hängt rows ab Zeile start_index (0-basiert) an ein Blatt an."""
+    return [
+        {"appendDimension": {"sheetId": sheet_id, "dimension": "ROWS", "length": len(rows)}},
+        {"updateCells": {
+            "start": {"sheetId": sheet_id, "rowIndex": start_index, "columnIndex": 0},
+            "rows": [{"values": [cell_data(value) for value in row]} for row in rows],
+            "fields": "userEnteredValue",
+        }},
+    ]
+
+
+def archive_closed_trades(sheet):
+    """Verschiebt den ältesten Block abgeschlossener Trades in Monats-Archive und kürzt das Live-Blatt.
+
+    Kopieren, Index-Einträge, neuer Offset und Löschen der Zeilen gehen in einem einzigen
+    (atomaren) spreadsheets.batchUpdate. Währenddessen warten Schreib-Requests und der Refresh.
+    Gibt die Anzahl archivierter Zeilen zurück.
+    """
+    cutoff = datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    with archive_gate.exclusive(), archive_file_lock(fcntl.LOCK_EX), refresh_lock:
+        if not archive_state["loaded"]:
+            load_archive_index(sheet)
+        with cache_lock:
+            data = sheet_cache["data"]
+            if data is None:
+                return 0
+            count = archivable_prefix(data[1:], cutoff)
+            width = max([26] + [len(row) for row in data[:count + 1]])
+            header = data[0].cells if data else []
+        if not count:
+            return 0
+
+        # Frisch lesen: nur archivieren, was auch im Sheet (noch) abgeschlossen ist
+        last_col = rowcol_to_a1(1, width)[:-1]
+        with sheets_call(STORAGE_BACKEND, 'batch_get'):
+            fresh = sheet.batch_get([f'A2:{last_col}{count + 1}'])[0]
+        fresh_rows = [TradeRow(row) for row in fresh] + [EMPTY_ROW] * (count - len(fresh))
+        count = archivable_prefix(fresh_rows, cutoff)
+        if not count:
+            return 0
+        width = max([width] + [row.width for row in fresh_rows[:count]])
+
+        offset = archive_state["offset"]
+        by_month = {}
+        for idx, row in enumerate(fresh_rows[:count]):
+            if row.width:
+                finished_at = row_finished_at(row) or datetime.now()
+                title = f'{ARCHIVE_SHEET_PREFIX}{finished_at:%Y-%m}'
+                by_month.setdefault(title, []).append((offset + idx + 2, row))
+
+        spreadsheet = sheet.spreadsheet
+        SHEETS_QUOTA_WAIT.labels('read').observe(sheets_read_bucket.acquire())
+        with sheets_call('sheets', 'worksheets'):
+            worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+        used_ids = {ws.id for ws in worksheets.values()}
+
+        def new_sheet_id():
+            sheet_id = random.randint(1, 2 ** 31 - 1)
+            while sheet_id in used_ids:
+                sheet_id = random.randint(1, 2 ** 31 - 1)
+            used_ids.add(sheet_id)
+            return sheet_id
+
+        requests = []
+        new_tickets = {}
+        index_rows = []
+
+        def target_sheet(title, first_row, columns):
+            """(sheetId, nächste freie Zeile 0-basiert) - legt das Blatt samt Kopfzeile bei Bedarf an."""
+            ws = worksheets.get(title)
+            if ws is not None:
+                if ws.col_count < columns:
+                    requests.append({"appendDimension": {
+                        "sheetId": ws.id, "dimension": "COLUMNS", "length": columns - ws.col_count}})
+                return ws.id, ws.row_count
+            sheet_id = new_sheet_id()
+            requests.append({"addSheet": {"properties": {
+                "sheetId": sheet_id, "title": title,
+                "gridProperties": {"rowCount": 1, "columnCount": columns}}}})
+            requests.extend(append_rows_requests(sheet_id, 0, [first_row])[1:])
+            return sheet_id, 1
+
+        for title, rows in sorted(by_month.items()):
+            sheet_id, start_index = target_sheet(title, header, width)
+            requests.extend(append_rows_requests(sheet_id, start_index, [row.cells for _, row in rows]))
+            for idx, (logical_row, row) in enumerate(rows):
+                archive_row = start_index + idx + 1
+                index_rows.append([row.ticket, title, archive_row, logical_row])
+                if row.ticket and row.ticket not in archive_state["tickets"]:
+                    new_tickets[row.ticket] = (title, archive_row, logical_row)
+
+        index_header = ['Ticket', 'Archiv-Blatt', 'Archiv-Zeile', 'Zeile', '', 'Zeilen-Offset', offset]
+        index_id, index_start = target_sheet(ARCHIVE_INDEX_SHEET, index_header, len(index_header))
+        if index_rows:
+            requests.extend(append_rows_requests(index_id, index_start, index_rows))
+        offset_row, offset_col = a1_to_rowcol(ARCHIVE_OFFSET_CELL)
+        requests.append({"updateCells": {
+            "start": {"sheetId": index_id, "rowIndex": offset_row - 1, "columnIndex": offset_col - 1},
+            "rows": [{"values": [cell_data(offset + count)]}], "fields": "userEnteredValue"}})
+        requests.append({"deleteDimension": {"range": {
+            "sheetId": sheet.id, "dimension": "ROWS", "startIndex": 1, "endIndex": 1 + count}}})
+
+        SHEETS_QUOTA_WAIT.labels('write').observe(sheets_write_bucket.acquire(WRITE_PRIORITY_BOOKKEEPING))
+        with sheets_call('sheets', 'archive'):
+            spreadsheet.batch_update({"requests": requests})
+
+        # Cache wie das Sheet verschieben - laufende Reservierungen/Write-Logs beziehen sich auf alte Zeilen
+        with allocator_state_locked() as state:
+            state["reserved"] = {}
+        with cache_lock:
+            del data[1:1 + count]
+            sheet_cache["indexes"] = build_sheet_indexes(data)
+            sheet_cache["local_writes"] = []
+            sheet_cache["full_reload_at"] = 0
+            archive_state["offset"] = offset + count
+            archive_state["tickets"].update(new_tickets)
+            archive_state["index_rows"] = index_start + len(index_rows)
+            published = list(data)
+            signal_condition.notify_all()
+        CACHE_ROWS.set(len(data))
+        ARCHIVED_ROWS.inc(count)
+        if SHARED_CACHE_DIR and shared_state["leader_fd"] is not None:
+            publish_shared_snapshot([row.cells for row in published], time.time())
+            write_shared_archive_index()
+        logger.info(f"🗄️ {count} Zeilen archiviert ({', '.join(sorted(by_month)) or 'nur leere Zeilen'}), "
+                    f"Zeilen-Offset jetzt {offset + count}")
+        return count
+
+
+def close_archived_trade(sheet, archived, data):
+    """PUT auf einen bereits archivierten Trade: Exit-Daten direkt im Archiv-Blatt nachtragen.
+
+    Die Balance-Zelle entfällt - der Archiv-Block liegt vor allen Zeilen, die die Balance fortführen.
+    """
+    title, archive_row, _ = archived
+    updates = close_updates(archive_row, '', data)[:-1]
+    SHEETS_QUOTA_WAIT.labels('write').observe(sheets_write_bucket.acquire(WRITE_PRIORITY_BOOKKEEPING))
+    with sheets_call('sheets', 'archive_update'):
+        sheet.spreadsheet.values_batch_update({
+            'valueInputOption': 'RAW',
+            'data': [{'range': f"'{title}'!{cell}", 'values': values} for cell, values in updates],
+        })
+    logger.info(f"🗄️ Archivierter Trade aktualisiert: {title}, Zeile {archive_row}")
+
+
+def server_worker_count():
+    """Anzahl Worker-Prozesse (von gunicorn.conf.py gesetzt, sonst WEB_CONCURRENCY)."""
+    return int(os.environ.get('GUNICORN_WORKERS') or os.environ.get('WEB_CONCURRENCY') or 1)
+
+
+def run_scheduled_archival(sheet):
+    """Vom Refresher-Worker aufgerufen: archiviert höchstens alle ARCHIVE_INTERVAL Sekunden."""
+    if ARCHIVE_AFTER_DAYS <= 0 or time.time() < archive_state["next_run"]:
+        return
+    archive_state["next_run"] = time.time() + ARCHIVE_INTERVAL
+    if STORAGE_BACKEND != 'sheets':
+        archive_state["next_run"] = float('inf')
+        logger.warning("⚠️ Archivierung ist nur mit STORAGE_BACKEND=sheets verfügbar")
+        return
+    if not SHARED_CACHE_DIR and server_worker_count() > 1:
+        # Die anderen Worker würden den neuen Zeilen-Offset nie erfahren und in falsche Zeilen schreiben
+        archive_state["next_run"] = float('inf')
+        logger.error(f"❌ Archivierung mit {server_worker_count()} Workern nur mit SHARED_CACHE_DIR - deaktiviert")
+        return
+    try:
+        archive_closed_trades(sheet)
+    except Exception as e:
+        logger.exception(f"❌ Fehler bei der Archivierung: {e}")
+
+
+def record_refresh_failure():
+    """Exponentieller Backoff (mit Jitter) nach fehlgeschlagenen Refreshes."""
+    sheet_cache["failures"] += 1
+    CACHE_REFRESH_FAILURES.inc()
+    backoff = min(MIN_REFRESH_INTERVAL * 2 ** (sheet_cache["failures"] - 1), MAX_REFRESH_BACKOFF)
+    sheet_cache["retry_at"] = time.time() + backoff * random.uniform(0.8, 1.2)
+
+
+def next_refresh_delay():
+    """Sekunden bis zum nächsten Hintergrund-Refresh (vor Ablauf bzw. mit Backoff nach Fehlern)."""
+    if sheet_cache["failures"]:
+        return sheet_cache["retry_at"] - time.time()
+    # Warten EAs per Long-Poll/SSE, wird öfter (inkrementell) nachgeladen - ein Read pro Prozess
+    # statt eines Polls pro EA
+    if signal_state["waiters"]:
+        due = sheet_cache["timestamp"] + MIN_REFRESH_INTERVAL
+    else:
+        due = sheet_cache["timestamp"] + CACHE_DURATION * REFRESH_AHEAD_RATIO
+    earliest = sheet_cache["last_refresh_attempt"] + MIN_REFRESH_INTERVAL
+    return max(due, earliest) - time.time()
+
+
+def cache_refresher_loop():
+    """Hintergrund-Thread: erneuert den Cache vor Ablauf, Requests warten nie auf Sheets."""
+    while True:
+        try:
+            if SHARED_CACHE_DIR and not try_become_leader():
+                # Follower: nur den veröffentlichten Snapshot übernehmen, nie selbst Sheets lesen
+                load_shared_snapshot()
+                sync_shared_writes()
+                refresh_wakeup.wait(SHARED_POLL_INTERVAL)
+                refresh_wakeup.clear()
+                continue
+
+            delay = next_refresh_delay()
+            if delay > 0:
+                refresh_wakeup.wait(delay)
+                refresh_wakeup.clear()
+                continue
+            sheet = get_store()
+            if sheet is None:
+                sheet_cache["last_refresh_attempt"] = time.time()
+                record_refresh_failure()
+                continue
+            if sync_sheet_cache(sheet):
+                run_scheduled_archival(sheet)
+        except Exception as e:
+            logger.warning(f"⚠️ Fehler im Cache-Refresher: {e}")
+            record_refresh_failure()
+
+
+def start_cache_refresher():
+    """Startet den Refresh-Thread genau einmal pro Prozess (lazy, damit er nach dem gunicorn-Fork läuft)."""
+    global cache_refresher_thread
+    with cache_lock:
+        if cache_refresher_thread is not None and cache_refresher_thread.is_alive():
             return
-    
-    # Cache sperren und laden
+        cache_refresher_thread = threading.Thread(
+            target=cache_refresher_loop, name="sheet-cache-refresher", daemon=True)
+        cache_refresher_thread.start()
+
+
+def refresh_sheet_cache(sheet):
+    """Stellt sicher, dass ein Snapshot im Cache liegt - blockiert nur beim allerersten Laden.
+
+    Veraltete Daten werden sofort ausgeliefert (stale-while-revalidate); das
+    Nachladen übernimmt der Hintergrund-Thread.
+    """
+    if SHARED_CACHE_DIR:
+        sync_shared_writes()
+
+    if sheet_cache["data"] is not None:
+        if time.time() - sheet_cache["timestamp"] >= CACHE_DURATION:
+            CACHE_LOOKUPS.labels('stale').inc()
+            start_cache_refresher()
+            refresh_wakeup.set()
+        else:
+            CACHE_LOOKUPS.labels('hit').inc()
+        return
+
+    CACHE_LOOKUPS.labels('miss').inc()
+
+    # Kaltstart: genau ein Thread lädt, alle anderen warten auf dessen Ergebnis.
+    # Mit geteiltem Cache zuerst den Snapshot des Refresher-Workers versuchen.
+    if SHARED_CACHE_DIR and load_shared_snapshot():
+        start_cache_refresher()
+        return
+    if not load_sheet_snapshot(sheet):
+        with refresh_done:
+            refresh_done.wait_for(
+                lambda: sheet_cache["data"] is not None or not refresh_lock.locked(),
+                COLD_START_TIMEOUT)
+    start_cache_refresher()
+    if sheet_cache["data"] is None:
+        raise RuntimeError("Sheet-Cache konnte nicht geladen werden")
+
+
+def warm_up():
+    """Autorisiert, öffnet das Sheet und lädt den ersten Snapshot samt Indizes (blockierend)."""
+    started = time.perf_counter()
     try:
-        sheet_cache["lock"] = True
-        sheet_cache["last_refresh_attempt"] = current_time
-        sheet_cache["data"] = sheet.get_all_values()
-        sheet_cache["timestamp"] = current_time
-        print(f"✅ Cache aktualisiert (Zeit: {current_time})")
+        sheet = get_store()
+        if sheet is None:
+            raise RuntimeError("Sheet konnte nicht geöffnet werden")
+        refresh_sheet_cache(sheet)
     except Exception as e:
-        print(f"⚠️ Fehler beim Cache-Refresh: {e}")
-        # Bei Fehler: Cache nicht invalidieren, verwende alten Cache
+        startup_state["error"] = str(e)
+        logger.warning(f"⚠️ Warm-up fehlgeschlagen, der erste Request lädt nach: {e}")
+        return False
+    startup_state.update(warm_up_seconds=round(time.perf_counter() - started, 3), error=None)
+    logger.info(f"🔥 Worker {os.getpid()} aufgewärmt in {startup_state['warm_up_seconds']}s "
+                f"({len(sheet_cache['data'])} Zeilen im Cache)")
+    return True
+
+
+def start_warm_up(timeout=WARMUP_TIMEOUT):
+    """Führt warm_up() aus und wartet höchstens timeout Sekunden (gunicorn post_worker_init).
+
+    Dauert es länger, nimmt der Worker trotzdem Requests an (sonst beendet gunicorn ihn),
+    /health meldet aber erst 'ready', wenn der Cache gefüllt ist.
+    """
+    start_journal_applier()  # Nach einem Neustart liegengebliebene Journal-Einträge sofort nachholen
+    thread = threading.Thread(target=warm_up, name="worker-warm-up", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return sheet_cache["data"] is not None
+
+
+def iter_free_rows():
+    """Freie Zeilen (Spalten A-H leer) in aufsteigender Reihenfolge, danach die Zeilen hinter dem Sheet-Ende.
+
+    Muss unter cache_lock aufgerufen werden.
+    """
+    data = sheet_cache["data"]
+    for row_number in sheet_cache["indexes"]["empty_rows"]:
+        yield row_number
+    row_number = max(len(data) + 1, 2)
+    while True:
+        yield row_number
+        row_number += 1
+
+
+def is_row_free(row_number):
+    data = sheet_cache["data"]
+    return row_number > len(data) or row_number in sheet_cache["indexes"]["empty_rows"]
+
+
+@contextmanager
+def allocator_state_locked():
+    """Sperrt Zeilen-Reservierungen und Ticket-Zähler.
+
+    Mit SHARED_CACHE_DIR prozessübergreifend per flock() (Zustand in allocator.json),
+    sonst nur innerhalb des Prozesses.
+    """
+    with allocator_lock:
+        if not SHARED_CACHE_DIR:
+            yield allocator_state
+            return
+        with open(shared_path('allocator.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(shared_path('allocator.json'), encoding='utf-8') as f:
+                    state = json.load(f)
+            except (FileNotFoundError, ValueError):
+                state = {"reserved": {}, "last_ticket_ms": 0}
+            yield state
+            write_json_atomic(shared_path('allocator.json'), state)
+
+
+@timed_scan('reserve_rows')
+def reserve_rows(sheet, count=1):
+    """Reserviert atomar count freie Zeilen, damit parallele Webhooks nie dieselbe Zeile bekommen.
+
+    Eine Reservierung endet mit release_rows(), sobald die Zeile im Cache belegt ist
+    (Write-Through bzw. Write-Log der anderen Worker) oder spätestens nach ROW_RESERVATION_TTL Sekunden.
+    """
+    refresh_sheet_cache(sheet)
+    now = time.time()
+    with allocator_state_locked() as state:
+        if SHARED_CACHE_DIR:
+            sync_shared_writes()
+        with cache_lock:
+            reserved = {int(row_number): expiry for row_number, expiry in state["reserved"].items()
+                        if expiry > now and is_row_free(int(row_number))}
+            rows = []
+            for row_number in iter_free_rows():
+                if row_number in reserved:
+                    continue
+                rows.append(row_number)
+                reserved[row_number] = now + ROW_RESERVATION_TTL
+                if len(rows) == count:
+                    break
+        state["reserved"] = {str(row_number): expiry for row_number, expiry in reserved.items()}
+    return rows
+
+
+def release_rows(rows):
+    """Gibt reservierte Zeilen wieder frei - nach dem Schreiben sind sie im Cache belegt, nach einem Fehler wieder frei."""
+    if not rows:
+        return
+    with allocator_state_locked() as state:
+        for row_number in rows:
+            state["reserved"].pop(str(row_number), None)
+
+
+@contextmanager
+def reserved_rows(sheet, count=1):
+    """reserve_rows() für die Dauer eines Schreibvorgangs: die Reservierung hält, bis batch_write() zurückkehrt oder fehlschlägt.
+
+    Sonst könnte sie ablaufen, während batch_write() noch auf Quota oder Retries wartet,
+    und ein anderer Webhook bekäme dieselbe Zeile.
+    """
+    rows = reserve_rows(sheet, count) if count else []
+    try:
+        yield rows
     finally:
-        sheet_cache["lock"] = False
+        release_rows(rows)
+
+
+def next_tv_ticket():
+    """Monoton steigende, eindeutige TradingView-Tickets (TV_<Millisekunden>), auch bei mehreren Alerts pro Sekunde."""
+    with allocator_state_locked() as state:
+        ticket_ms = max(int(time.time() * 1000), state["last_ticket_ms"] + 1)
+        state["last_ticket_ms"] = ticket_ms
+    return f"TV_{ticket_ms}"
+
+
+class RowSet:
+    """Geordnete Menge von Zeilennummern mit schnellem Zugriff auf die erste Zeile.
+
+    Heap mit "lazy deletion": discard() entfernt nur aus der Menge, veraltete
+    Heap-Einträge werden erst in first() verworfen.
+    """
+
+    def __init__(self, largest_first=False):
+        self._sign = -1 if largest_first else 1
+        self._heap = []
+        self._members = set()
+
+    def add(self, row_number):
+        if row_number not in self._members:
+            self._members.add(row_number)
+            heapq.heappush(self._heap, self._sign * row_number)
+
+    def discard(self, row_number):
+        self._members.discard(row_number)
+
+    def first(self):
+        """Kleinste (bzw. größte) Zeile oder 0, wenn die Menge leer ist."""
+        while self._heap and self._sign * self._heap[0] not in self._members:
+            heapq.heappop(self._heap)
+        return self._sign * self._heap[0] if self._heap else 0
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, row_number):
+        return row_number in self._members
+
+    def __iter__(self):
+        return iter(sorted(self._members, reverse=self._sign < 0))
+
+
+def row_ticket(row):
+    return str(row[1]).strip() if len(row) > 1 else ''
+
+
+def row_symbol(row):
+    return row[3].strip().lower() if len(row) > 3 else ''
+
+
+def row_status(row):
+    return row[24].strip().upper() if len(row) > 24 else ''
+
+
+def row_day(row):
+    """Handelstag 'YYYY-MM-DD' aus Exit-Zeit (N), sonst Eröffnungszeit (A) - '' wenn nicht lesbar.
+
+    Nur String-Slicing statt strptime(), weil es beim Dekodieren für jede Zeile läuft.
+    """
+    for col_idx in (13, 0):
+        value = row[col_idx].strip()[:10] if len(row) > col_idx else ''
+        if (len(value) == 10 and value[4] in '.-/' and value[7] == value[4]
+                and (value[:4] + value[5:7] + value[8:]).isdigit()):
+            return sys.intern(f'{value[:4]}-{value[5:7]}-{value[8:]}')
+    return ''
+
+
+def broker_class(symbol):
+    return 'forex' if is_forex_symbol(symbol) else 'crypto'
+
+
+class TradeRow:
+    """Einmal pro Refresh dekodierte Sheet-Zeile für sheet_cache["data"].
+
+    Die Zellen liegen als ein einziger String (CELL_SEPARATOR-getrennt, ohne leere Zellen
+    am Ende) statt als Liste einzelner String-Objekte; Symbol/Side/Status/Tag sind internierte
+    Strings, TP/SL/Lots, Profit und die Balances (None = leer) bereits geparst - Requests und
+    Indizes müssen nichts mehr strippen oder parsen.
+    Beim Lesen verhält sich die Zeile wie die Zellen-Liste der API (len(), row[i], Iteration).
+    """
+
+    __slots__ = ('packed', 'width', 'ticket', 'symbol', 'side', 'status', 'tp', 'sl', 'lots',
+                 'is_free', 'balance_w', 'balance_x', 'profit', 'day')
+
+    def __init__(self, cells):
+        cells = list(cells)
+        while cells and cells[-1] == '':
+            cells.pop()
+        width = len(cells)
+        self.packed = CELL_SEPARATOR.join(cells)
+        self.width = width
+        self.ticket = row_ticket(cells)
+        self.symbol = sys.intern(row_symbol(cells))
+        self.side = sys.intern(cells[4].strip().upper()) if width > 4 else ''
+        self.status = sys.intern(row_status(cells))
+        self.tp = parse_decimal(cells[6]) if width > 6 else 0.0
+        self.sl = parse_decimal(cells[7]) if width > 7 else 0.0
+        self.lots = parse_decimal(cells[21]) if width > 21 else 0.0
+        self.is_free = not any(cell.strip() for cell in cells[:8])
+        self.balance_w = parse_decimal(cells[22]) if width > 22 and cells[22].strip() else None
+        self.balance_x = parse_decimal(cells[23]) if width > 23 and cells[23].strip() else None
+        self.profit = parse_decimal(cells[25]) if width > 25 and cells[25].strip() else None
+        self.day = row_day(cells)
+
+    def balance(self, balance_col):
+        """Geparste Balance in Spalte W oder X, None wenn die Zelle leer ist."""
+        return self.balance_w if balance_col == 'W' else self.balance_x
+
+    @property
+    def cells(self):
+        """Zellen als Liste (für Write-Through, Snapshots) - wird nur bei Bedarf entpackt."""
+        return self.packed.split(CELL_SEPARATOR) if self.width else []
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, index):
+        return self.cells[index]
 
+    def __iter__(self):
+        return iter(self.cells)
 
-def find_next_free_row(sheet):
+
+STATS_FIELDS = ('closed', 'with_profit', 'wins', 'losses', 'profit', 'gross_profit', 'gross_loss',
+                'closed_lots', 'open', 'open_long_lots', 'open_short_lots')
+(STATS_CLOSED, STATS_WITH_PROFIT, STATS_WINS, STATS_LOSSES, STATS_PROFIT, STATS_GROSS_PROFIT, STATS_GROSS_LOSS,
+ STATS_CLOSED_LOTS, STATS_OPEN, STATS_OPEN_LONG_LOTS, STATS_OPEN_SHORT_LOTS) = range(len(STATS_FIELDS))
+STATS_MAX_CACHED_QUERIES = 256  # Zwischengespeicherte /stats-Filterkombinationen pro Index-Stand
+
+
+class TradeStats:
+    """Kennzahlen je (Symbol, Tag), die index_row()/unindex_row() Zeile für Zeile mitführen.
+
+    Pro Schlüssel ein Zähler-Vektor (siehe STATS_FIELDS); Abfragen summieren nur die passenden
+    Schlüssel und werden bis zur nächsten Änderung pro Filter zwischengespeichert.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.version = 0
+        self.results = {}
+
+    def update(self, row, sign):
+        """Zählt eine Zeile hinzu (sign=1) bzw. wieder heraus (sign=-1).
+
+        EXECUTED = offene Position, jeder andere nicht offene Status = abgeschlossener Trade;
+        PENDING/OK-Signale und Zeilen ohne Symbol zählen nicht.
+        """
+        status = row.status
+        if not status or not row.symbol or status in ('PENDING', 'OK'):
+            return
+        key = (row.symbol, row.day)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [0.0] * len(STATS_FIELDS)
+        if status == 'EXECUTED':
+            bucket[STATS_OPEN] += sign
+            bucket[STATS_OPEN_LONG_LOTS if row.side == 'B' else STATS_OPEN_SHORT_LOTS] += sign * row.lots
+        else:
+            profit = row.profit
+            bucket[STATS_CLOSED] += sign
+            bucket[STATS_CLOSED_LOTS] += sign * row.lots
+            if profit is not None:
+                bucket[STATS_WITH_PROFIT] += sign
+                bucket[STATS_PROFIT] += sign * profit
+                if profit > 0:
+                    bucket[STATS_WINS] += sign
+                    bucket[STATS_GROSS_PROFIT] += sign * profit
+                elif profit < 0:
+                    bucket[STATS_LOSSES] += sign
+                    bucket[STATS_GROSS_LOSS] += sign * profit
+        if not bucket[STATS_CLOSED] and not bucket[STATS_OPEN]:
+            del self.buckets[key]
+        self.version += 1
+
+    def query(self, symbol='', broker='', day_from='', day_to=''):
+        """Summen für die Filter: gesamt, je Symbol und je Broker-Klasse."""
+        params = (symbol, broker, day_from, day_to)
+        cached = self.results.get(params)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        totals = [0.0] * len(STATS_FIELDS)
+        by_symbol = {}
+        by_broker = {}
+        for (bucket_symbol, day), bucket in self.buckets.items():
+            if symbol and bucket_symbol != symbol:
+                continue
+            if broker and broker_class(bucket_symbol) != broker:
+                continue
+            if (day_from or day_to) and not (day and day_from <= day and (not day_to or day <= day_to)):
+                continue
+            for target in (totals, by_symbol.setdefault(bucket_symbol, [0.0] * len(STATS_FIELDS)),
+                           by_broker.setdefault(broker_class(bucket_symbol), [0.0] * len(STATS_FIELDS))):
+                for idx, value in enumerate(bucket):
+                    target[idx] += value
+        result = {
+            "totals": summarize_stats(totals),
+            "by_symbol": {name: summarize_stats(vector) for name, vector in sorted(by_symbol.items())},
+            "by_broker": {name: summarize_stats(vector) for name, vector in sorted(by_broker.items())},
+        }
+        if len(self.results) >= STATS_MAX_CACHED_QUERIES:
+            self.results.clear()
+        self.results[params] = (self.version, result)
+        return result
+
+
+def summarize_stats(vector):
+    """Zähler-Vektor → Kennzahlen für /stats (Win-Rate nur über Trades mit eingetragenem Profit)."""
+    with_profit = vector[STATS_WITH_PROFIT]
+    gross_loss = -vector[STATS_GROSS_LOSS] or 0.0  # Ohne Verluste 0.0 statt -0.0
+    return {
+        "closed_trades": int(round(vector[STATS_CLOSED])),
+        "wins": int(round(vector[STATS_WINS])),
+        "losses": int(round(vector[STATS_LOSSES])),
+        "win_rate": round(vector[STATS_WINS] / with_profit, 4) if with_profit else None,
+        "profit": round(vector[STATS_PROFIT], 2),
+        "gross_profit": round(vector[STATS_GROSS_PROFIT], 2),
+        "gross_loss": round(gross_loss, 2),
+        "profit_factor": round(vector[STATS_GROSS_PROFIT] / gross_loss, 4) if gross_loss > 0.005 else None,
+        "closed_lots": round(vector[STATS_CLOSED_LOTS], 4),
+        "open_trades": int(round(vector[STATS_OPEN])),
+        "open_lots_long": round(vector[STATS_OPEN_LONG_LOTS], 4),
+        "open_lots_short": round(vector[STATS_OPEN_SHORT_LOTS], 4),
+    }
+
+
+CELL_SEPARATOR = '\x1f'  # ASCII Unit Separator - kommt in Sheet-Zellen nicht vor
+EMPTY_ROW = TradeRow(())  # Platzhalter für Lücken am Sheet-Ende
+
+
+def index_row(indexes, row_number, row):
+    """Trägt eine Zeile (TradeRow) in alle Sekundär-Indizes ein."""
+    ticket = row.ticket
+    # Erstes Vorkommen eines Tickets gewinnt (wie der frühere lineare Scan)
+    if ticket and indexes["tickets"].get(ticket, row_number) >= row_number:
+        indexes["tickets"][ticket] = row_number
+
+    if row_number < 2:
+        return  # Kopfzeile hat keinen Status
+
+    if row.is_free:
+        indexes["empty_rows"].add(row_number)
+
+    for balance_col in BALANCE_COLUMNS:
+        if row.balance(balance_col) is not None:
+            indexes["balances"][balance_col].add(row_number)
+
+    indexes["stats"].update(row, 1)
+    status = row.status
+    if status in OPEN_STATUSES:
+        indexes["open_rows"].add(row_number)
+    if status == 'OK':
+        indexes["pending_ok"][broker_class(row.symbol)].add(row_number)
+    elif status == 'EXECUTED':
+        symbol_rows = indexes["last_executed"].get(row.symbol)
+        if symbol_rows is None:
+            symbol_rows = indexes["last_executed"][row.symbol] = RowSet(largest_first=True)
+        symbol_rows.add(row_number)
+
+
+def unindex_row(indexes, row_number, row):
+    """Entfernt eine Zeile (mit ihrem bisherigen Inhalt) aus allen Sekundär-Indizes."""
+    ticket = row.ticket
+    if ticket and indexes["tickets"].get(ticket) == row_number:
+        del indexes["tickets"][ticket]
+
+    if row_number < 2:
+        return
+
+    indexes["empty_rows"].discard(row_number)
+    for balance_col in BALANCE_COLUMNS:
+        indexes["balances"][balance_col].discard(row_number)
+
+    indexes["stats"].update(row, -1)
+    status = row.status
+    indexes["open_rows"].discard(row_number)
+    if status == 'OK':
+        indexes["pending_ok"][broker_class(row.symbol)].discard(row_number)
+    elif status == 'EXECUTED':
+        symbol_rows = indexes["last_executed"].get(row.symbol)
+        if symbol_rows is not None:
+            symbol_rows.discard(row_number)
+            if not symbol_rows:
+                del indexes["last_executed"][row.symbol]
+
+
+@timed_scan('build_sheet_indexes')
+def build_sheet_indexes(data):
+    """Baut alle Indizes einmal pro Cache-Refresh auf.
+
+    - tickets: Ticket → Zeile (1-basiert)
+    - pending_ok: 'OK'-Zeilen je Broker-Klasse (forex/crypto), kleinste Zeile zuerst
+    - last_executed: Symbol → 'EXECUTED'-Zeilen, größte Zeile zuerst
+    - open_rows: Zeilen mit offenem Status (für den inkrementellen Refresh)
+    - empty_rows: Zeilen mit leeren Spalten A-H (freie Plätze für neue Trades)
+    - balances: je Balance-Spalte (W/X) die befüllten Zeilen, größte Zeile zuerst
+    - stats: P&L-/Exposure-Kennzahlen je (Symbol, Tag) für /stats
+    """
+    indexes = {
+        "tickets": {},
+        "open_rows": set(),
+        "empty_rows": RowSet(),
+        "pending_ok": {"forex": RowSet(), "crypto": RowSet()},
+        "last_executed": {},
+        "balances": {col: RowSet(largest_first=True) for col in BALANCE_COLUMNS},
+        "stats": TradeStats(),
+    }
+    for idx, row in enumerate(data):
+        index_row(indexes, idx + 1, row)
+    return indexes
+
+
+@timed_scan('find_ticket_row')
+def find_ticket_row(sheet, ticket):
+    """Gibt die Zeile eines Tickets zurück (0 = nicht vorhanden) - O(1) über den Index."""
     refresh_sheet_cache(sheet)
-    all_values = sheet_cache["data"]
-    for row_idx in range(1, len(all_values) + 100):
-        if row_idx >= len(all_values):
-            return row_idx + 1
-        row = all_values[row_idx]
-        if all((col_idx >= len(row) or row[col_idx].strip() == '') for col_idx in range(8)):
-            return row_idx + 1
-    return len(all_values) + 1
+    with cache_lock:
+        return sheet_cache["indexes"]["tickets"].get(str(ticket).strip(), 0)
 
 
-def get_existing_tickets(sheet):
+def find_ticket_api_row(sheet, ticket):
+    """Wie find_ticket_row(), aber als logische Zeilennummer für API-Antworten."""
     refresh_sheet_cache(sheet)
-    return [row[1] for row in sheet_cache["data"] if len(row) > 1 and row[1]]
+    with cache_lock:
+        return api_row(sheet_cache["indexes"]["tickets"].get(str(ticket).strip(), 0))
 
 
-def get_last_balance_cached():
-    try:
-        if sheet_cache["data"]:
-            for row in reversed(sheet_cache["data"]):
-                if len(row) > 22 and row[22]:
-                    return parse_decimal(row[22])
-                if len(row) > 23 and row[23]:
-                    return parse_decimal(row[23])
-    except Exception:
-        pass
-    return 0.0
+@timed_scan('find_next_ok_row')
+def find_next_ok_row(broker):
+    """Nächste 'OK'-Zeile für eine Broker-Klasse (ohne Broker: über beide Klassen)."""
+    with cache_lock:
+        pending_ok = sheet_cache["indexes"]["pending_ok"]
+        if broker in pending_ok:
+            return pending_ok[broker].first()
+        candidates = [rows.first() for rows in pending_ok.values() if rows]
+        return min(candidates) if candidates else 0
+
+
+def pending_ok_trades(broker):
+    """Antworten für alle 'OK'-Zeilen einer Broker-Klasse (für /events)."""
+    with cache_lock:
+        return [ok_trade_payload(row_number) for row_number in pending_ok_rows(broker)]
+
+
+def pending_ok_rows(broker):
+    """Alle 'OK'-Zeilen einer Broker-Klasse (ohne Broker: beide), kleinste zuerst."""
+    with cache_lock:
+        pending_ok = sheet_cache["indexes"]["pending_ok"]
+        if broker in pending_ok:
+            return list(pending_ok[broker])
+        return sorted(row for rows in pending_ok.values() for row in rows)
+
+
+def next_ok_trade(broker):
+    """Antwort für die nächste 'OK'-Zeile (None = keine) - Zeile und Inhalt aus demselben Snapshot."""
+    with cache_lock:
+        row_number = find_next_ok_row(broker)
+        return ok_trade_payload(row_number) if row_number else None
+
+
+def wait_for_ok_trade(broker, timeout):
+    """Blockiert, bis ein 'OK'-Trade für den Broker vorliegt (oder timeout abläuft)."""
+    with signal_condition:
+        signal_state["waiters"] += 1
+        refresh_wakeup.set()  # Refresh-Takt sofort auf Long-Poll-Betrieb umstellen
+        try:
+            row_number = signal_condition.wait_for(lambda: find_next_ok_row(broker), timeout)
+            return ok_trade_payload(row_number) if row_number else None
+        finally:
+            signal_state["waiters"] -= 1
+
+
+@timed_scan('find_last_executed_row')
+def find_last_executed_row(symbol):
+    with cache_lock:
+        symbol_rows = sheet_cache["indexes"]["last_executed"].get(symbol)
+        return symbol_rows.first() if symbol_rows else 0
+
+
+def get_last_balance_cached(balance_col):
+    """Letzte Balance einer Spalte (W oder X) - O(1) über den Balance-Index statt Rückwärts-Scan."""
+    with cache_lock:
+        indexes = sheet_cache["indexes"]
+        if indexes is None:
+            return 0.0
+        row_number = indexes["balances"][balance_col].first()
+        return sheet_cache["data"][row_number - 1].balance(balance_col) if row_number else 0.0
+
+
+def replay_local_writes(snapshot_time):
+    """Spielt eigene Schreibzugriffe, die während des Downloads passiert sind, erneut ein.
+
+    Ein Snapshot, der vor einem Schreibzugriff gestartet wurde, kennt diesen
+    noch nicht. Das erneute Anwenden ist idempotent (gleiche Zellwerte).
+    """
+    recent_writes = [(t, u) for t, u in sheet_cache["local_writes"] if t >= snapshot_time]
+    sheet_cache["local_writes"] = recent_writes
+    for _, updates in recent_writes:
+        apply_updates_to_cache(updates)
 
 
 def invalidate_cache():
     """Invalidiert den Cache - wird nur bei kritischen Updates aufgerufen."""
     # Cache nicht komplett löschen, sondern nur Timestamp zurücksetzen
-    # So kann der alte Cache noch verwendet werden, bis er automatisch erneuert wird
+    # So kann der alte Cache noch verwendet werden, bis der Hintergrund-Thread ihn erneuert hat
     sheet_cache["timestamp"] = 0
+    refresh_wakeup.set()
+
 
+def iter_update_cells(updates):
+    """Zerlegt (Bereich, Werte)-Updates in einzelne Zellen: (Zeile 1-basiert, Spalte 0-basiert, Wert)."""
+    for cell, values in updates:
+        start_row, start_col = a1_to_rowcol(cell.split(':')[0])
+        for row_offset, row_values in enumerate(values):
+            for col_offset, value in enumerate(row_values):
+                yield start_row + row_offset, start_col - 1 + col_offset, value
 
+
+def apply_updates_to_cache(updates):
+    """Write-Through: überträgt eigene Schreibzugriffe direkt in sheet_cache und die Indizes.
+
+    Damit sind neue Zeilen, Statuswechsel, Ticket-Überschreibungen und Balance-Zellen
+    sofort sichtbar, ohne auf den nächsten get_all_values() zu warten.
+    """
+    data = sheet_cache["data"]
+    indexes = sheet_cache["indexes"]
+    if data is None or indexes is None:
+        return
+    changed_rows = {}
+    for row_number, col_idx, value in iter_update_cells(updates):
+        row = changed_rows.get(row_number)
+        if row is None:
+            row = list(data[row_number - 1]) if row_number <= len(data) else []
+            changed_rows[row_number] = row
+        if len(row) <= col_idx:
+            row.extend([''] * (col_idx + 1 - len(row)))
+        row[col_idx] = str(value)
+
+    for row_number, cells in changed_rows.items():
+        while len(data) < row_number:
+            data.append(EMPTY_ROW)
+            index_row(indexes, len(data), EMPTY_ROW)
+        new_row = TradeRow(cells)
+        unindex_row(indexes, row_number, data[row_number - 1])
+        index_row(indexes, row_number, new_row)
+        data[row_number - 1] = new_row
+    signal_condition.notify_all()
+
+
+def batch_write(sheet, updates, priority=WRITE_PRIORITY_SIGNAL):
+    """Schreibt alle gesammelten Zellen/Bereiche mit einem einzigen batch_update-Call.
+
+    updates ist eine Liste von (Bereich, Werte)-Tupeln, z.B. ('Y5', [['OK']]) oder
+    ('A5:H5', [[...]]). Nicht zusammenhängende Spalten (V/Y/W/X) sind erlaubt.
+    priority (WRITE_PRIORITY_*) bestimmt die Reihenfolge, wenn das Sheets-Quota knapp ist.
+    """
+    if not updates:
+        return
+    payload = [{'range': cell, 'values': values} for cell, values in updates]
+    with sheets_call(STORAGE_BACKEND, 'batch_update'):
+        if isinstance(sheet, QuotaAwareWorksheet):
+            sheet.batch_update(payload, priority=priority)
+        else:
+            sheet.batch_update(payload)
+    write_time = time.time()
+    with cache_lock:
+        sheet_cache["local_writes"].append((write_time, updates))
+        apply_updates_to_cache(updates)
+    if SHARED_CACHE_DIR:
+        try:
+            append_shared_write(updates, write_time)
+        except Exception as e:
+            logger.warning(f"⚠️ Fehler beim Schreiben des geteilten Write-Logs: {e}")
+
+
+@functools.lru_cache(maxsize=1024)
 def balance_column_for_symbol(symbol):
     symbol_lower = (symbol or '').lower()
     return 'W' if any(x in symbol_lower for x in ['btc', 'eth', 'usd']) else 'X'
 
 
+def cached_row_symbol(row_number):
+    """Symbol (Spalte D) einer Zeile aus dem Cache statt sheet.cell() - spart API-Call!"""
+    with cache_lock:
+        data = sheet_cache["data"]
+        if 0 < row_number <= len(data):
+            return data[row_number - 1].symbol
+    return ''
+
+
+# Zell-Layouts der einzelnen Aktionen - gemeinsam genutzt von den Einzel-Endpunkten und /bulk
+
+def entry_updates(row, data):
+    """Neuer Trade vom MT5-EA (Standard-POST)."""
+    symbol = str(data.get('symbol', '')).lower()
+    balance_col = balance_column_for_symbol(symbol)
+    return [
+        (f'A{row}:H{row}', [[
+            data.get('timestamp', ''),
+            str(data.get('ticket', '')),
+            '',
+            symbol,
+            str(data.get('side', '')).upper(),
+            format_decimal(data.get('entry_price', '')),
+            format_decimal(data.get('tp', '')),
+            format_decimal(data.get('sl', ''))
+        ]]),
+        (f'V{row}', [[format_decimal(data.get('lots', data.get('balance', '')))]]),
+        (f'Y{row}', [['EXECUTED']]),
+        (f'{balance_col}{row + 1}', [[format_decimal(data.get('balance', ''))]]),
+    ]
+
+
+def manual_trade_updates(row, data):
+    """Manuell im Terminal eröffneter Trade (add_manual_trade)."""
+    timestamp = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
+    return [
+        (f'A{row}:H{row}', [[
+            timestamp,
+            str(data.get('ticket', '')),
+            '',
+            str(data.get('symbol', '')).lower(),
+            str(data.get('side', '')).upper(),
+            format_decimal(data.get('price', '')),
+            '',
+            ''
+        ]]),
+        (f'V{row}', [[format_decimal(data.get('volume', ''))]]),
+        (f'Y{row}', [['EXECUTED']]),
+        # Balance wird später vom EA aktualisiert, wenn Trade geschlossen wird
+    ]
+
+
+def mark_executed_updates(row, ticket):
+    """Status setzen und Ticket überschreiben (überschreibt auch TV_... Tickets)."""
+    updates = [(f'Y{row}', [['EXECUTED']])]
+    if ticket:
+        updates.append((f'B{row}', [[ticket]]))
+    return updates
+
+
+def trade_result_updates(row, symbol, data):
+    """Ergebnis eines geschlossenen Trades (update_trade_result)."""
+    updates = []
+    exit_time = data.get('exitTime', '')
+    if exit_time:
+        updates.append((f'N{row}', [[exit_time]]))
+    updates.append((f'Y{row}', [[data.get('exitReason', 'CLOSED') or 'CLOSED']]))
+    balance_col = balance_column_for_symbol(symbol)
+    updates.append((f'{balance_col}{row + 1}', [[format_decimal(data.get('balance', ''))]]))
+    return updates
+
+
+def tradingview_updates(row, ticket, data, timestamp):
+    """Neues TradingView-Signal (Status PENDING, Balance der Vorzeile fortgeschrieben)."""
+    symbol = str(data.get('symbol', '')).lower()
+    balance_col = balance_column_for_symbol(symbol)
+    return [
+        (f'A{row}:H{row}', [[
+            timestamp,
+            ticket,
+            '',
+            symbol,
+            str(data.get('side', '')).upper(),
+            format_decimal(data.get('entry', '')),
+            format_decimal(data.get('tp', '')),
+            format_decimal(data.get('sl', ''))
+        ]]),
+        (f'V{row}', [['']]),
+        (f'Y{row}', [['PENDING']]),
+        (f'{balance_col}{row + 1}', [[format_decimal(get_last_balance_cached(balance_col))]]),
+    ]
+
+
+def close_updates(row, symbol, data):
+    """Trade per Ticket schließen (PUT)."""
+    balance_col = balance_column_for_symbol(symbol)
+    return [
+        (f'N{row}', [[data.get('exit_time', '')]]),
+        (f'P{row}', [[format_decimal(data.get('exit_price', ''))]]),
+        (f'Y{row}', [['CLOSED']]),
+        (f'Z{row}', [[format_decimal(data.get('profit', ''))]]),
+        (f'{balance_col}{row + 1}', [[format_decimal(data.get('balance', ''))]]),
+    ]
+
+
+def ticket_in_cache(ticket):
+    """Ticket im Cache (ohne Refresh - der Journal-Modus macht im Request keinen Sheets-I/O)."""
+    with cache_lock:
+        indexes = sheet_cache["indexes"]
+        return bool(indexes and indexes["tickets"].get(str(ticket).strip()))
+
+
+def journal_ticket_pending(ticket):
+    """True, wenn dieser Prozess das Ticket bereits angenommen hat und es noch nicht im Cache ist."""
+    cutoff = time.time() - JOURNAL_PENDING_TTL
+    with journal_lock:
+        pending = journal_state["pending"]
+        while pending and next(iter(pending.values())) < cutoff:
+            pending.popitem(last=False)
+        return str(ticket).strip() in pending
+
+
+def append_journal_entry(route, ticket, data):
+    """Hängt einen angenommenen Webhook an das Journal an (flock + fsync), bevor 202 zurückgeht."""
+    entry = json.dumps({"t": time.time(), "route": route, "ticket": str(ticket).strip(), "data": data},
+                       ensure_ascii=False).encode('utf-8') + b'\n'
+    with open(JOURNAL_PATH + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        with open(JOURNAL_PATH, 'a+b') as f:
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    entry = b'\n' + entry  # Rest eines beim Absturz abgebrochenen Eintrags abschließen
+            f.write(entry)
+            f.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(f.fileno())
+    with journal_lock:
+        journal_state["pending"][str(ticket).strip()] = time.time()
+    start_journal_applier()
+    journal_wakeup.set()
+
+
+def read_journal_offset():
+    """Gesicherte Journal-Position; hinter dem Dateiende (Absturz beim Leeren) heißt: von vorne."""
+    try:
+        with open(JOURNAL_PATH + '.offset', encoding='utf-8') as f:
+            offset = json.load(f)["offset"]
+    except (FileNotFoundError, ValueError):
+        return 0
+    try:
+        size = os.path.getsize(JOURNAL_PATH)
+    except FileNotFoundError:
+        size = 0
+    if offset > size:
+        logger.warning(f"⚠️ Journal-Position {offset} hinter dem Dateiende ({size} Bytes) - beginne von vorne")
+        return 0
+    return offset
+
+
+def write_journal_offset(offset):
+    write_json_atomic(JOURNAL_PATH + '.offset', {"offset": offset})
+
+
+def read_journal_entries(offset, limit):
+    """Bis zu limit vollständige Einträge ab Byte-Position offset: [(Eintrag, Position danach)]."""
+    entries = []
+    try:
+        with open(JOURNAL_PATH, 'rb') as f:
+            if offset > os.fstat(f.fileno()).st_size:
+                offset = 0  # Journal wurde inzwischen geleert
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Eintrag wird gerade geschrieben
+                offset += len(line)
+                try:
+                    entries.append((json.loads(line), offset))
+                except ValueError:
+                    if line.strip():
+                        logger.error(f"❌ Journal: unlesbarer Eintrag übersprungen: {line[:200]!r}")
+                if len(entries) >= limit:
+                    break
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def journal_backlog():
+    """Anzahl angenommener, noch nicht angewendeter Journal-Einträge."""
+    try:
+        with open(JOURNAL_PATH, 'rb') as f:
+            f.seek(read_journal_offset())
+            backlog = f.read().count(b'\n')
+    except FileNotFoundError:
+        backlog = 0
+    JOURNAL_BACKLOG.set(backlog)
+    return backlog
+
+
+def compact_journal(offset):
+    """Leert das Journal, sobald alles angewendet ist (unter flock, damit kein Eintrag verloren geht).
+
+    Erst die Position auf 0 setzen, dann kürzen: stürzt der Prozess dazwischen ab, werden die
+    Einträge erneut gelesen und als bereits vorhandene Tickets übersprungen - nichts geht verloren.
+    """
+    with open(JOURNAL_PATH + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.path.getsize(JOURNAL_PATH) != offset:
+                return offset
+        except FileNotFoundError:
+            return offset
+        write_journal_offset(0)
+        os.truncate(JOURNAL_PATH, 0)
+        return 0
+
+
+def apply_journal_entries(sheet, entries):
+    """Schreibt angenommene Webhooks in Journal-Reihenfolge mit einem batch_update ins Sheet.
+
+    Bereits vorhandene Tickets werden übersprungen - nach einem Absturz zwischen Schreiben
+    und Sichern der Journal-Position wird so nichts doppelt angelegt.
+    """
+    refresh_sheet_cache(sheet)
+    new_entries = []
+    seen = set()
+    for entry, _ in entries:
+        ticket = entry["ticket"]
+        if ticket in seen or ticket_in_cache(ticket):
+            logger.warning(f"⚠️ Journal: Ticket {ticket} bereits im Sheet - übersprungen")
+            continue
+        seen.add(ticket)
+        new_entries.append(entry)
+    if not new_entries:
+        return
+
+    with stable_row_numbers() if ARCHIVE_AFTER_DAYS > 0 else nullcontext():
+        with reserved_rows(sheet, len(new_entries)) as rows:
+            updates = []
+            for row, entry in zip(rows, new_entries):
+                if entry["route"] == 'tradingview':
+                    updates.extend(tradingview_updates(row, entry["ticket"], entry["data"], entry["data"]["timestamp"]))
+                else:
+                    updates.extend(entry_updates(row, entry["data"]))
+            batch_write(sheet, updates)
+
+    now = time.time()
+    for entry in new_entries:
+        JOURNAL_APPLY_LAG.observe(now - entry["t"])
+    logger.info(f"📒 Journal: {len(new_entries)} Einträge ins Sheet geschrieben (Zeilen {rows[0]}-{rows[-1]})")
+
+
+def journal_applier_loop():
+    """Hintergrund-Thread: wendet das Journal in Reihenfolge an - per flock() nur in einem Prozess."""
+    failures = 0
+    while True:
+        try:
+            if journal_state["applier_fd"] is None:
+                fd = try_flock(JOURNAL_PATH + '.applier')
+                if fd is None:
+                    time.sleep(JOURNAL_POLL_INTERVAL)
+                    continue
+                journal_state["applier_fd"] = fd
+                logger.info(f"📒 Worker {os.getpid()} schreibt ab jetzt das Journal ins Sheet")
+
+            offset = read_journal_offset()
+            entries = read_journal_entries(offset, JOURNAL_BATCH_SIZE)
+            if not entries:
+                compact_journal(offset)
+                journal_backlog()
+                journal_wakeup.wait(JOURNAL_POLL_INTERVAL)
+                journal_wakeup.clear()
+                continue
+
+            sheet = get_store()
+            if sheet is None:
+                raise RuntimeError("Sheet konnte nicht geöffnet werden")
+            apply_journal_entries(sheet, entries)
+            write_journal_offset(entries[-1][1])
+            journal_backlog()
+            failures = 0
+        except Exception as e:
+            failures += 1
+            delay = backoff_delay(failures)
+            logger.warning(f"⚠️ Fehler beim Anwenden des Journals (neuer Versuch in {delay:.0f}s): {e}")
+            time.sleep(delay)
+
+
+def start_journal_applier():
+    """Startet den Journal-Thread genau einmal pro Prozess (lazy, nach dem gunicorn-Fork)."""
+    global journal_applier_thread
+    if INGEST_MODE != 'journal':
+        return
+    with journal_lock:
+        if journal_applier_thread is not None and journal_applier_thread.is_alive():
+            return
+        journal_applier_thread = threading.Thread(
+            target=journal_applier_loop, name="ingest-journal", daemon=True)
+        journal_applier_thread.start()
+
+
 @app.before_request
 def handle_method_override():
     if request.headers.get('X-HTTP-Method-Override') == 'PUT':
         request.environ['REQUEST_METHOD'] = 'PUT'
 
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        action = request.args.get('action')
+        if not action and request.method in ('POST', 'PUT'):
+            data = request.get_json(silent=True)
+            action = data.get('action') if isinstance(data, dict) else None
+        action = (action or '').lower()
+        if action not in METRIC_ACTIONS:
+            action = 'other' if action else 'default'
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.labels(route, request.method, action, response.status_code).observe(
+            time.perf_counter() - started)
+    return response
+
+
+def idempotency_key():
+    """(Schlüssel, TTL) eines POST/PUT: Idempotency-Key-Header, sonst kanonischer Payload-Hash."""
+    header = request.headers.get('Idempotency-Key', '').strip()
+    if header:
+        source, ttl = header.encode('utf-8'), IDEMPOTENCY_TTL
+    else:
+        body = request.get_data(cache=True)
+        try:
+            source = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':')).encode('utf-8')
+        except ValueError:
+            source = body + json.dumps(sorted(request.form.items())).encode('utf-8')
+        ttl = IDEMPOTENCY_HASH_TTL
+    digest = hashlib.sha256(f'{request.method} {request.path} {"key" if header else "hash"} '.encode('utf-8'))
+    digest.update(source)
+    return digest.hexdigest(), ttl
+
+
+def idempotency_file(key):
+    return shared_path(f'idempotency/{key}.json')
+
+
+def claim_shared_idempotency_key(key):
+    """Prozessübergreifend (SHARED_CACHE_DIR): gespeicherte Antwort, 'pending' oder None (= geclaimt)."""
+    path = idempotency_file(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (FileNotFoundError, ValueError):
+                time.sleep(0.01)  # Gerade im Entstehen/Löschen
+                continue
+            if entry["expires"] > time.time() and ("body" in entry or process_alive(entry.get("pid"))):
+                return entry if "body" in entry else 'pending'
+            try:
+                os.unlink(path)  # Abgelaufen oder Worker während der Verarbeitung gestorben
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"expires": time.time() + IDEMPOTENCY_PENDING_TTL, "pid": os.getpid()}, f)
+        return None
+
+
+def process_alive(pid):
+    """Läuft der Worker mit dieser PID noch? (Alle Worker teilen sich SHARED_CACHE_DIR auf demselben Host.)"""
+    if not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def claim_idempotency_key(key):
+    """Gibt eine gespeicherte Antwort zurück, wartet auf eine laufende Erstverarbeitung oder
+    reserviert den Schlüssel für diesen Request (Rückgabe None).
+
+    Läuft die Erstverarbeitung länger als IDEMPOTENCY_WAIT, wird 'pending' zurückgegeben.
+    Die Markierung der laufenden Verarbeitung läuft nicht ab - sie wird erst mit der
+    gespeicherten Antwort ersetzt oder im teardown freigegeben.
+    """
+    deadline = time.time() + IDEMPOTENCY_WAIT
+    while True:
+        now = time.time()
+        with idempotency_lock:
+            entry = idempotency_cache.get(key)
+            if entry is not None and "body" in entry and entry["expires"] <= now:
+                del idempotency_cache[key]
+                entry = None
+            if entry is None and now >= deadline:
+                return 'pending'  # Nach dem Warten nie selbst übernehmen - das wäre eine Doppelausführung
+            if entry is None:
+                shared_entry = claim_shared_idempotency_key(key) if SHARED_CACHE_DIR else None
+                if shared_entry is None:
+                    idempotency_cache[key] = {"event": threading.Event()}
+                    return None
+                if shared_entry != 'pending':
+                    return shared_entry
+                event = None  # Ein anderer Worker verarbeitet den Request
+            elif "body" in entry:
+                idempotency_cache.move_to_end(key)
+                return entry
+            else:
+                event = entry["event"]
+        if now >= deadline:
+            return 'pending'
+        if event is not None:
+            event.wait(deadline - now)
+        else:
+            time.sleep(0.05)
+
+
+def remember_idempotent_response(key, ttl, response):
+    entry = {"expires": time.time() + ttl, "status": response.status_code,
+             "body": response.get_data(as_text=True), "content_type": response.content_type}
+    with idempotency_lock:
+        pending = idempotency_cache.pop(key, None)
+        idempotency_cache[key] = entry
+        while len(idempotency_cache) > IDEMPOTENCY_MAX_ENTRIES:
+            idempotency_cache.popitem(last=False)
+    if SHARED_CACHE_DIR:
+        write_json_atomic(idempotency_file(key), entry)
+        prune_shared_idempotency_files()
+    if pending is not None and "event" in pending:
+        pending["event"].set()
+
+
+def release_idempotency_key(key):
+    """Fehlgeschlagene Verarbeitung: Schlüssel freigeben, damit eine Wiederholung erneut ausgeführt wird."""
+    with idempotency_lock:
+        pending = idempotency_cache.pop(key, None)
+    if SHARED_CACHE_DIR:
+        try:
+            os.unlink(idempotency_file(key))
+        except FileNotFoundError:
+            pass
+    if pending is not None and "event" in pending:
+        pending["event"].set()
+
+
+def prune_shared_idempotency_files():
+    """Löscht höchstens einmal pro IDEMPOTENCY_HASH_TTL abgelaufene Einträge aus dem geteilten Verzeichnis."""
+    now = time.time()
+    if now - idempotency_state["pruned_at"] < IDEMPOTENCY_HASH_TTL:
+        return
+    idempotency_state["pruned_at"] = now
+    directory = shared_path('idempotency')
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.stat(path).st_mtime < now - IDEMPOTENCY_TTL - IDEMPOTENCY_PENDING_TTL:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+@app.before_request
+def replay_idempotent_response():
+    """Beantwortet wiederholte POST/PUT-Webhooks aus dem Idempotenz-Cache, bevor das Sheet angefasst wird."""
+    if request.method not in ('POST', 'PUT'):
+        return None
+    key, ttl = idempotency_key()
+    entry = claim_idempotency_key(key)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if entry is None:
+        g.idempotency = (key, ttl)
+        return None
+    if entry == 'pending':
+        IDEMPOTENT_REPLAYS.labels(route, 'in_progress').inc()
+        logger.warning(f"⚠️ Wiederholung während laufender Verarbeitung ({request.path})")
+        return jsonify({"error": "Request wird bereits verarbeitet"}), 409
+    IDEMPOTENT_REPLAYS.labels(route, 'replayed').inc()
+    logger.info(f"♻️ Wiederholter Request ({request.path}) - gespeicherte Antwort zurückgegeben")
+    response = Response(entry["body"], status=entry["status"], content_type=entry["content_type"])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+@app.after_request
+def store_idempotent_response(response):
+    idempotency = g.pop('idempotency', None)
+    if idempotency is not None:
+        key, ttl = idempotency
+        if response.status_code >= 500 or response.is_streamed:
+            release_idempotency_key(key)  # Server-Fehler dürfen wiederholt werden
+        else:
+            try:
+                remember_idempotent_response(key, ttl, response)
+            except Exception as e:
+                logger.warning(f"⚠️ Fehler beim Speichern der Idempotenz-Antwort: {e}")
+                release_idempotency_key(key)
+    return response
+
+
+@app.teardown_request
+def release_unfinished_idempotency_key(exc):
+    idempotency = g.pop('idempotency', None)
+    if idempotency is not None:
+        release_idempotency_key(idempotency[0])
+
+
+def accepted_into_journal():
+    """Neue Signale/Entries, die im Journal-Modus nur ins Journal gehen und keine Zeilennummern brauchen."""
+    if INGEST_MODE != 'journal':
+        return False
+    if request.endpoint == 'tradingview_webhook':
+        return True
+    if request.endpoint != 'post_dispatch':
+        return False
+    data = get_json_from_request()
+    return isinstance(data, dict) and (data.get('action') or '').lower() not in ROW_ACTIONS
+
+
+@app.before_request
+def hold_row_numbers():
+    """Schreib-Requests halten die Zeilennummern fest, damit die Archivierung nicht dazwischen verschiebt.
+
+    Nicht für Journal-Annahmen - die 202 soll nicht auf eine laufende Archivierung warten,
+    apply_journal_entries() hält die Zeilennummern erst beim Schreiben ins Sheet fest.
+    """
+    if ARCHIVE_AFTER_DAYS <= 0 or request.method not in ('POST', 'PUT') or accepted_into_journal():
+        return
+    g.row_numbers = ExitStack()
+    g.row_numbers.enter_context(stable_row_numbers())
+
+
+@app.teardown_request
+def release_row_numbers(exc):
+    row_numbers = g.pop('row_numbers', None)
+    if row_numbers is not None:
+        row_numbers.close()
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Readiness-Check: 200 erst, wenn der Worker das Sheet geöffnet und den Cache gefüllt hat."""
+    if sheet_cache["data"] is None:
+        return jsonify({"status": "starting", "worker": os.getpid(), "error": startup_state["error"]}), 503
+    status = {
+        "status": "ready",
+        "worker": os.getpid(),
+        "warm_up_seconds": startup_state["warm_up_seconds"],
+        "cache_age": round(time.time() - sheet_cache["timestamp"], 1),
+        "cache_rows": len(sheet_cache["data"]),
+        "refresh_failures": sheet_cache["failures"],
+    }
+    if INGEST_MODE == 'journal':
+        status["journal_backlog"] = journal_backlog()
+    return jsonify(status), 200
+
+
+@app.route('/stats', methods=['GET'])
+def trade_stats():
+    """P&L, Win-Rate und offene Exposure aus dem Cache - Dashboards müssen das Sheet nicht mehr lesen.
+
+    Filter (optional): ?symbol=eurusd, ?broker=forex|crypto, ?from=YYYY-MM-DD, ?to=YYYY-MM-DD
+    oder ?days=N (die letzten N Tage inkl. heute). Tag = Exit-Datum (N), sonst Eröffnung (A).
+    Bereits archivierte Zeilen sind nicht enthalten.
+    """
+    symbol = (request.args.get('symbol') or '').strip().lower()
+    broker = (request.args.get('broker') or '').strip().lower()
+    if broker not in ('', 'forex', 'crypto'):
+        return jsonify({"error": "Ungültiger Broker"}), 400
+    try:
+        day_from = request.args.get('from') or ''
+        day_to = request.args.get('to') or ''
+        for day in (day_from, day_to):
+            if day:
+                datetime.strptime(day, '%Y-%m-%d')
+        if request.args.get('days'):
+            if day_from:
+                return jsonify({"error": "days und from schließen sich aus"}), 400
+            days = int(request.args['days'])
+            if days < 1:
+                raise ValueError(days)
+            day_from = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    except (ValueError, OverflowError):
+        return jsonify({"error": "Ungültiger Zeitraum (from/to: YYYY-MM-DD, days: Zahl ab 1)"}), 400
+
+    sheet = get_store()
+    if not sheet:
+        return jsonify({"error": "Sheet konnte nicht geöffnet werden"}), 500
+    refresh_sheet_cache(sheet)
+    with cache_lock:
+        stats = sheet_cache["indexes"]["stats"].query(symbol, broker, day_from, day_to)
+        cache_age = time.time() - sheet_cache["timestamp"]
+    return jsonify(dict(
+        stats,
+        filters={"symbol": symbol, "broker": broker, "from": day_from, "to": day_to},
+        balances={col: get_last_balance_cached(col) for col in BALANCE_COLUMNS},
+        cache_age=round(cache_age, 1),
+    )), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus-Endpunkt."""
+    if sheet_cache["data"] is not None:
+        CACHE_AGE.set(time.time() - sheet_cache["timestamp"])
+    if INGEST_MODE == 'journal':
+        journal_backlog()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+
+@functools.lru_cache(maxsize=1024)
 def is_forex_symbol(symbol):
     """Prüft ob ein Symbol ein Forex-Symbol ist (nicht Crypto)."""
     symbol_lower = (symbol or '').lower()
@@ -206,11 +2852,11 @@ def root():
     action = (request.args.get('action') or '').lower()
     broker = (request.args.get('broker') or '').lower()  # 'forex' oder 'crypto'
     
-    print(f"📥 GET Request empfangen - action: '{action}', broker: '{broker}'")
+    logger.debug("📥 GET Request empfangen - action: '%s', broker: '%s'", action, broker)
 
-    sheet = get_google_sheet()
+    sheet = get_store()
     if not sheet:
-        print("❌ Sheet konnte nicht geöffnet werden")
+        logger.error("❌ Sheet konnte nicht geöffnet werden")
         return jsonify({"error": "Sheet konnte nicht geöffnet werden"}), 500
 
     if action == 'check_ticket':
@@ -218,10 +2864,12 @@ def root():
         if not ticket:
             return jsonify({"error": "Ticket fehlt"}), 400
 
-        refresh_sheet_cache(sheet)
-        for idx, row in enumerate(sheet_cache["data"]):
-            if len(row) > 1 and str(row[1]).strip() == ticket:
-                return jsonify({"found": "true", "row": idx + 1})
+        row_number = find_ticket_api_row(sheet, ticket)
+        if row_number:
+            return jsonify({"found": "true", "row": row_number})
+        archived = find_archived_ticket(ticket)
+        if archived:
+            return jsonify({"found": "true", "row": archived[2], "archived": archived[0]})
         return jsonify({"found": "false"})
 
     if action == 'get_last_executed':
@@ -230,60 +2878,85 @@ def root():
             return jsonify({"error": "Symbol fehlt"}), 400
 
         refresh_sheet_cache(sheet)
-        # Suche rückwärts nach der letzten EXECUTED Zeile mit diesem Symbol
-        for idx in range(len(sheet_cache["data"]) - 1, 0, -1):
-            row = sheet_cache["data"][idx]
-            if len(row) > 3:
-                row_symbol = row[3].strip().lower()
-                row_status = row[24].strip().upper() if len(row) > 24 else ''
-                if row_symbol == symbol and row_status == 'EXECUTED':
-                    return jsonify({"row": idx + 1}), 200
-        return jsonify({"row": 0}), 200
-
-    # Standard: Suche nach nächstem "OK" Trade für den entsprechenden Broker
+        # Letzte EXECUTED Zeile mit diesem Symbol direkt aus dem Index
+        with cache_lock:
+            return jsonify({"row": api_row(find_last_executed_row(symbol))}), 200
+
+    # Standard: Nächster "OK" Trade für den entsprechenden Broker aus dem Index
+    # (Roboforex/'forex': nur Forex-Symbole, EasyMarkets/'crypto': nur Crypto-Symbole)
     refresh_sheet_cache(sheet)
-    all_values = sheet_cache["data"]
-    
-    print(f"🔍 Suche nach 'OK' Trades für Broker '{broker}' - {len(all_values)} Zeilen im Cache")
+    trade = next_ok_trade(broker)
 
-    for idx in range(1, len(all_values)):
-        row = all_values[idx]
-        status = row[24].strip().upper() if len(row) > 24 else ''
-        if status == 'OK':
-            symbol = row[3].strip().lower() if len(row) > 3 else ''
-            
-            print(f"  Zeile {idx + 1}: Status='{status}', Symbol='{symbol}'")
-            
-            # Broker-Filter: Nur passende Trades zurückgeben
-            if broker == 'forex':
-                # Roboforex: Nur Forex-Symbole
-                if not is_forex_symbol(symbol):
-                    print(f"    ⏭️ Übersprungen (Crypto-Symbol für Forex-Broker)")
-                    continue
-            elif broker == 'crypto':
-                # EasyMarkets: Nur Crypto-Symbole
-                if is_forex_symbol(symbol):
-                    print(f"    ⏭️ Übersprungen (Forex-Symbol für Crypto-Broker)")
-                    continue
-            
-            side = row[4].strip().upper() if len(row) > 4 else ''
-            tp = parse_decimal(row[6]) if len(row) > 6 else 0.0
-            sl = parse_decimal(row[7]) if len(row) > 7 else 0.0
-            lots = parse_decimal(row[21]) if len(row) > 21 else 0.0
-
-            print(f"✅ Trade gefunden: {side} {symbol} (Zeile {idx + 1})")
-            return jsonify({
-                "status": "OK",
-                "row": idx + 1,
-                "symbol": symbol,
-                "side": side,
-                "tp": tp,
-                "sl": sl,
-                "lots": lots
-            }), 200
-
-    print(f"⏳ Kein 'OK' Trade gefunden für Broker '{broker}' - Status: WAIT")
-    return jsonify({"status": "WAIT"}), 200
+    # Long-Poll: mit ?wait=<Sekunden> antwortet der Server, sobald ein Trade 'OK' wird
+    try:
+        wait = min(float(request.args.get('wait') or 0), LONG_POLL_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "Ungültiger wait-Wert"}), 400
+    if not trade and wait > 0 and signal_state["waiters"] < MAX_BLOCKING_WAITERS:
+        trade = wait_for_ok_trade(broker, wait)
+
+    if not trade:
+        logger.debug("⏳ Kein 'OK' Trade gefunden für Broker '%s' - Status: WAIT", broker)
+        return jsonify({"status": "WAIT"}), 200
+
+    logger.debug("✅ Trade gefunden: %s %s (Zeile %s)", trade['side'], trade['symbol'], trade['row'])
+    return jsonify(trade), 200
+
+
+def ok_trade_payload(row_number):
+    """Antwort für einen 'OK'-Trade (GET / und /events) - unter cache_lock aufrufen."""
+    row = sheet_cache["data"][row_number - 1]
+    return {
+        "status": "OK",
+        "row": api_row(row_number),
+        "symbol": row.symbol,
+        "side": row.side,
+        "tp": row.tp,
+        "sl": row.sl,
+        "lots": row.lots
+    }
+
+
+@app.route('/events', methods=['GET'])
+def signal_events():
+    """Server-Sent Events: sendet jeden neuen 'OK'-Trade für den Broker, sobald er auftaucht."""
+    broker = (request.args.get('broker') or '').lower()  # 'forex' oder 'crypto'
+    sheet = get_store()
+    if not sheet:
+        return jsonify({"error": "Sheet konnte nicht geöffnet werden"}), 500
+    refresh_sheet_cache(sheet)
+    if signal_state["waiters"] >= MAX_BLOCKING_WAITERS:
+        logger.warning(f"⚠️ SSE-Stream abgelehnt - bereits {signal_state['waiters']} wartende Verbindungen")
+        return jsonify({"error": "Zu viele offene Streams"}), 503
+    logger.info(f"📡 SSE-Stream geöffnet - broker: '{broker}'")
+
+    def stream():
+        sent_rows = set()
+        with signal_condition:
+            signal_state["waiters"] += 1
+            refresh_wakeup.set()
+        try:
+            while True:
+                trades = pending_ok_trades(broker)
+                # Zeilen, die nicht mehr 'OK' sind, dürfen später erneut gemeldet werden
+                sent_rows &= {trade["row"] for trade in trades}
+                for trade in trades:
+                    if trade["row"] not in sent_rows:
+                        sent_rows.add(trade["row"])
+                        yield f"event: signal\ndata: {json.dumps(trade)}\n\n"
+                with signal_condition:
+                    notified = signal_condition.wait_for(
+                        lambda: {api_row(row) for row in pending_ok_rows(broker)} - sent_rows,
+                        SSE_KEEPALIVE_INTERVAL)
+                if not notified:
+                    yield ": keepalive\n\n"
+        finally:
+            with signal_condition:
+                signal_state["waiters"] -= 1
+            logger.info(f"📡 SSE-Stream geschlossen - broker: '{broker}'")
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/tradingview', methods=['POST'])
@@ -293,60 +2966,41 @@ def tradingview_webhook():
         if not data:
             return jsonify({"error": "Keine JSON-Daten empfangen"}), 400
 
-        print(f"📊 TradingView Webhook empfangen: {data}")
+        logger.info(f"📊 TradingView Webhook empfangen: {data}")
 
-        sheet = get_google_sheet()
-        if not sheet:
-            return jsonify({"error": "Sheet konnte nicht geöffnet werden"}), 500
-
-        symbol = data.get('symbol', '').lower()
         side = data.get('side', '').upper()
         if side not in ['B', 'S']:
             return jsonify({"error": "Ungültiger Side-Wert"}), 400
 
-        entry = format_decimal(data.get('entry', ''))
-        tp = format_decimal(data.get('tp', ''))
-        sl = format_decimal(data.get('sl', ''))
-
-        ticket = f"TV_{int(time.time())}"
+        ticket = next_tv_ticket()
+        timestamp = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
 
-        existing_tickets = get_existing_tickets(sheet)
-        if ticket in existing_tickets:
-            print(f"⚠️ Duplikat: {ticket}")
-            return jsonify({"error": "Trade bereits vorhanden"}), 400
+        if INGEST_MODE == 'journal':
+            # Kein Sheets-I/O im Request: annehmen, ins Journal schreiben, später anwenden
+            append_journal_entry('tradingview', ticket, dict(data, timestamp=timestamp))
+            logger.info(f"📒 TradingView Signal {ticket} angenommen (Journal)")
+            return jsonify({"status": "ACCEPTED", "ticket": ticket}), 202
 
-        next_row = find_next_free_row(sheet)
-        print(f"📝 TradingView: schreibe in Zeile {next_row}")
+        sheet = get_store()
+        if not sheet:
+            return jsonify({"error": "Sheet konnte nicht geöffnet werden"}), 500
 
-        timestamp = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
+        if find_ticket_row(sheet, ticket):
+            logger.warning(f"⚠️ Duplikat: {ticket}")
+            return jsonify({"error": "Trade bereits vorhanden"}), 400
 
-        updates = [
-            (f'A{next_row}', [[timestamp]]),
-            (f'B{next_row}', [[ticket]]),
-            (f'C{next_row}', [['']]),
-            (f'D{next_row}', [[symbol]]),
-            (f'E{next_row}', [[side]]),
-            (f'F{next_row}', [[entry]]),
-            (f'G{next_row}', [[tp]]),
-            (f'H{next_row}', [[sl]]),
-            (f'V{next_row}', [['']]),
-            (f'Y{next_row}', [['PENDING']]),
-        ]
-        for cell, value in updates:
-            sheet.update(cell, value)
+        with reserved_rows(sheet) as (next_row,):
+            logger.info(f"📝 TradingView: schreibe in Zeile {next_row}")
 
-        balance = get_last_balance_cached()
-        balance_col = balance_column_for_symbol(symbol)
-        sheet.update(f'{balance_col}{next_row + 1}', [[format_decimal(balance)]])
+            # Alle Zellen in einem einzigen API-Call schreiben
+            batch_write(sheet, tradingview_updates(next_row, ticket, data, timestamp))
 
-        # Cache wird automatisch nach 30 Sekunden erneuert - kein invalidate_cache() nötig
-        print(f"✅ TradingView Signal {ticket} → Zeile {next_row}")
-        return jsonify({"status": "OK", "row": next_row, "ticket": ticket}), 200
+        # batch_write() aktualisiert den Cache direkt (Write-Through) - kein invalidate_cache() nötig
+        logger.info(f"✅ TradingView Signal {ticket} → Zeile {next_row}")
+        return jsonify({"status": "OK", "row": api_row(next_row), "ticket": ticket}), 200
 
     except Exception as e:
-        print(f"❌ Fehler in tradingview_webhook: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Fehler in tradingview_webhook: {e}")
         return jsonify({"error": str(e)}), 500
 
 
@@ -357,120 +3011,98 @@ def post_dispatch():
         if not data:
             return jsonify({"error": "Keine JSON-Daten empfangen"}), 400
 
-        print(f"📥 POST Request empfangen: {data}")
+        logger.info(f"📥 POST Request empfangen: {data}")
 
-        sheet = get_google_sheet()
+        action = (data.get('action') or '').lower()
+        logger.debug("🔍 Action: '%s'", action)
+
+        if INGEST_MODE == 'journal' and action not in ROW_ACTIONS:
+            # Entry ohne Sheets-I/O annehmen - ins Sheet schreibt journal_applier_loop()
+            ticket = str(data.get('ticket', ''))
+            if not ticket:
+                return jsonify({"error": "Kein Ticket angegeben"}), 400
+            if journal_ticket_pending(ticket) or ticket_in_cache(ticket) or find_archived_ticket(ticket):
+                logger.warning(f"⚠️ Duplikat: {ticket}")
+                return jsonify({"error": "Trade bereits vorhanden"}), 400
+            append_journal_entry('entry', ticket, data)
+            return jsonify({"ok": True, "accepted": True, "ticket": ticket}), 202
+
+        sheet = get_store()
         if not sheet:
             return jsonify({"error": "Sheet konnte nicht geöffnet werden"}), 500
 
-        action = (data.get('action') or '').lower()
-        print(f"🔍 Action: '{action}'")
-
         if action == 'mark_executed':
             row = int(data.get('row', 0))
             ticket = str(data.get('ticket', '')).strip()
-            print(f"📝 mark_executed: Zeile {row}, Ticket '{ticket}'")
+            logger.info(f"📝 mark_executed: Zeile {row}, Ticket '{ticket}'")
             if row <= 0:
-                print(f"❌ Ungültige Zeile: {row}")
+                logger.error(f"❌ Ungültige Zeile: {row}")
                 return jsonify({"error": "Ungültige Zeile"}), 400
+            row = sheet_row(row)
+            if not row:
+                return jsonify({"error": "Zeile wurde archiviert"}), 410
             if not ticket:
-                print(f"⚠️ WARNUNG: Kein Ticket angegeben für mark_executed (Zeile {row})")
+                logger.warning(f"⚠️ WARNUNG: Kein Ticket angegeben für mark_executed (Zeile {row})")
                 # Status trotzdem auf EXECUTED setzen
                 try:
-                    sheet.update(f'Y{row}', [['EXECUTED']])
-                    print(f"✅ Status auf EXECUTED gesetzt (Zeile {row}) - aber kein Ticket")
+                    batch_write(sheet, mark_executed_updates(row, ''), WRITE_PRIORITY_CRITICAL)
+                    logger.info(f"✅ Status auf EXECUTED gesetzt (Zeile {row}) - aber kein Ticket")
                     return jsonify({"ok": True, "warning": "Kein Ticket angegeben"}), 200
                 except Exception as e:
-                    print(f"❌ Fehler beim Update: {e}")
+                    logger.error(f"❌ Fehler beim Update: {e}")
                     return jsonify({"error": str(e)}), 500
             
             try:
-                # Erst Status setzen
-                sheet.update(f'Y{row}', [['EXECUTED']])
-                print(f"✅ Status auf EXECUTED gesetzt (Zeile {row})")
-                
-                # Dann Ticket überschreiben (überschreibt auch TV_... Tickets)
-                sheet.update(f'B{row}', [[ticket]])
-                print(f"✅ Ticket '{ticket}' in Spalte B, Zeile {row} geschrieben (überschreibt altes Ticket)")
+                # Status setzen und Ticket überschreiben (überschreibt auch TV_... Tickets) - ein API-Call
+                batch_write(sheet, mark_executed_updates(row, ticket), WRITE_PRIORITY_CRITICAL)
+                logger.info(f"✅ Status auf EXECUTED gesetzt (Zeile {row})")
+                logger.info(f"✅ Ticket '{ticket}' in Spalte B, Zeile {row} geschrieben (überschreibt altes Ticket)")
                 
                 return jsonify({"ok": True}), 200
             except Exception as e:
-                print(f"❌ Fehler beim Update: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception(f"❌ Fehler beim Update: {e}")
                 return jsonify({"error": str(e)}), 500
 
         if action == 'add_manual_trade':
             ticket = str(data.get('ticket', ''))
-            print(f"📝 add_manual_trade: Ticket {ticket}")
+            logger.info(f"📝 add_manual_trade: Ticket {ticket}")
             if not ticket:
-                print(f"❌ Kein Ticket angegeben")
+                logger.error(f"❌ Kein Ticket angegeben")
                 return jsonify({"error": "Kein Ticket"}), 400
 
-            existing = get_existing_tickets(sheet)
-            if ticket in existing:
-                print(f"⚠️ Duplikat: Ticket {ticket} bereits vorhanden")
+            if find_ticket_row(sheet, ticket) or find_archived_ticket(ticket):
+                logger.warning(f"⚠️ Duplikat: Ticket {ticket} bereits vorhanden")
                 return jsonify({"ok": True, "message": "Trade bereits vorhanden"}), 200
 
-            next_row = find_next_free_row(sheet)
-            print(f"📝 Schreibe manuellen Trade in Zeile {next_row}")
-            timestamp = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
-            symbol = str(data.get('symbol', '')).lower()
-            side = str(data.get('side', '')).upper()
-            price = format_decimal(data.get('price', ''))
-            volume = format_decimal(data.get('volume', ''))
-            
-            print(f"  Symbol: {symbol}, Side: {side}, Price: {price}, Volume: {volume}")
-
-            try:
-                sheet.update(f'A{next_row}:H{next_row}', [[
-                    timestamp,
-                    ticket,
-                    '',
-                    symbol,
-                    side,
-                    price,
-                    '',
-                    ''
-                ]])
-                sheet.update(f'V{next_row}', [[volume]])
-                sheet.update(f'Y{next_row}', [['EXECUTED']])
-                
-                # Balance wird später vom EA aktualisiert, wenn Trade geschlossen wird
+            with reserved_rows(sheet) as (next_row,):
+                logger.info(f"📝 Schreibe manuellen Trade in Zeile {next_row}")
+                symbol = str(data.get('symbol', '')).lower()
+                side = str(data.get('side', '')).upper()
+                price = format_decimal(data.get('price', ''))
+                volume = format_decimal(data.get('volume', ''))
                 
-                print(f"✅ Manueller Trade erfolgreich geschrieben (Zeile {next_row})")
-                return jsonify({"ok": True, "row": next_row}), 200
-            except Exception as e:
-                print(f"❌ Fehler beim Schreiben: {e}")
-                import traceback
-                traceback.print_exc()
-                return jsonify({"error": str(e)}), 500
+                logger.info(f"  Symbol: {symbol}, Side: {side}, Price: {price}, Volume: {volume}")
+
+                try:
+                    batch_write(sheet, manual_trade_updates(next_row, data))
+                    logger.info(f"✅ Manueller Trade erfolgreich geschrieben (Zeile {next_row})")
+                    return jsonify({"ok": True, "row": api_row(next_row)}), 200
+                except Exception as e:
+                    logger.exception(f"❌ Fehler beim Schreiben: {e}")
+                    return jsonify({"error": str(e)}), 500
 
         if action == 'update_trade_result':
             row = int(data.get('row', 0))
             if row <= 0:
                 return jsonify({"error": "Ungültige Zeile"}), 400
+            row = sheet_row(row)
+            if not row:
+                return jsonify({"error": "Zeile wurde archiviert"}), 410
 
-            exit_reason = data.get('exitReason', 'CLOSED') or 'CLOSED'
-            exit_time = data.get('exitTime', '')
-            balance = data.get('balance', '')
-
-            if exit_time:
-                sheet.update(f'N{row}', [[exit_time]])
-            sheet.update(f'Y{row}', [[exit_reason]])
-
-            # Symbol aus Cache holen statt sheet.cell() - spart API-Call!
             refresh_sheet_cache(sheet)
-            symbol_cell = ""
-            if row > 0 and row <= len(sheet_cache["data"]):
-                cache_row = sheet_cache["data"][row - 1]
-                if len(cache_row) > 3:
-                    symbol_cell = cache_row[3]
-            
-            balance_col = balance_column_for_symbol(symbol_cell)
-            sheet.update(f'{balance_col}{row + 1}', [[format_decimal(balance)]])
+            batch_write(sheet, trade_result_updates(row, cached_row_symbol(row), data),
+                        WRITE_PRIORITY_BOOKKEEPING)
 
-            # Cache wird automatisch nach 30 Sekunden erneuert
             return jsonify({"ok": True}), 200
 
         # Standard: MT5 sendet neuen Trade (Entry)
@@ -478,37 +3110,17 @@ def post_dispatch():
         if not ticket:
             return jsonify({"error": "Kein Ticket angegeben"}), 400
 
-        existing_tickets = get_existing_tickets(sheet)
-        if ticket in existing_tickets:
-            print(f"⚠️ Duplikat: {ticket}")
+        if find_ticket_row(sheet, ticket) or find_archived_ticket(ticket):
+            logger.warning(f"⚠️ Duplikat: {ticket}")
             return jsonify({"error": "Trade bereits vorhanden"}), 400
 
-        next_row = find_next_free_row(sheet)
-        symbol = str(data.get('symbol', '')).lower()
-
-        sheet.update(f'A{next_row}:H{next_row}', [[
-            data.get('timestamp', ''),
-            ticket,
-            '',
-            symbol,
-            str(data.get('side', '')).upper(),
-            format_decimal(data.get('entry_price', '')),
-            format_decimal(data.get('tp', '')),
-            format_decimal(data.get('sl', ''))
-        ]])
-        sheet.update(f'V{next_row}', [[format_decimal(data.get('lots', data.get('balance', '')))]])
-        sheet.update(f'Y{next_row}', [['EXECUTED']])
-
-        balance_col = balance_column_for_symbol(symbol)
-        sheet.update(f'{balance_col}{next_row + 1}', [[format_decimal(data.get('balance', ''))]])
+        with reserved_rows(sheet) as (next_row,):
+            batch_write(sheet, entry_updates(next_row, data))
 
-        # Cache wird automatisch nach 30 Sekunden erneuert
-        return jsonify({"ok": True, "row": next_row}), 200
+        return jsonify({"ok": True, "row": api_row(next_row)}), 200
 
     except Exception as e:
-        print(f"❌ Fehler in POST: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Fehler in POST: {e}")
         return jsonify({"error": str(e)}), 500
 
 
@@ -519,9 +3131,9 @@ def update_trade():
         if not data:
             return jsonify({"error": "Keine JSON-Daten empfangen"}), 400
 
-        print(f"PUT empfangen: {data}")
+        logger.info(f"PUT empfangen: {data}")
 
-        sheet = get_google_sheet()
+        sheet = get_store()
         if not sheet:
             return jsonify({"error": "Sheet konnte nicht geöffnet werden"}), 500
 
@@ -529,41 +3141,170 @@ def update_trade():
         if not ticket:
             return jsonify({"error": "Kein Ticket angegeben"}), 400
 
-        # Verwende Cache statt sheet.col_values() - spart API-Call!
-        refresh_sheet_cache(sheet)
-        row_index = 0
-        for idx, row in enumerate(sheet_cache["data"]):
-            if len(row) > 1 and str(row[1]).strip() == ticket:
-                row_index = idx + 1
-                break
-        
+        # Ticket-Index aus dem Cache statt sheet.col_values() - spart API-Call!
+        row_index = find_ticket_row(sheet, ticket)
+
         if row_index == 0:
+            archived = find_archived_ticket(ticket)
+            if archived:
+                close_archived_trade(sheet, archived, data)
+                return jsonify({"ok": True, "row": archived[2], "archived": archived[0]}), 200
             return jsonify({"error": f"Ticket {ticket} nicht gefunden"}), 404
 
-        sheet.update(f'N{row_index}', [[data.get('exit_time', '')]])
-        sheet.update(f'P{row_index}', [[format_decimal(data.get('exit_price', ''))]])
-        sheet.update(f'Y{row_index}', [['CLOSED']])
-        sheet.update(f'Z{row_index}', [[format_decimal(data.get('profit', ''))]])
+        batch_write(sheet, close_updates(row_index, cached_row_symbol(row_index), data),
+                    WRITE_PRIORITY_BOOKKEEPING)
+
+        return jsonify({"ok": True, "row": api_row(row_index)}), 200
+
+    except Exception as e:
+        logger.exception(f"❌ Fehler in UPDATE: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+def plan_bulk_operations(operations):
+    """Prüft und dedupliziert alle Operationen in einem Durchgang gegen den Cache.
+
+    Gibt (plan, results, new_rows) zurück: plan enthält (Index, Aktion, Daten, Ziel) für
+    gültige Operationen, results die Fehler/Duplikate je Index. Ziel ist eine Zeilennummer,
+    ('new', Index) für Trades, die erst in diesem Batch angelegt werden, oder der Archiv-Eintrag
+    (Blatt, Zeile, logische Zeile) für close auf einen archivierten Trade.
+    """
+    plan = []
+    results = {}
+    new_rows = 0
+    batch_tickets = {}  # Ticket -> Ziel für Tickets, die dieser Batch anlegt oder umschreibt
+    with cache_lock:
+        tickets = sheet_cache["indexes"]["tickets"]
+
+        def resolve(ticket):
+            return batch_tickets.get(ticket) or tickets.get(ticket, 0)
+
+        for idx, op in enumerate(operations):
+            if not isinstance(op, dict):
+                results[idx] = (400, {"error": "Operation ist kein Objekt"})
+                continue
+            action = (op.get('action') or 'entry').lower()
+            if action not in BULK_ACTIONS:
+                results[idx] = (400, {"error": f"Unbekannte Aktion '{action}'"})
+                continue
+            ticket = str(op.get('ticket', '')).strip()
+
+            if action in ('entry', 'add_manual_trade'):
+                if not ticket:
+                    results[idx] = (400, {"error": "Kein Ticket angegeben"})
+                elif resolve(ticket) or find_archived_ticket(ticket):
+                    if action == 'add_manual_trade':
+                        results[idx] = (200, {"ok": True, "message": "Trade bereits vorhanden"})
+                    else:
+                        results[idx] = (400, {"error": "Trade bereits vorhanden"})
+                else:
+                    batch_tickets[ticket] = ('new', idx)
+                    plan.append((idx, action, op, ('new', idx)))
+                    new_rows += 1
+                continue
+
+            if action == 'close':
+                if not ticket:
+                    results[idx] = (400, {"error": "Kein Ticket angegeben"})
+                    continue
+                target = resolve(ticket) or find_archived_ticket(ticket)
+                if not target:
+                    results[idx] = (404, {"error": f"Ticket {ticket} nicht gefunden"})
+                    continue
+                plan.append((idx, action, op, target))
+                continue
+
+            # mark_executed / update_trade_result adressieren die Zeile direkt
+            try:
+                row = int(op.get('row', 0))
+            except (TypeError, ValueError):
+                row = 0
+            if row <= 0:
+                results[idx] = (400, {"error": "Ungültige Zeile"})
+                continue
+            row = sheet_row(row)
+            if not row:
+                results[idx] = (410, {"error": "Zeile wurde archiviert"})
+                continue
+            if action == 'mark_executed' and ticket:
+                batch_tickets[ticket] = row
+            plan.append((idx, action, op, row))
+    return plan, results, new_rows
+
+
+@app.route('/bulk', methods=['POST'])
+def bulk_ingest():
+    """Mehrere Operationen (z.B. Nachholen nach einem EA-Reconnect) mit einem einzigen Schreibzugriff.
+
+    Body: {"operations": [{"action": "entry"|"add_manual_trade"|"mark_executed"|
+    "update_trade_result"|"close", ...}, ...]} - Felder wie bei den Einzel-Endpunkten
+    (entry = Standard-POST, close = PUT). Antwort: ein Ergebnis pro Operation in derselben Reihenfolge.
+    """
+    try:
+        data = get_json_from_request()
+        operations = data.get('operations') if isinstance(data, dict) else data
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "Keine Operationen empfangen"}), 400
+        if len(operations) > BULK_MAX_OPERATIONS:
+            return jsonify({"error": f"Maximal {BULK_MAX_OPERATIONS} Operationen pro Request"}), 400
 
-        # Symbol aus Cache holen statt sheet.cell() - spart API-Call!
-        symbol_cell = ""
-        if row_index > 0 and row_index <= len(sheet_cache["data"]):
-            row = sheet_cache["data"][row_index - 1]
-            if len(row) > 3:
-                symbol_cell = row[3]
-        
-        balance_col = balance_column_for_symbol(symbol_cell)
-        sheet.update(f'{balance_col}{row_index + 1}', [[format_decimal(data.get('balance', ''))]])
+        logger.info(f"📦 Bulk-Request empfangen: {len(operations)} Operationen")
 
-        # Cache wird automatisch nach 30 Sekunden erneuert
-        return jsonify({"ok": True, "row": row_index}), 200
+        sheet = get_store()
+        if not sheet:
+            return jsonify({"error": "Sheet konnte nicht geöffnet werden"}), 500
+
+        refresh_sheet_cache(sheet)
+        plan, results, new_rows = plan_bulk_operations(operations)
+
+        # Alle neuen Zeilen auf einmal reservieren, in der Reihenfolge der Operationen
+        with reserved_rows(sheet, new_rows) as rows:
+            reserved = iter(rows)
+            new_row_numbers = {}
+            new_row_symbols = {}
+            for idx, action, op, target in plan:
+                if target == ('new', idx):
+                    new_row_numbers[idx] = next(reserved)
+                    new_row_symbols[new_row_numbers[idx]] = str(op.get('symbol', '')).lower()
+
+            updates = []
+            for idx, action, op, target in plan:
+                if isinstance(target, tuple) and target[0] != 'new':
+                    close_archived_trade(sheet, target, op)
+                    results[idx] = (200, {"ok": True, "row": target[2], "archived": target[0]})
+                    continue
+                row = new_row_numbers[target[1]] if isinstance(target, tuple) else target
+                symbol = new_row_symbols.get(row)
+                if symbol is None:
+                    symbol = cached_row_symbol(row)
+                if action == 'entry':
+                    updates.extend(entry_updates(row, op))
+                elif action == 'add_manual_trade':
+                    updates.extend(manual_trade_updates(row, op))
+                elif action == 'mark_executed':
+                    updates.extend(mark_executed_updates(row, str(op.get('ticket', '')).strip()))
+                elif action == 'update_trade_result':
+                    updates.extend(trade_result_updates(row, symbol, op))
+                else:
+                    updates.extend(close_updates(row, symbol, op))
+                results[idx] = (200, {"ok": True, "row": api_row(row)})
+
+            # Alle Zellen aller Operationen in einem einzigen API-Call schreiben,
+            # mit der Priorität der wichtigsten enthaltenen Operation
+            priority = min((BULK_ACTIONS[action] for _, action, _, _ in plan), default=WRITE_PRIORITY_SIGNAL)
+            batch_write(sheet, updates, priority)
+
+        logger.info(f"✅ Bulk: {len(plan)} Operationen geschrieben, "
+                    f"{len(operations) - len(plan)} übersprungen ({len(updates)} Bereiche, 1 API-Call)")
+        return jsonify({"ok": True, "results": [
+            dict(body, status=status) for status, body in (results[idx] for idx in range(len(operations)))
+        ]}), 200
 
     except Exception as e:
-        print(f"❌ Fehler in UPDATE: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Fehler in BULK: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 if __name__ == '__main__':
+    start_warm_up()
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
@@ -0,0 +1,93 @@
+import copy
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+import main  # noqa: E402
+
+# Zustand von main.py direkt nach dem Import - wird vor jedem Test wiederhergestellt
+STATE_NAMES = ('sheet_cache', 'allocator_state', 'archive_state', 'journal_state', 'shared_state',
+               'idempotency_cache', 'signal_state')
+INITIAL_STATE = {name: copy.deepcopy(getattr(main, name)) for name in STATE_NAMES}
+
+HEADER = ['Zeit', 'Ticket', '', 'Symbol', 'Side', 'Entry', 'TP', 'SL'] + [''] * 13 + \
+         ['Lots', 'Balance W', 'Balance X', 'Status', 'Profit']
+
+
+def trade_row(ticket, symbol='eurusd', status='CLOSED'):
+    """Eine Sheet-Zeile (A-Z) wie sie der EA bzw. TradingView schreibt."""
+    return ['2026.01.01 10:00:00', str(ticket), '', symbol, 'B', '1,1', '1,2', '1,0'] + [''] * 13 + \
+           ['0,1', '', '100,5', status, '1,5']
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """Frischer MemoryStore (Kopfzeile + 10 geschlossene Trades) mit kaltem Cache."""
+    for name, value in INITIAL_STATE.items():
+        state = getattr(main, name)
+        state.clear()
+        state.update(copy.deepcopy(value))
+    monkeypatch.setattr(main, 'STORAGE_BACKEND', 'memory')
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', '')
+    monkeypatch.setattr(main, 'INGEST_MODE', 'sync')
+    monkeypatch.setattr(main, 'ARCHIVE_AFTER_DAYS', 0)
+    monkeypatch.setattr(main, 'JOURNAL_PATH', str(tmp_path / 'ingest.journal'))
+    memory_store = main.MemoryStore([HEADER] + [trade_row(1000 + n) for n in range(1, 11)])
+    monkeypatch.setattr(main, 'store_cache', memory_store)
+    return memory_store
+
+
+@pytest.fixture
+def client(store):
+    return main.app.test_client()
+
+
+def column(store, letter):
+    """Alle Werte einer Spalte des Speichers (ohne Kopfzeile)."""
+    idx = ord(letter) - ord('A')
+    return [row[idx] if len(row) > idx else '' for row in store.get_all_values()[1:]]
+
+
+def entry(ticket, **extra):
+    """Payload eines Standard-Entries vom MT5-EA."""
+    return dict({'ticket': ticket, 'symbol': 'eurusd', 'side': 'BUY', 'price': '1.1', 'volume': '0.1'}, **extra)
+
+
+def post_parallel(path, payloads):
+    """Schickt alle Payloads gleichzeitig (ein Test-Client pro Thread); Antworten in Payload-Reihenfolge."""
+    responses = [None] * len(payloads)
+    start = threading.Barrier(len(payloads))
+
+    def send(idx):
+        client = main.app.test_client()
+        start.wait()
+        responses[idx] = client.post(path, json=payloads[idx])
+
+    threads = [threading.Thread(target=send, args=(idx,)) for idx in range(len(payloads))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def new_tickets(store):
+    """Tickets der Zeilen nach den 10 Trades aus dem Fixture (leere Zeilen übersprungen)."""
+    return [ticket for ticket in column(store, 'B')[10:] if ticket]
+
+
+def count_calls(monkeypatch, store, name):
+    calls = []
+    original = getattr(store, name)
+
+    def counted(*args, **kwargs):
+        calls.append(1)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(store, name, counted)
+    return calls
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import main
+from conftest import entry, new_tickets, post_parallel
+
+
+def test_concurrent_entries_get_distinct_rows(store, client):
+    tickets = [f'C{n}' for n in range(30)]
+    responses = post_parallel('/', [entry(ticket) for ticket in tickets])
+
+    assert [r.status_code for r in responses] == [200] * 30
+    rows = [r.get_json()['row'] for r in responses]
+    assert sorted(rows) == list(range(12, 42))
+    assert sorted(new_tickets(store)) == sorted(tickets)
+    assert main.allocator_state['reserved'] == {}
+
+
+def test_concurrent_tradingview_signals_get_distinct_tickets(store, client):
+    payloads = [{'symbol': 'eurusd', 'side': 'B', 'entry': f'1.{n}', 'tp': '1.2', 'sl': '1.0'} for n in range(20)]
+    responses = post_parallel('/tradingview', payloads)
+
+    bodies = [r.get_json() for r in responses]
+    assert len({body['row'] for body in bodies}) == 20
+    assert len({body['ticket'] for body in bodies}) == 20
+    assert all(body['ticket'].startswith('TV_') for body in bodies)
+
+
+def test_empty_rows_are_filled_first(store, client):
+    store.batch_update([{'range': 'A5:Z5', 'values': [[''] * 26]}])
+
+    assert client.post('/', json=entry('E1')).get_json()['row'] == 5
+    assert client.post('/', json=entry('E2')).get_json()['row'] == 12
+
+
+def test_failed_write_releases_reserved_row(store, client, monkeypatch):
+    original = store.batch_update
+
+    def fail_once(data, **kwargs):
+        monkeypatch.setattr(store, 'batch_update', original)
+        raise RuntimeError('Sheets nicht erreichbar')
+
+    monkeypatch.setattr(store, 'batch_update', fail_once)
+    assert client.post('/', json=entry('F1')).status_code == 500
+    assert main.allocator_state['reserved'] == {}
+    assert client.post('/', json=entry('F2')).get_json()['row'] == 12
+
+
+def test_reservation_is_held_until_the_write_returns(store, client, monkeypatch):
+    original = store.batch_update
+    release = threading.Event()
+
+    def slow_write(data, **kwargs):
+        if any('S1' in str(value_range['values']) for value_range in data):
+            release.wait(5)
+        return original(data, **kwargs)
+
+    monkeypatch.setattr(store, 'batch_update', slow_write)
+    slow = threading.Thread(target=lambda: main.app.test_client().post('/', json=entry('S1')))
+    slow.start()
+    for _ in range(100):
+        if main.allocator_state['reserved']:
+            break
+        time.sleep(0.01)
+
+    assert client.post('/', json=entry('S2')).get_json()['row'] == 13
+    release.set()
+    slow.join()
+    assert new_tickets(store) == ['S1', 'S2']
+    assert main.allocator_state['reserved'] == {}
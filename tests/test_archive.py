@@ -0,0 +1,49 @@
+import pytest
+
+import main
+from conftest import column, entry
+
+
+@pytest.fixture
+def archived(store, monkeypatch):
+    """40 Zeilen wurden bereits archiviert: logische Zeile 42 liegt jetzt in Zeile 2 des Live-Blatts."""
+    monkeypatch.setattr(main, 'ARCHIVE_AFTER_DAYS', 30)
+    main.archive_state.update(offset=40, tickets={'950': ('Archiv 2026-01', 7, 12)}, loaded=True,
+                              next_run=float('inf'))
+    return store
+
+
+def test_row_numbers_map_across_archival(archived):
+    assert main.api_row(2) == 42
+    assert main.sheet_row(42) == 2
+    assert main.sheet_row(41) == 0
+    assert main.sheet_row(12) == 0
+    assert main.api_row(0) == 0
+
+
+def test_check_ticket_reports_logical_rows(archived, client):
+    assert client.get('/?action=check_ticket&ticket=1001').get_json() == {'found': 'true', 'row': 42}
+    assert client.get('/?action=check_ticket&ticket=950').get_json() == {
+        'found': 'true', 'row': 12, 'archived': 'Archiv 2026-01'}
+
+
+def test_writes_use_the_live_row(archived, client):
+    assert client.post('/', json={'action': 'mark_executed', 'row': 45, 'ticket': 'X45'}).status_code == 200
+    assert column(archived, 'B')[3] == 'X45'
+    assert column(archived, 'Y')[3] == 'EXECUTED'
+
+    assert client.post('/', json=entry('N1')).get_json() == {'ok': True, 'row': 52}
+    assert client.get('/?action=check_ticket&ticket=N1').get_json() == {'found': 'true', 'row': 52}
+
+
+def test_archived_rows_are_gone(archived, client):
+    assert client.post('/', json={'action': 'mark_executed', 'row': 12, 'ticket': 'X'}).status_code == 410
+    assert client.post('/', json={'action': 'update_trade_result', 'row': 30}).status_code == 410
+    assert client.post('/', json=entry('950')).status_code == 400
+    assert column(archived, 'B')[:10] == [str(1000 + n) for n in range(1, 11)]
+
+
+def test_archived_ticket_is_not_written_twice(archived, client):
+    response = client.post('/', json={'action': 'add_manual_trade', 'ticket': '950', 'symbol': 'eurusd'})
+    assert response.get_json()['message'] == 'Trade bereits vorhanden'
+    assert '950' not in column(archived, 'B')
@@ -0,0 +1,48 @@
+import main
+from conftest import column
+
+
+def balances():
+    return {col: main.get_last_balance_cached(col) for col in main.BALANCE_COLUMNS}
+
+
+def test_latest_balance_per_column(client, store):
+    store.batch_update([{'range': 'X10', 'values': [['90']]}, {'range': 'W4', 'values': [['1.000,25']]}])
+    client.get('/?action=check_ticket&ticket=1001')
+
+    assert balances() == {'W': 1000.25, 'X': 100.5}
+
+
+def test_empty_columns_report_zero(client, store):
+    client.get('/?action=check_ticket&ticket=1001')
+
+    assert balances()['W'] == 0.0
+
+
+def test_writes_only_move_their_own_column(client, store):
+    client.post('/', json={'ticket': 'B1', 'symbol': 'eurusd', 'side': 'B', 'balance': '250'})  # usd → W
+
+    assert balances() == {'W': 250.0, 'X': 100.5}
+
+
+def test_higher_rows_win_and_cleared_cells_fall_back(client, store):
+    store.batch_update([{'range': 'X10', 'values': [['90']]}])
+    client.get('/?action=check_ticket&ticket=1001')
+
+    main.batch_write(store, [('X5', [['50']])])
+    assert balances()['X'] == 100.5
+    main.batch_write(store, [('X11', [['']])])
+    assert balances()['X'] == 90.0
+
+
+def test_tradingview_signal_carries_the_balance_of_its_column(client, store):
+    row = client.post('/tradingview', json={'symbol': 'eurgbp', 'side': 'B'}).get_json()['row']
+
+    assert column(store, 'X')[row - 1] == '100,5'  # row + 1 ohne Kopfzeile
+    assert column(store, 'W')[row - 1] == ''
+
+
+def test_stats_reports_both_columns(client, store):
+    client.post('/', json={'ticket': 'B1', 'symbol': 'btcusd', 'side': 'B', 'balance': '12,5'})
+
+    assert client.get('/stats').get_json()['balances'] == {'W': 12.5, 'X': 100.5}
@@ -0,0 +1,68 @@
+import main
+from conftest import column, count_calls, entry, new_tickets
+
+
+def bulk(client, *operations):
+    response = client.post('/bulk', json={'operations': list(operations)})
+    assert response.status_code == 200
+    return [(result.pop('status'), result) for result in response.get_json()['results']]
+
+
+def close(ticket, **extra):
+    return dict({'action': 'close', 'ticket': ticket, 'exit_time': '2026.01.02 10:00:00', 'profit': '2.5'}, **extra)
+
+
+def test_all_operations_in_one_batch_update(client, store, monkeypatch):
+    client.get('/?action=check_ticket&ticket=1001')
+    writes = count_calls(monkeypatch, store, 'batch_update')
+
+    results = bulk(client, entry('B1'), entry('B2'), close('1003'),
+                   {'action': 'update_trade_result', 'row': 5, 'profit': '1.0'})
+
+    assert [status for status, _ in results] == [200] * 4
+    assert len(writes) == 1
+    assert new_tickets(store) == ['B1', 'B2']
+
+
+def test_entry_and_close_of_the_same_ticket(client, store):
+    (_, opened), (_, closed) = bulk(client, entry('B1'), close('B1'))
+
+    assert opened == closed == {'ok': True, 'row': 12}
+    assert column(store, 'Y')[10] == 'CLOSED' and column(store, 'Z')[10] == '2,5'
+
+
+def test_close_after_mark_executed_renames_the_ticket(client, store):
+    (_, executed), (_, closed) = bulk(client, {'action': 'mark_executed', 'row': 3, 'ticket': 'B1-EXE'},
+                                      close('B1-EXE', profit='-1'))
+
+    assert executed == closed == {'ok': True, 'row': 3}
+    assert column(store, 'B')[1] == 'B1-EXE' and column(store, 'Z')[1] == '-1'
+
+
+def test_duplicates_in_one_batch(client, store):
+    results = bulk(client, entry('B1'), entry('B1'), entry('1001'))
+
+    assert [status for status, _ in results] == [200, 400, 400]
+    assert new_tickets(store) == ['B1']
+
+
+def test_add_manual_trade_for_existing_ticket_is_ok(client, store):
+    results = bulk(client, {'action': 'add_manual_trade', 'ticket': '1001', 'symbol': 'eurusd'})
+
+    assert results == [(200, {'ok': True, 'message': 'Trade bereits vorhanden'})]
+    assert new_tickets(store) == []
+
+
+def test_invalid_operations_are_reported_per_item(client, store):
+    results = bulk(client, 'entry', {'action': 'delete', 'ticket': '1001'}, {'symbol': 'eurusd'},
+                   {'action': 'mark_executed', 'row': 'x'}, close('404'), entry('B1'))
+
+    assert [status for status, _ in results] == [400, 400, 400, 400, 404, 200]
+    assert new_tickets(store) == ['B1']
+
+
+def test_rejects_empty_and_oversized_requests(client, monkeypatch):
+    monkeypatch.setattr(main, 'BULK_MAX_OPERATIONS', 2)
+
+    assert client.post('/bulk', json={'operations': []}).status_code == 400
+    assert client.post('/bulk', json=[entry('B1'), entry('B2'), entry('B3')]).status_code == 400
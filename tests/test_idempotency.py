@@ -0,0 +1,83 @@
+import json
+import os
+import time
+
+import main
+from conftest import count_calls, entry, new_tickets, post_parallel
+
+SIGNAL = {'symbol': 'eurusd', 'side': 'B', 'price': '1.1', 'tp': '1.2', 'sl': '1.0'}
+
+
+def slow_writes(monkeypatch, store, seconds):
+    original = store.batch_update
+
+    def slow(*args, **kwargs):
+        time.sleep(seconds)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(store, 'batch_update', slow)
+
+
+def test_retry_is_replayed(client, store):
+    first = client.post('/', json=entry('I1'))
+    second = client.post('/', json=entry('I1'))
+
+    assert second.status_code == first.status_code == 200
+    assert second.get_json() == first.get_json()
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert new_tickets(store) == ['I1']
+
+
+def test_idempotency_key_header_wins_over_payload(client, store):
+    headers = {'Idempotency-Key': 'tv-1'}
+    first = client.post('/tradingview', json=SIGNAL, headers=headers)
+    second = client.post('/tradingview', json=dict(SIGNAL, price='1.3'), headers=headers)
+
+    assert second.get_json() == first.get_json()
+    assert len(new_tickets(store)) == 1
+
+
+def test_server_error_releases_the_key(client, store, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(main, 'get_store', lambda: None)
+        assert client.post('/', json=entry('I2')).status_code == 500
+
+    assert client.post('/', json=entry('I2')).status_code == 200
+    assert new_tickets(store) == ['I2']
+
+
+def test_retry_after_wait_does_not_run_twice(store, monkeypatch):
+    """Dauert die erste Verarbeitung länger als IDEMPOTENCY_WAIT, bekommt die Wiederholung 409 statt einer zweiten Zeile."""
+    monkeypatch.setattr(main, 'IDEMPOTENCY_WAIT', 0.1)
+    slow_writes(monkeypatch, store, 0.5)
+    writes = count_calls(monkeypatch, store, 'batch_update')
+
+    responses = post_parallel('/tradingview', [SIGNAL, SIGNAL])
+
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    assert len(writes) == 1
+    assert len(new_tickets(store)) == 1
+
+
+def test_shared_marker_of_running_worker_stays_pending(store, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(main, 'IDEMPOTENCY_WAIT', 0.1)
+
+    assert main.claim_shared_idempotency_key('k') is None
+    path = main.idempotency_file('k')
+    assert json.load(open(path))['pid'] == os.getpid()
+    time.sleep(0.2)
+    assert main.claim_shared_idempotency_key('k') == 'pending'
+
+    # Worker während der Verarbeitung gestorben: Schlüssel wird übernommen
+    with open(path, 'w') as f:
+        json.dump({'expires': time.time() + main.IDEMPOTENCY_PENDING_TTL, 'pid': dead_pid()}, f)
+    assert main.claim_shared_idempotency_key('k') is None
+
+
+def dead_pid():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
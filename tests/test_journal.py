@@ -0,0 +1,100 @@
+import pytest
+
+import main
+from conftest import entry, new_tickets
+
+
+@pytest.fixture
+def journal(store, monkeypatch):
+    """Journal-Modus; den Applier-Thread ersetzen die Tests durch apply_journal()."""
+    monkeypatch.setattr(main, 'INGEST_MODE', 'journal')
+    monkeypatch.setattr(main, 'start_journal_applier', lambda: None)
+    return main.JOURNAL_PATH
+
+
+def apply_journal(store, limit=main.JOURNAL_BATCH_SIZE, save_offset=True):
+    """Ein Durchlauf von journal_applier_loop()."""
+    entries = main.read_journal_entries(main.read_journal_offset(), limit)
+    if entries:
+        main.apply_journal_entries(store, entries)
+        if save_offset:
+            main.write_journal_offset(entries[-1][1])
+    return entries
+
+
+def restart():
+    """Neuer Prozess: nur Journal-Datei und Speicher bleiben erhalten."""
+    main.journal_state['pending'].clear()
+    main.sheet_cache.update(data=None, indexes=None, timestamp=0, local_writes=[])
+
+
+def test_journal_acknowledges_without_writing(journal, store, client):
+    writes = []
+    store.batch_update = lambda data, **kwargs: writes.append(data)
+
+    response = client.post('/', json=entry('J1'))
+    assert response.status_code == 202
+    assert response.get_json() == {'ok': True, 'accepted': True, 'ticket': 'J1'}
+    assert client.post('/', json=entry('J1', price='1.2')).status_code == 400
+    assert writes == []
+    assert main.journal_backlog() == 1
+
+
+def test_journal_resumes_after_restart(journal, store, client):
+    for ticket in ('J1', 'J2', 'J3'):
+        assert client.post('/', json=entry(ticket)).status_code == 202
+    assert [e['ticket'] for e, _ in apply_journal(store, limit=2)] == ['J1', 'J2']
+
+    restart()
+    assert [e['ticket'] for e, _ in apply_journal(store)] == ['J3']
+    assert new_tickets(store) == ['J1', 'J2', 'J3']
+    assert main.journal_backlog() == 0
+
+
+def test_journal_replay_skips_tickets_already_written(journal, store, client):
+    for ticket in ('J1', 'J2'):
+        client.post('/', json=entry(ticket))
+    apply_journal(store, save_offset=False)  # Absturz vor dem Sichern der Position
+
+    restart()
+    apply_journal(store)
+    assert new_tickets(store) == ['J1', 'J2']
+
+
+def test_journal_skips_torn_entries(journal, store, client):
+    client.post('/', json=entry('J1'))
+    with open(journal, 'ab') as f:
+        f.write(b'{"t": 1, "rou')  # Absturz mitten im Schreiben
+    client.post('/', json=entry('J2'))
+
+    restart()
+    assert [e['ticket'] for e, _ in apply_journal(store)] == ['J1', 'J2']
+    assert new_tickets(store) == ['J1', 'J2']
+
+
+def test_journal_offset_past_the_end_restarts_from_zero(journal, store, client):
+    open(journal, 'wb').close()
+    main.write_journal_offset(500)  # Absturz zwischen Kürzen und Sichern (ältere Version)
+
+    client.post('/', json=entry('J1'))
+    restart()
+    assert [e['ticket'] for e, _ in apply_journal(store)] == ['J1']
+
+
+@pytest.mark.parametrize('crash_in', ['truncate', 'write_journal_offset'])
+def test_crash_during_compaction_loses_nothing(journal, store, client, monkeypatch, crash_in):
+    client.post('/', json=entry('J1'))
+    offset = apply_journal(store)[-1][1]
+
+    def crash(*args):
+        raise OSError('Absturz')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(main.os if crash_in == 'truncate' else main, crash_in, crash)
+        with pytest.raises(OSError):
+            main.compact_journal(offset)
+
+    client.post('/', json=entry('J2'))
+    restart()
+    apply_journal(store)
+    assert new_tickets(store) == ['J1', 'J2']
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+import main
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeApiError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f'HTTP {status_code}')
+        self.response = FakeResponse(status_code, headers)
+
+
+class FlakyWorksheet:
+    """Wirft die vorgegebenen Fehler der Reihe nach, danach klappt der Aufruf."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def get_all_values(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [['ok']]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', '')
+    monkeypatch.setattr(main.time, 'sleep', calls.append)
+    monkeypatch.setattr(main, 'sheets_read_bucket', main.TokenBucket('read', 0, 1))
+    return calls
+
+
+def test_retries_with_retry_after(sleeps):
+    ws = FlakyWorksheet(FakeApiError(503), FakeApiError(429, {'Retry-After': '7'}))
+
+    assert main.QuotaAwareWorksheet(ws).get_all_values() == [['ok']]
+    assert ws.calls == 3
+    assert sleeps[0] <= 1 and sleeps[1] == 7
+
+
+def test_retry_after_is_capped(sleeps):
+    ws = FlakyWorksheet(FakeApiError(429, {'Retry-After': '3600'}))
+
+    main.QuotaAwareWorksheet(ws).get_all_values()
+    assert sleeps == [main.SHEETS_MAX_BACKOFF]
+
+
+def test_client_errors_are_not_retried(sleeps):
+    ws = FlakyWorksheet(FakeApiError(400))
+
+    with pytest.raises(FakeApiError):
+        main.QuotaAwareWorksheet(ws).get_all_values()
+    assert ws.calls == 1 and sleeps == []
+
+
+def test_gives_up_after_max_retries(sleeps):
+    ws = FlakyWorksheet(*[FakeApiError(500)] * (main.SHEETS_MAX_RETRIES + 1))
+
+    with pytest.raises(FakeApiError):
+        main.QuotaAwareWorksheet(ws).get_all_values()
+    assert ws.calls == main.SHEETS_MAX_RETRIES + 1
+
+
+def test_429_pauses_the_bucket(monkeypatch):
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', '')
+    bucket = main.TokenBucket('write', 60, 10)
+    bucket.pause(5)
+
+    assert bucket.take_token() == pytest.approx(5, abs=0.1)
+
+
+def test_waiters_are_served_by_priority(monkeypatch):
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', '')
+    bucket = main.TokenBucket('write', 600, 1)  # Ein Token alle 0,1 s
+    bucket.acquire()
+    order = []
+
+    def take(priority):
+        bucket.acquire(priority)
+        order.append(priority)
+
+    threads = []
+    for priority in (main.WRITE_PRIORITY_BOOKKEEPING, main.WRITE_PRIORITY_SIGNAL, main.WRITE_PRIORITY_CRITICAL):
+        threads.append(threading.Thread(target=take, args=(priority,)))
+        threads[-1].start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    assert order == [main.WRITE_PRIORITY_CRITICAL, main.WRITE_PRIORITY_SIGNAL, main.WRITE_PRIORITY_BOOKKEEPING]
+
+
+def test_workers_share_the_bucket(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', str(tmp_path))
+    worker_1 = main.TokenBucket('read', 60, 2)
+    worker_2 = main.TokenBucket('read', 60, 2)
+
+    assert worker_1.take_token() == 0 and worker_2.take_token() == 0
+    assert worker_1.take_token() > 0 and worker_2.take_token() > 0
+
+
+def test_without_shared_dir_each_worker_gets_its_share(monkeypatch):
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', '')
+    monkeypatch.setenv('GUNICORN_WORKERS', '4')
+    bucket = main.TokenBucket('read', 60, 1)
+
+    assert bucket.take_token() == 0
+    assert bucket.take_token() == pytest.approx(4, abs=0.1)
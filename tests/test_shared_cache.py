@@ -0,0 +1,65 @@
+import json
+import os
+import time
+
+import pytest
+
+import main
+from conftest import trade_row
+
+
+@pytest.fixture
+def follower(store, monkeypatch, tmp_path):
+    """Follower-Worker mit geteiltem Cache: übernimmt snapshot.json und writes.log eines anderen Workers."""
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', str(tmp_path))
+    publish(store.get_all_values())
+    open(tmp_path / 'writes.log', 'w').close()
+    assert main.load_shared_snapshot()
+    main.sync_shared_writes()
+    return tmp_path
+
+
+def publish(data):
+    """snapshot.json wie vom Refresher-Worker (mit eindeutiger mtime)."""
+    path = main.shared_path('snapshot.json')
+    main.write_json_atomic(path, {"timestamp": time.time(), "data": data, "archive_offset": 0})
+    mtime = time.time_ns() + 1000
+    os.utime(path, ns=(mtime, mtime))
+
+
+def other_worker_log(*entries):
+    with open(main.shared_path('writes.log'), 'a') as f:
+        for entry in entries:
+            f.write(json.dumps(dict(entry, pid=0)) + '\n')
+
+
+def test_compacted_log_loads_the_newer_snapshot_first(follower, store):
+    # Anderer Worker schreibt Zeile 12, der Refresher veröffentlicht sie im Snapshot und kompaktiert
+    # das Log, bevor der Follower den Eintrag gelesen hat
+    other_worker_log({"t": time.time(), "updates": [['A12:B12', [['x', 'T12']]]]})
+    publish(store.get_all_values() + [trade_row('T12')])
+    main.compact_shared_write_log(time.time())
+
+    assert main.reserve_rows(store) == [13]
+
+
+def test_delta_sync_ships_only_changed_rows(store, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'SHARED_CACHE_DIR', str(tmp_path))
+    main.shared_state["leader_fd"] = -1
+    assert main.load_sheet_snapshot(store)
+    snapshot_mtime = os.stat(tmp_path / 'snapshot.json').st_mtime_ns
+
+    store.batch_update([{'range': 'Y5', 'values': [['OPEN']]}, {'range': 'A12:B12', 'values': [['x', 'T12']]}])
+    assert main.load_sheet_delta(store)
+
+    assert os.stat(tmp_path / 'snapshot.json').st_mtime_ns == snapshot_mtime
+    entry = json.loads(open(tmp_path / 'writes.log').readlines()[-1])
+    assert sorted(entry["rows"]) == ['12', '5'] and entry["last_row"] == 12
+
+
+def test_follower_applies_delta_from_the_log(follower, store):
+    other_worker_log({"t": time.time(), "rows": {"12": trade_row('T12', status='OPEN')}, "last_row": 12})
+    main.sync_shared_writes()
+
+    assert main.find_ticket_row(store, 'T12') == 12
+    assert main.reserve_rows(store) == [13]
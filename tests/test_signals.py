@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def set_status_later(store, row, status='OK', delay=0.1):
+    """Setzt den Status einer Zeile nach delay Sekunden über batch_write() (wie ein Webhook)."""
+    def write():
+        time.sleep(delay)
+        main.batch_write(store, [(f'Y{row}', [[status]])])
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    return thread
+
+
+def set_symbol(store, row, symbol):
+    store.batch_update([{'range': f'D{row}', 'values': [[symbol]]}])
+
+
+def test_without_wait_answers_immediately(client):
+    assert client.get('/?broker=forex').get_json() == {'status': 'WAIT'}
+
+
+def test_long_poll_times_out_with_wait(client):
+    started = time.monotonic()
+
+    assert client.get('/?broker=forex&wait=0.2').get_json() == {'status': 'WAIT'}
+    assert time.monotonic() - started >= 0.2
+
+
+def test_long_poll_returns_as_soon_as_a_trade_is_ok(client, store):
+    client.get('/?broker=forex')
+    started = time.monotonic()
+    writer = set_status_later(store, 5)
+
+    trade = client.get('/?broker=forex&wait=5').get_json()
+    writer.join()
+
+    assert trade['status'] == 'OK' and trade['row'] == 5 and trade['symbol'] == 'eurusd'
+    assert time.monotonic() - started < 2
+
+
+def test_long_poll_ignores_other_brokers(client, store):
+    set_symbol(store, 5, 'btcusd')
+    client.get('/?broker=forex')
+    writer = set_status_later(store, 5)
+
+    assert client.get('/?broker=forex&wait=0.4').get_json() == {'status': 'WAIT'}
+    writer.join()
+    assert client.get('/?broker=crypto').get_json()['row'] == 5
+
+
+def test_invalid_wait(client):
+    assert client.get('/?wait=soon').status_code == 400
+
+
+def test_blocking_waiters_are_capped(client, monkeypatch):
+    monkeypatch.setattr(main, 'MAX_BLOCKING_WAITERS', 0)
+
+    started = time.monotonic()
+    assert client.get('/?wait=5').get_json() == {'status': 'WAIT'}  # Kein Long-Poll mehr, sofort WAIT
+    assert time.monotonic() - started < 1
+    assert client.get('/events').status_code == 503
+
+
+@pytest.fixture
+def events(client, store, monkeypatch):
+    """Offener SSE-Stream für Forex (Zeile 4 ist bereits 'OK'); liefert die nächste Nachricht."""
+    monkeypatch.setattr(main, 'SSE_KEEPALIVE_INTERVAL', 0.2)
+    store.batch_update([{'range': 'Y4', 'values': [['OK']]}])
+    response = client.get('/events?broker=forex')
+    assert response.mimetype == 'text/event-stream'
+    stream = iter(response.response)
+    yield lambda: next(stream).decode('utf-8')
+    response.close()
+    assert main.signal_state["waiters"] == 0
+
+
+def event_data(message):
+    event, data = message.strip().split('\n')
+    assert event == 'event: signal'
+    return json.loads(data[len('data: '):])
+
+
+def test_sse_sends_pending_and_new_trades(events, store):
+    assert event_data(events())['row'] == 4
+    assert main.signal_state["waiters"] == 1
+
+    writer = set_status_later(store, 6)
+    assert event_data(events())['row'] == 6
+    writer.join()
+
+
+def test_sse_keepalive(events):
+    events()
+
+    assert events() == ': keepalive\n\n'
+
+
+def test_sse_resends_a_row_that_became_ok_again(events, store):
+    events()
+    main.batch_write(store, [('Y4', [['EXECUTED']])])
+    assert events() == events() == ': keepalive\n\n'  # Der Stream hat gesehen, dass Zeile 4 nicht mehr 'OK' ist
+
+    main.batch_write(store, [('Y4', [['OK']])])
+    assert event_data(events())['row'] == 4
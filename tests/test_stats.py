@@ -0,0 +1,76 @@
+import math
+from datetime import datetime
+
+import pytest
+
+from conftest import entry, trade_row
+
+
+def row_update(row_number, cells):
+    return {'range': f'A{row_number}:Z{row_number}', 'values': [cells]}
+
+
+@pytest.fixture
+def trades(store):
+    """Zu den 10 EURUSD-Gewinnen (je +1,5) ein BTC-Verlust, ein offener Trade und ein Trade von heute."""
+    loss = trade_row(2001, symbol='btcusd')
+    loss[13], loss[25] = '2026.02.01 12:00:00', '-2,0'
+    open_trade = trade_row(2002, status='EXECUTED')
+    open_trade[0] = '2026.03.01 09:00:00'
+    today = trade_row(2003, symbol='gbpusd')
+    today[0] = datetime.now().strftime('%Y.%m.%d %H:%M:%S')
+    store.batch_update([row_update(12, loss), row_update(13, open_trade), row_update(14, today)])
+    return store
+
+
+def test_totals(trades, client):
+    stats = client.get('/stats').get_json()
+
+    totals = stats['totals']
+    assert totals['closed_trades'] == 12 and totals['wins'] == 11 and totals['losses'] == 1
+    assert totals['profit'] == 14.5 and totals['gross_profit'] == 16.5 and totals['gross_loss'] == 2.0
+    assert totals['profit_factor'] == 8.25 and totals['win_rate'] == round(11 / 12, 4)
+    assert totals['open_trades'] == 1 and totals['open_lots_long'] == 0.1
+    assert sorted(stats['by_symbol']) == ['btcusd', 'eurusd', 'gbpusd']
+    assert stats['by_broker']['crypto']['profit'] == -2.0
+
+
+def test_gross_loss_without_losses_is_positive_zero(client):
+    totals = client.get('/stats').get_json()['totals']
+
+    assert math.copysign(1, totals['gross_loss']) == 1.0
+    assert totals['profit_factor'] is None
+
+
+@pytest.mark.parametrize('query, closed, open_trades', [
+    ('symbol=btcusd', 1, 0),
+    ('symbol=EURUSD', 10, 1),
+    ('broker=crypto', 1, 0),
+    ('broker=forex', 11, 1),
+    ('from=2026-02-01', 2, 1),
+    ('to=2026-01-31', 10, 0),
+    ('from=2026-01-15&to=2026-02-15', 1, 0),
+    ('days=1', 1, 0),
+])
+def test_filters(trades, client, query, closed, open_trades):
+    totals = client.get(f'/stats?{query}').get_json()['totals']
+
+    assert (totals['closed_trades'], totals['open_trades']) == (closed, open_trades)
+
+
+@pytest.mark.parametrize('query', ['broker=stocks', 'from=2026-13-01', 'days=0', 'days=x', 'days=2&from=2026-01-01'])
+def test_invalid_filters(client, query):
+    assert client.get(f'/stats?{query}').status_code == 400
+
+
+def test_follows_write_through(client):
+    client.get('/stats')
+
+    client.post('/', json=entry('S1', side='B', lots='0.2'))
+    totals = client.get('/stats').get_json()['totals']
+    assert totals['open_trades'] == 1 and totals['open_lots_long'] == 0.2
+
+    client.put('/', json={'ticket': 'S1', 'exit_time': '2026.03.02 10:00:00', 'exit_price': '1.05', 'profit': '-3.5'})
+    totals = client.get('/stats').get_json()['totals']
+    assert totals['open_trades'] == 0 and totals['closed_trades'] == 11
+    assert totals['losses'] == 1 and totals['gross_loss'] == 3.5 and totals['profit'] == 11.5
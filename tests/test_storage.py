@@ -0,0 +1,64 @@
+import pytest
+
+import main
+from conftest import HEADER, entry, trade_row
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    """Beide lokalen Speicher müssen sich wie ein Worksheet verhalten."""
+    if request.param == 'memory':
+        return main.MemoryStore([HEADER])
+    store = main.SQLiteStore(str(tmp_path / 'trades.db'))
+    store.import_rows([HEADER])
+    return store
+
+
+def test_batch_update_and_get_all_values(backend):
+    backend.batch_update([{'range': 'A3:D3', 'values': [['t', '7', '', 'eurusd']]},
+                          {'range': 'Y3', 'values': [['OK']]}])
+
+    rows = backend.get_all_values()
+    assert len(rows) == 3
+    assert rows[1] == [''] * len(rows[1])  # Lücke wird wie im Sheet aufgefüllt
+    assert rows[2][:4] == ['t', '7', '', 'eurusd'] and rows[2][24] == 'OK'
+    assert len({len(row) for row in rows}) == 1
+
+
+def test_batch_get_ranges(backend):
+    backend.batch_update([{'range': 'A2:B3', 'values': [['a', '1'], ['b', '2']]}])
+
+    assert backend.batch_get(['B2:B3', 'A5:B6']) == [[['1'], ['2']], []]
+
+
+def test_overwriting_with_empty_cells_clears_the_row(backend):
+    backend.batch_update([{'range': 'A2:B2', 'values': [['a', '1']]}])
+    backend.batch_update([{'range': 'A2:B2', 'values': [['', '']]}])
+
+    assert all(cell == '' for row in backend.get_all_values()[1:] for cell in row)
+
+
+def test_sqlite_queues_writes_for_the_mirror(tmp_path):
+    store = main.SQLiteStore(str(tmp_path / 'trades.db'), mirror=True)
+    store.batch_update([{'range': 'B2', 'values': [['1']]}])
+    store.batch_update([{'range': 'B3', 'values': [['2']]}])
+    store.batch_update([{'range': 'Y2', 'values': [['OK']]}], mirror=False)  # Aus dem Sheet übernommen
+
+    assert store.mirror_backlog() == 2
+    batch = store.next_mirror_batch(10)
+    assert [data for _, data in batch] == [[{'range': 'B2', 'values': [['1']]}], [{'range': 'B3', 'values': [['2']]}]]
+    store.ack_mirror_batch(batch[0][0])
+    assert store.mirror_backlog() == 1
+
+
+def test_handlers_run_on_sqlite(store, monkeypatch, tmp_path):
+    path = str(tmp_path / 'trades.db')
+    sqlite_store = main.SQLiteStore(path)
+    sqlite_store.import_rows([HEADER, trade_row(1001)])
+    monkeypatch.setattr(main, 'STORAGE_BACKEND', 'sqlite')
+    monkeypatch.setattr(main, 'store_cache', sqlite_store)
+    client = main.app.test_client()
+
+    assert client.post('/', json=entry('Q1')).get_json() == {'ok': True, 'row': 3}
+    assert client.get('/?action=check_ticket&ticket=Q1').get_json() == {'found': 'true', 'row': 3}
+    assert main.SQLiteStore(path).get_all_values()[2][1] == 'Q1'  # Nach einem Neustart noch da
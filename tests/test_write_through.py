@@ -0,0 +1,32 @@
+import time
+
+import main
+from conftest import count_calls, entry
+
+
+def test_writes_are_visible_without_reloading(store, client, monkeypatch):
+    client.get('/?action=check_ticket&ticket=1001')
+    reads = count_calls(monkeypatch, store, 'get_all_values')
+
+    row = client.post('/', json=entry('W1')).get_json()['row']
+    assert client.get('/?action=check_ticket&ticket=W1').get_json() == {'found': 'true', 'row': row}
+
+    client.post('/', json={'action': 'mark_executed', 'row': row, 'ticket': 'W1-EXE'})
+    assert client.get('/?action=get_last_executed&symbol=eurusd').get_json() == {'row': row}
+    assert client.get('/?action=check_ticket&ticket=W1-EXE').get_json()['row'] == row
+    assert reads == []
+
+
+def test_stale_snapshot_replays_local_writes(store, client):
+    client.get('/?action=check_ticket&ticket=1001')
+    stale_rows, stale_time = store.get_all_values(), time.time()
+    row = client.post('/', json=entry('R1')).get_json()['row']
+
+    # Snapshot wurde vor dem Schreiben gestartet und kennt R1 noch nicht
+    main.install_snapshot(stale_rows, stale_time)
+    assert client.get('/?action=check_ticket&ticket=R1').get_json() == {'found': 'true', 'row': row}
+
+    # Ein neuerer Snapshot enthält R1 selbst - die eigenen Schreibzugriffe werden verworfen
+    main.install_snapshot(store.get_all_values(), time.time())
+    assert main.sheet_cache['local_writes'] == []
+    assert client.get('/?action=check_ticket&ticket=R1').get_json() == {'found': 'true', 'row': row}